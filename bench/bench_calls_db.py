@@ -0,0 +1,194 @@
+## Call accounting DB microbenchmark: round trips and latency per participant join/leave and finalize
+## Needs a MariaDB with install/schema.sql loaded (MYSQL_* env, as for the server).
+## Creates throwaway users and a call with tg_user_id >= 8900000000000 and deletes them at the end.
+## "legacy" = lookup + SELECT + UPDATE/INSERT (or per-row aggregation in Python for finalize)
+##            + event on a second pooled connection, i.e. the code before the set-based rewrite
+## "current" = server.db.calls (one multi-statement transaction per call).
+## Usage: python -m bench.bench_calls_db [--users 20] [--cycles 10]
+
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime
+
+from aiomysql import connection as mysql_connection
+from aiomysql import pool as mysql_pool
+
+from server.db import get_pool
+from server.db import calls as callsdb
+
+TG_BASE = 8900000000000
+
+
+class RoundTrips:
+    """
+    Counts client->server commands (each one waits for a reply) and pool acquires.
+    """
+
+    def __init__(self):
+        self.commands = 0
+        self.acquires = 0
+
+    def install(self):
+        counter = self
+        execute_command = mysql_connection.Connection._execute_command
+        acquire = mysql_pool.Pool.acquire
+
+        async def _execute_command(conn, command, sql):
+            counter.commands += 1
+            return await execute_command(conn, command, sql)
+
+        def _acquire(pool):
+            counter.acquires += 1
+            return acquire(pool)
+
+        mysql_connection.Connection._execute_command = _execute_command
+        mysql_pool.Pool.acquire = _acquire
+
+    def reset(self):
+        self.commands = 0
+        self.acquires = 0
+
+
+## Pre-upsert implementation kept here as the baseline
+
+async def legacy_join(call_id: int, tg: str, name: str, avatar: str):
+    user_id = await callsdb.get_user_id_by_tg(tg)
+    if not user_id:
+        return
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT id, joins_count FROM call_participants WHERE call_id=%s AND user_id=%s", (call_id, user_id))
+            row = await cur.fetchone()
+            if row:
+                await cur.execute("UPDATE call_participants SET joins_count=%s, last_left_at=NULL WHERE id=%s", (int(row[1]) + 1, int(row[0])))
+            else:
+                await cur.execute(
+                    "INSERT INTO call_participants (call_id, user_id, first_joined_at, joins_count, display_name, avatar_url) "
+                    "VALUES (%s, %s, %s, %s, %s, %s)",
+                    (call_id, user_id, datetime.utcnow(), 1, name, avatar))
+    await _legacy_event(call_id, user_id, "peer_join", {"name": name, "avatar": avatar})
+
+
+async def legacy_leave(call_id: int, tg: str):
+    user_id = await callsdb.get_user_id_by_tg(tg)
+    if not user_id:
+        return
+    now = datetime.utcnow()
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "SELECT id, first_joined_at, last_left_at, total_duration_sec FROM call_participants WHERE call_id=%s AND user_id=%s",
+                (call_id, user_id))
+            row = await cur.fetchone()
+            if row and not row[2]:
+                total = int(row[3] or 0) + max(0, int((now - row[1]).total_seconds()))
+                await cur.execute("UPDATE call_participants SET last_left_at=%s, total_duration_sec=%s WHERE id=%s", (now, total, int(row[0])))
+            elif row:
+                await cur.execute("UPDATE call_participants SET last_left_at=%s WHERE id=%s", (now, int(row[0])))
+    await _legacy_event(call_id, user_id, "peer_leave", {})
+
+
+async def legacy_finalize(call_id: int, ended_reason: str = "owner_leave"):
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT COUNT(DISTINCT user_id) FROM call_participants WHERE call_id=%s", (call_id,))
+            n = int((await cur.fetchone())[0])
+            await cur.execute("SELECT started_at FROM call_logs WHERE id=%s", (call_id,))
+            started_at = (await cur.fetchone())[0]
+            await cur.execute("SELECT user_id FROM call_participants WHERE call_id=%s", (call_id,))
+            uids = [int(r[0]) for r in await cur.fetchall()]
+            status = "completed" if n else "solo"
+            await cur.execute(
+                "UPDATE call_logs SET ended_at=NOW(), duration_sec=TIMESTAMPDIFF(SECOND, %s, NOW()), status=%s, "
+                "participant_count=%s, participants_json=%s, "
+                "metadata=JSON_SET(COALESCE(metadata, '{}'), '$.ended_reason', %s) WHERE id=%s",
+                (started_at, status, n, json.dumps(uids), ended_reason, call_id))
+    await _legacy_event(call_id, None, "call_status_change", {"to": status})
+
+
+async def _legacy_event(call_id, user_id, event_type, payload):
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "INSERT INTO call_events (call_id, user_id, event_type, payload, created_at) VALUES (%s, %s, %s, %s, NOW())",
+                (call_id, user_id, event_type, json.dumps(payload) if payload else None))
+
+
+async def _setup(users: int, label: str):
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            for i in range(users + 1):
+                await cur.execute(
+                    "INSERT IGNORE INTO users (tg_user_id, username, first_name) VALUES (%s, %s, %s)",
+                    (TG_BASE + i, f"bench{i}", "Bench"))
+    call_id = await callsdb.create_call_if_absent(f"bench-{label}-{time.time_ns()}", str(TG_BASE))
+    if not call_id:
+        raise RuntimeError("cannot create bench call")
+    return call_id
+
+
+async def _cleanup(call_ids):
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            for call_id in call_ids:
+                await cur.execute("DELETE FROM call_logs WHERE id=%s", (call_id,))
+            await cur.execute("DELETE FROM users WHERE tg_user_id >= %s AND tg_user_id < %s", (TG_BASE, TG_BASE + 1000000))
+
+
+async def _run(args):
+    rt = RoundTrips()
+    rt.install()
+    impls = (
+        ("legacy", legacy_join, legacy_leave, legacy_finalize),
+        ("current", callsdb.participant_join, callsdb.participant_leave, callsdb.finalize_call),
+    )
+    call_ids = []
+    try:
+        print(f"{'impl':>8} {'op':>8} {'ops':>6} {'RT/op':>7} {'acq/op':>7} {'ms/op':>8}")
+        for label, join, leave, finalize in impls:
+            call_id = await _setup(args.users, label)
+            call_ids.append(call_id)
+            tgs = [str(TG_BASE + 1 + i) for i in range(args.users)]
+            totals = {"join": [0, 0, 0.0, 0], "leave": [0, 0, 0.0, 0]}
+            for _ in range(args.cycles):
+                for op in ("join", "leave"):
+                    rt.reset()
+                    t0 = time.perf_counter()
+                    for tg in tgs:
+                        if op == "join":
+                            await join(call_id, tg, "Bench", "")
+                        else:
+                            await leave(call_id, tg)
+                    t = totals[op]
+                    t[0] += rt.commands
+                    t[1] += rt.acquires
+                    t[2] += time.perf_counter() - t0
+                    t[3] += len(tgs)
+            rt.reset()
+            t0 = time.perf_counter()
+            await finalize(call_id)
+            totals["finalize"] = [rt.commands, rt.acquires, time.perf_counter() - t0, 1]
+            for op, (cmds, acq, dt, n) in totals.items():
+                print(f"{label:>8} {op:>8} {n:>6} {cmds / n:>7.2f} {acq / n:>7.2f} {dt / n * 1000:>8.2f}")
+    finally:
+        await _cleanup(call_ids)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=20, help="participants per call")
+    ap.add_argument("--cycles", type=int, default=10, help="join/leave rounds per participant")
+    args = ap.parse_args()
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+## Signaling codec microbenchmark: CPU cost per frame before/after serialize-once
+## "before" = a dict built and json-encoded per recipient (send_json) + stdlib parse of inbound frames
+## "after"  = one encode per broadcast through server.utils.codec + codec parse
+## Usage: python -m bench.bench_codec [--recipients 1,4,16] [--iters 20000]
+
+import argparse
+import json
+import time
+
+from server.utils import codec
+
+SDP = "v=0\r\no=- 4611731400430051336 2 IN IP4 127.0.0.1\r\n" + "a=candidate:1 1 udp 2122260223 192.168.1.10 54400 typ host\r\n" * 40
+
+FRAMES = {
+    "ice": {"type": "ice", "from": "a1b2c3d4", "data": {
+        "candidate": "candidate:842163049 1 udp 1677729535 203.0.113.7 46154 typ srflx raddr 0.0.0.0 rport 0",
+        "sdpMid": "0", "sdpMLineIndex": 0, "usernameFragment": "X1yZ"}},
+    "offer": {"type": "offer", "from": "a1b2c3d4", "data": {"type": "offer", "sdp": SDP}},
+    "peer-info": {"type": "peer-info", "id": "a1b2c3d4", "name": "Алиса Example", "avatar": "/static/avatars/123456.jpg", "uid": "123456"},
+}
+
+
+def _stdlib_send_json(obj) -> str:
+    ## what starlette's WebSocket.send_json does per call
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+def _per_frame_us(fn, iters: int) -> float:
+    t0 = time.process_time()
+    for _ in range(iters):
+        fn()
+    return (time.process_time() - t0) / iters * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--recipients", default="1,4,16")
+    ap.add_argument("--iters", type=int, default=20000)
+    args = ap.parse_args()
+    counts = [int(x) for x in args.recipients.split(",") if x.strip()]
+
+    print(f"codec: {codec.CODEC}")
+    print(f"{'frame':>10} {'recips':>6} {'before us':>10} {'after us':>10} {'speedup':>8}")
+    for name, frame in FRAMES.items():
+        for n in counts:
+            def before():
+                for _ in range(n):
+                    _stdlib_send_json(dict(frame))
+
+            def after():
+                text = codec.dumps(frame)
+                for _ in range(n):
+                    text  ## same text queued for every recipient
+
+            b = _per_frame_us(before, args.iters)
+            a = _per_frame_us(after, args.iters)
+            print(f"{name:>10} {n:>6} {b:>10.2f} {a:>10.2f} {b / a if a else 0:>7.1f}x")
+
+    print()
+    print(f"{'inbound':>10} {'stdlib us':>10} {'codec us':>10}")
+    for name, frame in FRAMES.items():
+        raw = _stdlib_send_json(frame)
+        b = _per_frame_us(lambda: json.loads(raw), args.iters)
+        a = _per_frame_us(lambda: codec.loads(raw), args.iters)
+        print(f"{name:>10} {b:>10.2f} {a:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+## Signaling memory footprint: bytes per idle room and per connected peer
+## Rooms are registered the way RoomManager.join does it (shard entry + bus subscription);
+## peers are joined through RoomManager.join and get an Outbox with a running writer task,
+## i.e. everything a connection costs here except the ASGI/WebSocket objects themselves.
+## Usage: python -m bench.bench_memory [--rooms 10000,50000] [--peers 2]
+
+import argparse
+import asyncio
+import gc
+import tracemalloc
+
+from server.utils.outbox import Outbox
+from server.utils.rooms import Room, RoomManager
+
+
+def _traced() -> int:
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+
+async def _measure(rooms: int, peers: int, shards: int):
+    mgr = RoomManager(shards=shards)
+    await mgr.bus.start()
+    room_ids = [f"room-{i:08d}" for i in range(rooms)]
+
+    base = _traced()
+    for rid in room_ids:
+        mgr._shard(rid).rooms[rid] = Room()
+        await mgr.bus.subscribe(rid)
+    after_rooms = _traced()
+
+    outboxes = []
+    for rid in room_ids:
+        for _ in range(peers):
+            peer = await mgr.join(rid, None)
+            peer.outbox = Outbox(None, label=f"{rid}/{peer.id}")
+            peer.outbox.start()
+            outboxes.append(peer.outbox)
+    await asyncio.sleep(0)  ## let writer tasks reach their first wait
+    after_peers = _traced()
+
+    for ob in outboxes:
+        ob.close()
+    await mgr.close()
+    return (after_rooms - base) / rooms, (after_peers - after_rooms) / (rooms * peers)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rooms", default="10000,50000")
+    ap.add_argument("--peers", type=int, default=2, help="connected peers per room")
+    ap.add_argument("--shards", type=int, default=64)
+    args = ap.parse_args()
+
+    tracemalloc.start()
+    print(f"{'rooms':>8} {'peers':>8} {'B/room':>10} {'B/peer':>10} {'MiB total':>10}")
+    for n in [int(x) for x in args.rooms.split(",") if x.strip()]:
+        per_room, per_peer = asyncio.run(_measure(n, args.peers, args.shards))
+        total = (per_room * n + per_peer * n * args.peers) / (1024 * 1024)
+        print(f"{n:>8} {n * args.peers:>8} {per_room:>10.0f} {per_peer:>10.0f} {total:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+## RoomManager join/leave microbenchmark
+## Runs many concurrent rooms, each doing join/get_room/leave cycles, and reports
+## throughput per room count for the sharded manager and a single-lock baseline.
+## Usage: python -m bench.bench_rooms [--rooms 1,16,256,4096] [--peers 4] [--ops 200000]
+
+import argparse
+import asyncio
+import time
+
+from server.utils.rooms import RoomManager
+
+
+class GlobalLockRoomManager(RoomManager):
+    """
+    Baseline: one shard means one lock for every room (pre-sharding behaviour).
+    get_room also takes the lock, as it used to.
+    """
+
+    def __init__(self):
+        super().__init__(shards=1)
+
+    async def get_room(self, room_id: str):
+        shard = self._shard(room_id)
+        async with shard.lock:
+            return shard.rooms.get(room_id)
+
+
+async def _room_worker(mgr: RoomManager, room_id: str, peers: int, cycles: int) -> int:
+    ops = 0
+    for _ in range(cycles):
+        joined = []
+        for _ in range(peers):
+            joined.append(await mgr.join(room_id, None))
+            await mgr.get_room(room_id)
+            ops += 2
+        for p in joined:
+            await mgr.leave(room_id, p.id)
+            ops += 1
+        ## let other rooms interleave, as real sockets would
+        await asyncio.sleep(0)
+    return ops
+
+
+async def _run(mgr: RoomManager, rooms: int, peers: int, cycles: int):
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*[
+        _room_worker(mgr, f"room-{i}", peers, cycles) for i in range(rooms)
+    ])
+    dt = time.perf_counter() - t0
+    return sum(results), dt
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rooms", default="1,16,256,4096")
+    ap.add_argument("--peers", type=int, default=4)
+    ap.add_argument("--ops", type=int, default=200000, help="approximate total ops per run")
+    ap.add_argument("--shards", type=int, default=64)
+    args = ap.parse_args()
+
+    counts = [int(x) for x in args.rooms.split(",") if x.strip()]
+    print(f"{'rooms':>8} {'manager':>10} {'ops':>10} {'sec':>8} {'ops/s':>12}")
+    for n in counts:
+        ## keep total work constant so runs are comparable across room counts
+        cycles = max(1, args.ops // (n * args.peers * 3))
+        for label, factory in (("global", GlobalLockRoomManager), ("sharded", lambda: RoomManager(shards=args.shards))):
+            ops, dt = asyncio.run(_run(factory(), n, args.peers, cycles))
+            print(f"{n:>8} {label:>10} {ops:>10} {dt:>8.3f} {ops / dt:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+## User search benchmark: in-memory trigram index (bot/utils/userindex.py) vs. a full scan
+## Generates a synthetic user table (default 1M rows), builds the index and reports build time,
+## memory, and per-query latency against a Python scan doing what LIKE '%q%' does per row.
+## The scan stops at the first `limit` unranked hits like the old LIMIT 20 query did, so common
+## queries look cheap there; "no match" shows the cost of the full scan every miss pays.
+## --db additionally loads the same rows into a scratch table bench_users (MYSQL_* env) and times
+## the old LIKE query and the tg_user_id point lookup there; the table is dropped afterwards.
+## Usage: python -m bench.bench_user_search [--users 1000000] [--queries 200] [--db]
+
+import argparse
+import asyncio
+import gc
+import os
+import random
+import statistics
+import time
+
+from bot.utils.userindex import UserIndex, normalize
+
+FIRST = ["alex", "anna", "ivan", "maria", "john", "olga", "peter", "elena", "sergey", "kate",
+         "dmitry", "sofia", "mike", "irina", "nikolai", "daria", "pavel", "yulia", "artem", "vera"]
+LAST = ["ivanov", "smirnova", "petrov", "sokolova", "kuznetsov", "popova", "smith", "johnson",
+        "brown", "miller", "novak", "kowalski", "schmidt", "garcia", "rossi", "dubois"]
+TG_BASE = 100000000
+
+
+def _users(n: int, seed: int = 1):
+    rnd = random.Random(seed)
+    for i in range(n):
+        first = rnd.choice(FIRST).capitalize()
+        last = rnd.choice(LAST).capitalize() if rnd.random() < 0.8 else ""
+        username = f"{first.lower()}{rnd.randrange(10 ** rnd.randrange(1, 6))}" if rnd.random() < 0.7 else ""
+        yield (TG_BASE + i, username, first, last)
+
+
+def _queries(rows, count: int, seed: int = 2):
+    rnd = random.Random(seed)
+    named = [r for r in rows[:100000] if r[1]]
+    out = {"exact username": [], "username prefix": [], "2 chars": [], "substring": [], "no match": []}
+    for _ in range(count):
+        r = rnd.choice(named)
+        out["exact username"].append(r[1])
+        out["username prefix"].append(r[1][:max(3, len(r[1]) - 2)])
+        out["2 chars"].append(r[2][:2])
+        last = r[3] or r[2]
+        start = rnd.randrange(max(1, len(last) - 3))
+        out["substring"].append(last[start:start + 4])
+        out["no match"].append("zq" + r[1][:3])
+    return out
+
+
+def _scan(rows, q: str, limit: int = 20):
+    ## what the LIKE query did: first `limit` rows with q anywhere in any column
+    q = normalize(q)
+    found = []
+    for r in rows:
+        if q in r[1].lower() or q in r[2].lower() or q in r[3].lower() or q in str(r[0]):
+            found.append(r[0])
+            if len(found) >= limit:
+                break
+    return found
+
+
+def _rss_bytes() -> int:
+    ## Linux; 0 elsewhere
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def _timed(fn, queries):
+    times = []
+    for q in queries:
+        t0 = time.perf_counter()
+        fn(q)
+        times.append((time.perf_counter() - t0) * 1000)
+    times.sort()
+    return statistics.median(times), times[int(len(times) * 0.95) - 1]
+
+
+async def _db_bench(rows, queries, limit: int):
+    from server.db import get_pool, close_pool
+
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("DROP TABLE IF EXISTS bench_users")
+            await cur.execute("CREATE TABLE bench_users LIKE users")
+            for i in range(0, len(rows), 5000):
+                await cur.executemany(
+                    "INSERT INTO bench_users (tg_user_id, username, first_name, last_name) VALUES (%s, %s, %s, %s)",
+                    rows[i:i + 5000]
+                )
+            try:
+                for label, qs in (("LIKE '%q%'", queries["substring"][:20]), ("LIKE no match", queries["no match"][:20])):
+                    times = []
+                    for q in qs:
+                        like = f"%{q}%"
+                        t0 = time.perf_counter()
+                        await cur.execute(
+                            "SELECT tg_user_id FROM bench_users WHERE username LIKE %s OR first_name LIKE %s "
+                            "OR last_name LIKE %s OR CAST(tg_user_id AS CHAR) LIKE %s LIMIT %s",
+                            (like, like, like, like, limit)
+                        )
+                        await cur.fetchall()
+                        times.append((time.perf_counter() - t0) * 1000)
+                    print(f"db {label:<22} p50 {statistics.median(times):8.2f} ms  max {max(times):8.2f} ms")
+                times = []
+                for r in random.Random(3).sample(rows, 200):
+                    t0 = time.perf_counter()
+                    await cur.execute("SELECT tg_user_id FROM bench_users WHERE tg_user_id=%s", (r[0],))
+                    await cur.fetchall()
+                    times.append((time.perf_counter() - t0) * 1000)
+                print(f"db {'tg_user_id lookup':<22} p50 {statistics.median(times):8.2f} ms  max {max(times):8.2f} ms")
+            finally:
+                await cur.execute("DROP TABLE IF EXISTS bench_users")
+    await close_pool()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=1000000)
+    ap.add_argument("--queries", type=int, default=200, help="queries per class")
+    ap.add_argument("--limit", type=int, default=20)
+    ap.add_argument("--db", action="store_true", help="also time LIKE vs point lookup in MariaDB")
+    args = ap.parse_args()
+
+    rows = list(_users(args.users))
+    queries = _queries(rows, args.queries)
+
+    gc.collect()
+    base = _rss_bytes()
+    t0 = time.perf_counter()
+    index = UserIndex()
+    index.put_many(rows)
+    asyncio.run(index.sort())
+    build_s = time.perf_counter() - t0
+    gc.collect()
+    mem = _rss_bytes() - base
+    print(f"users {len(index)}  build {build_s:.1f} s  index RSS +{mem / 2 ** 20:.0f} MiB ({mem / len(index):.0f} B/user)")
+
+    print(f"{'query':<16} {'index p50':>10} {'p95':>8} {'scan p50':>10} {'p95':>8}   (ms)")
+    for label, qs in queries.items():
+        ip50, ip95 = _timed(lambda q: index.search(q, args.limit), qs)
+        ## the scan is slow by design; a few queries are enough
+        sp50, sp95 = _timed(lambda q: _scan(rows, q, args.limit), qs[:10])
+        print(f"{label:<16} {ip50:>10.3f} {ip95:>8.3f} {sp50:>10.2f} {sp95:>8.2f}")
+
+    if args.db:
+        asyncio.run(_db_bench(rows, queries, args.limit))
+
+
+if __name__ == "__main__":
+    main()
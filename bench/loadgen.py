@@ -0,0 +1,263 @@
+## Signaling load generator: N rooms x M simulated peers against /ws/{room_id}
+## Starts server.main:app in a child process on localhost with the DB layer replaced by
+## bench/memdb.py, then drives the real hello/offer/answer/ice/bye sequence and reports
+## join latency, relay latency (p50/p95/p99), relayed frames/s and server CPU/RSS.
+## Usage: python -m bench.loadgen [--rooms 100] [--peers 2] [--rounds 5] [--ice 4]
+##        python -m bench.loadgen --url ws://host:port --server-pid PID   (existing server, stats if PID given)
+## Server settings (WS_ICE_BATCH_MS, WS_OUTBOX_*, ...) are taken from the environment.
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from typing import Dict, List, Optional
+
+import websockets
+
+from server.utils import codec
+
+
+def _pct(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def _fmt_ms(values: List[float]) -> str:
+    return f"p50={_pct(values, 50):.2f} p95={_pct(values, 95):.2f} p99={_pct(values, 99):.2f} max={max(values or [0]):.2f} ms (n={len(values)})"
+
+
+## Server process stats from /proc (Linux)
+
+def _proc_cpu_s(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def _proc_rss_mb(pid: int) -> Dict[str, float]:
+    out = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    key, val = line.split(":", 1)
+                    out[key] = int(val.split()[0]) / 1024.0
+    except OSError:
+        pass
+    return out
+
+
+class Stats:
+    def __init__(self):
+        self.join_ms: List[float] = []
+        self.relay_ms: List[float] = []
+        self.relayed = 0
+        self.expected = 0
+        self.errors = 0
+        self.exchange_s = 0.0
+        self.all_relayed = asyncio.Event()
+
+    def relay(self, sent: float):
+        self.relay_ms.append((time.perf_counter() - sent) * 1000)
+        self.relayed += 1
+        if self.relayed >= self.expected:
+            self.all_relayed.set()
+
+
+class SimPeer:
+    """
+    One simulated browser. Answers offers, echoes pings and records the latency
+    of every relayed frame (each payload carries its perf_counter send time).
+    """
+
+    def __init__(self, url: str, name: str, uid: str, owner: bool, stats: Stats):
+        self.url = url
+        self.name = name
+        self.uid = uid
+        self.owner = owner
+        self.stats = stats
+        self.ws = None
+        self.roster: List[str] = []
+        self._reader: Optional[asyncio.Task] = None
+
+    async def join(self):
+        t0 = time.perf_counter()
+        self.ws = await websockets.connect(self.url, max_size=None)
+        while True:
+            msg = codec.loads(await self.ws.recv())
+            if msg.get("type") == "peers":
+                break
+        self.stats.join_ms.append((time.perf_counter() - t0) * 1000)
+        self.roster = [p["id"] for p in msg.get("peers") or []]
+        await self.ws.send(codec.dumps({"type": "hello", "name": self.name, "uid": self.uid, "avatar": "", "is_owner": self.owner}))
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        try:
+            async for raw in self.ws:
+                msg = codec.loads(raw)
+                t = msg.get("type")
+                if t == "offer":
+                    self.stats.relay(msg["data"]["sent"])
+                    await self.ws.send(codec.dumps({"type": "answer", "to": msg["from"], "data": {"sdp": "answer", "sent": time.perf_counter()}}))
+                elif t in ("answer", "ice"):
+                    self.stats.relay(msg["data"]["sent"])
+                elif t == "ice-batch":
+                    for cand in msg.get("data") or []:
+                        self.stats.relay(cand["sent"])
+                elif t == "ping":
+                    await self.ws.send(codec.dumps({"type": "pong", "ts": msg.get("ts")}))
+        except websockets.ConnectionClosed:
+            pass
+        except Exception as e:
+            self.stats.errors += 1
+            print(f"[LOADGEN] reader error {self.name}: {e}")
+
+    async def exchange(self, rounds: int, ice: int, sdp: str):
+        ## the newer peer offers to everyone in its roster, like the web client
+        for _ in range(rounds):
+            for to in self.roster:
+                await self.ws.send(codec.dumps({"type": "offer", "to": to, "data": {"sdp": sdp, "sent": time.perf_counter()}}))
+                for i in range(ice):
+                    await self.ws.send(codec.dumps({"type": "ice", "to": to, "data": {
+                        "candidate": f"candidate:{i} 1 udp 2122260223 192.0.2.{i % 250} 5{i:04d} typ host",
+                        "sdpMid": "0", "sdpMLineIndex": 0, "sent": time.perf_counter()}}))
+            await asyncio.sleep(0)
+
+    async def leave(self):
+        try:
+            await self.ws.send(codec.dumps({"type": "bye"}))
+            await self.ws.close()
+        except websockets.ConnectionClosed:
+            pass
+        if self._reader:
+            await self._reader
+
+
+async def _run(args, url: str) -> Stats:
+    stats = Stats()
+    sdp = "v=0\r\n" + "a=candidate:1 1 udp 2122260223 192.168.1.10 54400 typ host\r\n" * 40
+    rooms = [
+        [SimPeer(f"{url}/ws/load-{r}", f"peer-{r}-{i}", str(1000000 + r * 100 + i), i == 0, stats) for i in range(args.peers)]
+        for r in range(args.rooms)
+    ]
+    ## each peer offers (1 + ice) frames per older peer per round and gets one answer back
+    pairs = args.rooms * args.peers * (args.peers - 1) // 2
+    stats.expected = pairs * args.rounds * (args.ice + 2)
+    sem = asyncio.Semaphore(args.concurrency)
+
+    async def join_room(peers: List[SimPeer]):
+        for p in peers:
+            async with sem:
+                await p.join()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(join_room(peers) for peers in rooms))
+    join_s = time.perf_counter() - t0
+    print(f"joined {args.rooms * args.peers} peers in {join_s:.2f}s")
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(p.exchange(args.rounds, args.ice, sdp) for peers in rooms for p in peers))
+    try:
+        await asyncio.wait_for(stats.all_relayed.wait(), timeout=args.timeout)
+    except asyncio.TimeoutError:
+        print(f"timeout: {stats.relayed}/{stats.expected} relayed frames arrived")
+    stats.exchange_s = time.perf_counter() - t0
+
+    await asyncio.gather(*(p.leave() for peers in rooms for p in peers))
+    return stats
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _spawn_server(port: int, log: bool) -> subprocess.Popen:
+    out = None if log else subprocess.DEVNULL
+    proc = subprocess.Popen([sys.executable, "-m", "bench.loadgen", "--serve", "--port", str(port)], stdout=out, stderr=out)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("server process exited during startup (run with --server-log)")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1).read()
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("server did not come up within 30s")
+
+
+def _serve(port: int):
+    ## no MariaDB: the jobs that would use the real pool stay off (read when server.config is imported)
+    os.environ["ROLLUP_INTERVAL"] = "0"
+    os.environ["EVENTS_RETENTION_INTERVAL"] = "0"
+    from bench import memdb
+    import uvicorn
+
+    memdb.install()
+    from server.main import app
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rooms", type=int, default=100)
+    ap.add_argument("--peers", type=int, default=2, help="peers per room (first one is the owner)")
+    ap.add_argument("--rounds", type=int, default=5, help="offer/answer rounds per peer pair")
+    ap.add_argument("--ice", type=int, default=4, help="ICE candidates per offer")
+    ap.add_argument("--concurrency", type=int, default=200, help="max simultaneous connection attempts")
+    ap.add_argument("--timeout", type=float, default=60.0)
+    ap.add_argument("--url", default="", help="ws://host:port of a running server (default: spawn one)")
+    ap.add_argument("--server-pid", type=int, default=0)
+    ap.add_argument("--server-log", action="store_true", help="show the spawned server's output")
+    ap.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    ap.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.serve:
+        _serve(args.port)
+        return
+
+    proc = None
+    url = args.url.rstrip("/")
+    pid = args.server_pid
+    if not url:
+        port = _free_port()
+        proc = _spawn_server(port, args.server_log)
+        url, pid = f"ws://127.0.0.1:{port}", proc.pid
+
+    try:
+        cpu0 = _proc_cpu_s(pid) if pid else None
+        t0 = time.perf_counter()
+        stats = asyncio.run(_run(args, url))
+        wall = time.perf_counter() - t0
+        cpu1 = _proc_cpu_s(pid) if pid else None
+        mem = _proc_rss_mb(pid) if pid else {}
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait(10)
+
+    print(f"rooms={args.rooms} peers/room={args.peers} rounds={args.rounds} ice/offer={args.ice}")
+    print(f"join    {_fmt_ms(stats.join_ms)}")
+    print(f"relay   {_fmt_ms(stats.relay_ms)}")
+    print(f"frames  {stats.relayed} relayed in {stats.exchange_s:.2f}s = {stats.relayed / max(stats.exchange_s, 1e-9):.0f}/s, errors={stats.errors}")
+    if cpu0 is not None and cpu1 is not None:
+        print(f"server  cpu={cpu1 - cpu0:.2f}s over {wall:.2f}s run ({(cpu1 - cpu0) / wall * 100:.0f}% of one core) "
+              f"rss={mem.get('VmRSS', 0):.1f}MiB peak={mem.get('VmHWM', 0):.1f}MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+## In-memory stand-in for the call accounting DB layer (server/db/calls.py, server/db/recording.py,
+## the event sink's writes)
+## Used by benchmarks that run the real server without MariaDB: install() swaps the module
+## functions for dict-backed ones with the same signatures and rough semantics.
+
+import time
+from typing import Any, Dict, List, Optional
+
+
+class MemoryCallsDB:
+    def __init__(self):
+        self.calls: Dict[int, Dict[str, Any]] = {}
+        self.by_room: Dict[str, int] = {}
+        self.participants: Dict[tuple, Dict[str, Any]] = {}
+        self.events: List[tuple] = []
+        self.recordings: List[Dict[str, Any]] = []
+        self.queries = 0
+
+    async def get_user_id_by_tg(self, tg_user_id: str) -> Optional[int]:
+        self.queries += 1
+        return int(tg_user_id) if str(tg_user_id).isdigit() else None
+
+    async def create_call_if_absent(self, room_uid: str, owner_tg_uid: str) -> Optional[int]:
+        self.queries += 1
+        call_id = self.by_room.get(room_uid)
+        if call_id and self.calls[call_id]["status"] != "ended":
+            return call_id
+        call_id = len(self.calls) + 1
+        self.calls[call_id] = {"room_uid": room_uid, "owner": owner_tg_uid, "status": "created", "started_at": time.time()}
+        self.by_room[room_uid] = call_id
+        return call_id
+
+    async def mark_call_active(self, call_id: int) -> None:
+        self.queries += 1
+        call = self.calls.get(call_id)
+        if call and call["status"] == "created":
+            call["status"] = "active"
+
+    async def finalize_call(self, call_id: int, ended_reason: str = "owner_leave") -> None:
+        self.queries += 1
+        call = self.calls.get(call_id)
+        if call and call["status"] != "ended":
+            call.update(status="ended", ended_reason=ended_reason, ended_at=time.time())
+
+    async def participant_join(self, call_id: int, user_tg_uid: str, display_name: Optional[str], avatar_url: Optional[str]) -> None:
+        self.queries += 1
+        self.participants[(call_id, user_tg_uid)] = {"name": display_name, "avatar": avatar_url, "joined_at": time.time(), "left_at": None}
+
+    async def participant_leave(self, call_id: int, user_tg_uid: str, joined_at_hint=None) -> None:
+        self.queries += 1
+        p = self.participants.get((call_id, user_tg_uid))
+        if p:
+            p["left_at"] = time.time()
+
+    async def add_event(self, call_id: int, user_id: Optional[int], event_type: str, payload: Dict[str, Any]) -> None:
+        self.queries += 1
+        self.events.append((call_id, user_id, event_type, payload))
+
+    async def add_recording(self, call_id: int, file_name: str, started_ts: int, ended_ts: int, duration_sec, fmt: str, size_bytes, sent_to_bot: bool, base_name) -> None:
+        self.queries += 1
+        self.recordings.append({"call_id": call_id, "file_name": file_name, "fmt": fmt})
+
+    async def write_call_ops(self, ops) -> None:
+        if not ops:
+            return
+        for name, args in ops:
+            await getattr(self, name)(*args)
+        self.queries -= len(ops) - 1  ## one transaction
+
+    async def write_events(self, rows) -> None:
+        ## EventSink._write: (call_id, user_id, event_type, payload json, added) rows
+        self.queries += 1
+        self.events.extend((r[0], r[1], r[2], r[3]) for r in rows)
+
+    async def resolve_room_call(self, room_uid: str, owner_tg_uid: Optional[str] = None, rec_started_ts: Optional[int] = None):
+        self.queries += 1
+        call_id = self.by_room.get(room_uid)
+        if not call_id or (owner_tg_uid and self.calls[call_id]["owner"] != owner_tg_uid):
+            return None, None
+        return self.calls[call_id]["owner"], call_id
+
+    async def fallback_owner_uid(self, room_uid: str) -> Optional[str]:
+        self.queries += 1
+        call_id = self.by_room.get(room_uid)
+        return self.calls[call_id]["owner"] if call_id else None
+
+    async def resolve_call_id(self, room_uid: str, owner_tg_uid: str, rec_started_ts: int) -> Optional[int]:
+        self.queries += 1
+        return self.by_room.get(room_uid)
+
+
+def install() -> MemoryCallsDB:
+    """
+    Replace the DB-backed call functions with an in-memory instance.
+    Call before the server handles traffic (module attributes are looked up per call).
+    The background DB jobs (usage rollup, event retention) are not covered: switch them off
+    with ROLLUP_INTERVAL=0 and EVENTS_RETENTION_INTERVAL=0 before server.config is imported.
+    """
+    from server.db import calls, recording
+    from server.db.eventsink import event_sink
+
+    db = MemoryCallsDB()
+    for name in ("get_user_id_by_tg", "create_call_if_absent", "mark_call_active", "finalize_call",
+                 "participant_join", "participant_leave", "write_call_ops", "add_event", "add_recording"):
+        setattr(calls, name, getattr(db, name))
+    for name in ("resolve_room_call", "fallback_owner_uid", "resolve_call_id"):
+        setattr(recording, name, getattr(db, name))
+    event_sink._write = db.write_events
+    return db
@@ -7,8 +7,8 @@ BOT_TOKEN = os.environ.get("BOT_TOKEN")
 APP_BASE_URL = os.environ.get("APP_BASE_URL")
 BOT_RECORD_NOTIFY_URL = os.environ.get("BOT_RECORD_NOTIFY_URL")
 
-MYSQL_HOST = os.environ.get("MYSQL_HOST", "localhost")
-MYSQL_PORT = int(os.environ.get("MYSQL_PORT", 3306))
-MYSQL_DB = os.environ.get("MYSQL_DB", "tgringer")
-MYSQL_USER = os.environ.get("MYSQL_USER", "tgringer_user")
-MYSQL_PASSWORD = os.environ.get("MYSQL_PASSWORD", "")
+## MYSQL_* settings are read by the shared pool module (server/db/pool.py)
+
+## users.last_seen is written at most once per this many seconds per user (bot/db/lastseen.py);
+## keep it well below the 5 min "online" window of /find
+LAST_SEEN_INTERVAL = float(os.environ.get("LAST_SEEN_INTERVAL", "60"))
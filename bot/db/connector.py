@@ -1,24 +1,17 @@
-import aiomysql
-from bot.config import MYSQL_HOST, MYSQL_PORT, MYSQL_DB, MYSQL_USER, MYSQL_PASSWORD
+from server.db.pool import DBPool, pool_from_env
 
 
 class DBConnector:
-    pool = None
+    """
+    Bot side of the shared pool module (server/db/pool.py): same MYSQL_* settings,
+    MYSQL_POOL_MAX defaults to 10 here.
+    """
+    pool: DBPool = None
 
     @classmethod
     async def init_pool(cls):
         if cls.pool is None:
-            cls.pool = await aiomysql.create_pool(
-                host=MYSQL_HOST,
-                port=MYSQL_PORT,
-                user=MYSQL_USER,
-                password=MYSQL_PASSWORD,
-                db=MYSQL_DB,
-                autocommit=True,
-                minsize=1,
-                maxsize=10,
-                charset="utf8mb4"
-            )
+            cls.pool = await pool_from_env(default_max=10).start()
         return cls.pool
 
     @classmethod
@@ -27,3 +20,6 @@ class DBConnector:
             await cls.init_pool()
         return cls.pool
 
+    @classmethod
+    def stats(cls):
+        return cls.pool.stats() if cls.pool else None
@@ -0,0 +1,103 @@
+## Coalesced users.last_seen writes
+## Every update from a user touches last_seen in memory; a background task writes the latest value
+## of every touched user once per interval in one multi-row UPDATE, so a chatty user costs one
+## row write per interval instead of one per message.
+
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from bot.config import LAST_SEEN_INTERVAL
+from bot.db.connector import DBConnector
+
+_CHUNK = 500  ## users per UPDATE statement
+
+
+class LastSeenCoalescer:
+    """
+    touch() only records (tg_user_id -> utc now); flush() writes all pending values with
+    UPDATE users SET last_seen = CASE tg_user_id WHEN .. THEN .. END WHERE tg_user_id IN (..).
+    The flusher runs every interval seconds, so each user is written at most once per interval
+    and last_seen lags reality by at most that much. close() flushes what is left.
+    A failed flush keeps its values unless a newer touch replaced them.
+    """
+
+    def __init__(self, interval: float = 60.0):
+        self.interval = max(1.0, float(interval))
+        self._pending: Dict[int, datetime] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.touches = 0
+        self.written = 0
+        self.flushes = 0
+
+    def touch(self, tg_user_id: int, when: Optional[datetime] = None):
+        self._pending[int(tg_user_id)] = when or datetime.utcnow()
+        self.touches += 1
+
+    def discard(self, tg_user_id: int):
+        """
+        Drop a pending value that was just written by another statement (register_user).
+        """
+        self._pending.pop(int(tg_user_id), None)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"[LASTSEEN] final flush failed, {len(self._pending)} users not written: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"pending": len(self._pending), "touches": self.touches, "written": self.written, "flushes": self.flushes}
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"[LASTSEEN] flush failed, will retry: {e}")
+
+    async def flush(self) -> int:
+        if not self._pending:
+            return 0
+        batch: List[Tuple[int, datetime]] = list(self._pending.items())
+        self._pending = {}
+        try:
+            pool = await DBConnector.get_conn()
+            async with pool.acquire() as conn:
+                async with conn.cursor() as cur:
+                    for i in range(0, len(batch), _CHUNK):
+                        await cur.execute(*_update_sql(batch[i:i + _CHUNK]))
+        except BaseException:
+            ## put back what was not superseded by a newer touch meanwhile
+            for uid, ts in batch:
+                self._pending.setdefault(uid, ts)
+            raise
+        self.written += len(batch)
+        self.flushes += 1
+        return len(batch)
+
+
+def _update_sql(rows: List[Tuple[int, datetime]]) -> Tuple[str, list]:
+    cases = " ".join("WHEN %s THEN %s" for _ in rows)
+    marks = ",".join(["%s"] * len(rows))
+    args: list = []
+    for uid, ts in rows:
+        args += [uid, ts]
+    args += [uid for uid, _ in rows]
+    sql = f"UPDATE users SET last_seen=CASE tg_user_id {cases} END WHERE tg_user_id IN ({marks})"
+    return sql, args
+
+
+last_seen = LastSeenCoalescer(interval=LAST_SEEN_INTERVAL)
@@ -1,50 +1,153 @@
-import aiomysql
+import asyncio
+from datetime import datetime
+
 from bot.db.connector import DBConnector
+from bot.db.lastseen import last_seen
+from bot.utils.userindex import UserIndex
+from server.db.pool import TimedDictCursor
+
+_USER_COLUMNS = "tg_user_id, username, first_name, last_name, avatar_url, status, language_code, last_seen"
+
+## Search index over all users (bot/utils/userindex.py), filled by load_user_index() at startup
+## and kept current by register_user(); until it is loaded search_users() falls back to LIKE
+user_index = UserIndex()
+_index_task = None
 
 
 async def register_user(tg_user_id: int, username: str, first_name: str, last_name: str, language_code: str):
+    """
+    Insert the user or refresh profile fields and last_seen, in one statement (tg_user_id is UNIQUE).
+    """
+    now = datetime.utcnow()
     pool = await DBConnector.get_conn()
     async with pool.acquire() as conn:
         async with conn.cursor() as cur:
-            ## Check if user exists
             await cur.execute(
-                "SELECT id FROM users WHERE tg_user_id=%s",
-                (tg_user_id,)
+                """
+                INSERT INTO users
+                (tg_user_id, username, first_name, last_name, language_code, last_seen)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    username=VALUES(username),
+                    first_name=VALUES(first_name),
+                    last_name=VALUES(last_name),
+                    last_seen=VALUES(last_seen)
+                """,
+                (tg_user_id, username, first_name, last_name, language_code, now)
+            )
+    ## written just now; a pending coalesced value is not newer
+    last_seen.discard(tg_user_id)
+    user_index.put(tg_user_id, username, first_name, last_name)
+
+
+def start_user_index():
+    """
+    Load user_index in the background (bot startup).
+    """
+    global _index_task
+    if _index_task is None:
+        _index_task = asyncio.create_task(load_user_index())
+
+
+async def load_user_index(chunk: int = 10000):
+    """
+    Fill user_index from the users table in id order, one chunk per query so no
+    connection is held for the whole scan, then mark it ready.
+    On failure the index stays not ready and search keeps using LIKE.
+    """
+    pool = await DBConnector.get_conn()
+    last_id = 0
+    try:
+        while True:
+            async with pool.acquire() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(
+                        "SELECT id, tg_user_id, username, first_name, last_name FROM users "
+                        "WHERE id > %s AND deleted_at IS NULL ORDER BY id LIMIT %s",
+                        (last_id, chunk)
+                    )
+                    rows = await cur.fetchall()
+            user_index.put_many(r[1:] for r in rows)
+            if len(rows) < chunk:
+                break
+            last_id = int(rows[-1][0])
+            ## let updates in between chunks
+            await asyncio.sleep(0)
+    except Exception as e:
+        print(f"[USERS] search index load failed, using LIKE search: {e}")
+        return
+    await user_index.sort()
+    user_index.ready = True
+    print(f"[USERS] search index loaded: {len(user_index)} users")
+
+
+async def get_user_by_tg(tg_user_id: int):
+    """
+    One user row by Telegram id (UNIQUE index lookup), or None.
+    """
+    pool = await DBConnector.get_conn()
+    async with pool.acquire() as conn:
+        async with conn.cursor(TimedDictCursor) as cur:
+            await cur.execute(f"SELECT {_USER_COLUMNS} FROM users WHERE tg_user_id=%s", (int(tg_user_id),))
+            return await cur.fetchone()
+
+
+async def get_users_by_tg(tg_user_ids):
+    """
+    User rows for the given Telegram ids, in the given order (missing ids are skipped).
+    """
+    ids = [int(i) for i in tg_user_ids]
+    if not ids:
+        return []
+    pool = await DBConnector.get_conn()
+    async with pool.acquire() as conn:
+        async with conn.cursor(TimedDictCursor) as cur:
+            await cur.execute(
+                f"SELECT {_USER_COLUMNS} FROM users WHERE tg_user_id IN ({','.join(['%s'] * len(ids))})",
+                ids
             )
-            res = await cur.fetchone()
-            if res:
-                ## Update last_seen
-                await cur.execute(
-                    "UPDATE users SET last_seen=NOW() WHERE tg_user_id=%s",
-                    (tg_user_id,)
-                )
-            else:
-                await cur.execute(
-                    """
-                    INSERT INTO users
-                    (tg_user_id, username, first_name, last_name, language_code, last_seen)
-                    VALUES (%s, %s, %s, %s, %s, NOW())
-                    """,
-                    (tg_user_id, username, first_name, last_name, language_code)
-                )
-
-
-async def search_users(query: str):
+            rows = await cur.fetchall()
+    by_id = {int(r["tg_user_id"]): r for r in rows}
+    return [by_id[i] for i in ids if i in by_id]
+
+
+async def search_users(query: str, limit: int = 20):
+    """
+    Users matching query, best match first. A numeric query is also tried as an exact
+    tg_user_id; text goes through the in-memory index (LIKE scan until it is loaded),
+    which matches tg_user_id prefixes and substrings too.
+    """
+    query = query.strip()
+    exact = None
+    if query.isdigit():
+        exact = await get_user_by_tg(int(query))
+
+    if not user_index.ready:
+        rows = await _search_users_like(query, limit)
+    else:
+        rows = await get_users_by_tg(user_index.search(query, limit))
+
+    if exact:
+        rows = [exact] + [r for r in rows if int(r["tg_user_id"]) != int(exact["tg_user_id"])][:limit - 1]
+    return rows
+
+
+async def _search_users_like(query: str, limit: int):
     pool = await DBConnector.get_conn()
     q = f"%{query}%"
-    sql = """
-        SELECT tg_user_id, username, first_name, last_name, avatar_url, status, language_code, last_seen
+    sql = f"""
+        SELECT {_USER_COLUMNS}
         FROM users
         WHERE
             username LIKE %s OR
             first_name LIKE %s OR
             last_name LIKE %s OR
             CAST(tg_user_id AS CHAR) LIKE %s
-        LIMIT 20
+        LIMIT %s
     """
     async with pool.acquire() as conn:
-        async with conn.cursor(aiomysql.DictCursor) as cur:
-            await cur.execute(sql, (q, q, q, q))
+        async with conn.cursor(TimedDictCursor) as cur:
+            await cur.execute(sql, (q, q, q, q, int(limit)))
             rows = await cur.fetchall()
     return rows
 
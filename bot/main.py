@@ -5,6 +5,9 @@ from aiogram.fsm.storage.memory import MemoryStorage
 from bot.config import BOT_TOKEN
 from bot.routes.basic import router as basic_router
 from bot.db.connector import DBConnector
+from bot.db.users import start_user_index
+from bot.db.lastseen import last_seen
+from bot.utils.presence import LastSeenMiddleware
 
 logging.basicConfig(
     level=logging.INFO,
@@ -14,14 +17,26 @@ logging.basicConfig(
 async def on_startup():
     await DBConnector.init_pool()
     logging.info("DB pool initialized")
+    ## /find uses LIKE until the search index is loaded
+    start_user_index()
+    last_seen.start()
+
+
+async def on_shutdown():
+    ## write last_seen values still buffered
+    await last_seen.close()
 
 async def main():
     bot = Bot(token=BOT_TOKEN, parse_mode="HTML")
     dp = Dispatcher(storage=MemoryStorage())
+    dp.update.outer_middleware(LastSeenMiddleware(last_seen))
     dp.include_router(basic_router)
 
     await on_startup()
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await on_shutdown()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -5,7 +5,7 @@ from aiogram import Router, types, Bot, F
 from aiogram.filters import Command
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-from bot.db.users import search_users, register_user
+from bot.db.users import search_users, register_user, get_user_by_tg
 from bot.utils.invite import generate_room_id, build_invite_url
 from bot.utils.userstate import get_user_state
 from bot.utils.avatars import ensure_user_avatar_cached
@@ -217,11 +217,10 @@ async def invite_callback(call: types.CallbackQuery, bot: Bot):
         return
 
     target_user_id = int(call.data[len("invite:"):])
-    users = await search_users(str(target_user_id))
-    if not users:
+    u = await get_user_by_tg(target_user_id)
+    if not u:
         await call.answer(tr("invite.no_members", lang=state["lang"]), show_alert=True)
         return
-    u = users[0]
 
     user_info = {
         "user_id": u["tg_user_id"],
@@ -0,0 +1,25 @@
+## aiogram middleware feeding the last_seen coalescer (bot/db/lastseen.py)
+## Registered as an outer middleware on updates, so every message, command or button press
+## from a user counts as activity, before any handler runs.
+
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+
+class LastSeenMiddleware(BaseMiddleware):
+    def __init__(self, coalescer):
+        self.coalescer = coalescer
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        ## event_from_user is set by aiogram's own user-context middleware
+        user = data.get("event_from_user")
+        if user is not None and not user.is_bot:
+            self.coalescer.touch(user.id)
+        return await handler(event, data)
@@ -0,0 +1,226 @@
+## In-memory user search index for /find and the invite flow
+## Prefix queries (username, name words, tg_user_id) are answered by bisect over arrays of
+## entries sorted by the text they point to; trigram postings over every part answer
+## substring queries (what the old LIKE '%q%' did, tg_user_id included) without a table scan.
+## The index only maps text to tg_user_id; full rows are read by tg_user_id (UNIQUE index).
+
+import asyncio
+import re
+from array import array
+from heapq import nsmallest
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+_SEP = "\x01"  ## between username, full name and tg_user_id; never part of a query
+_TOP = "\U0010ffff"  ## sorts after every character: q + _TOP bounds the texts starting with q
+_OFF_BITS = 16  ## entry = slot << 16 | offset of the indexed word in the slot's text
+_OFF_MASK = (1 << _OFF_BITS) - 1
+_WORD = re.compile("(?<![^ \x01])[^ \x01]")
+
+
+def normalize(text: Optional[str]) -> str:
+    return " ".join((text or "").casefold().split())
+
+
+def _grams(text: str) -> Set[str]:
+    grams = set()
+    for part in text.split(_SEP):
+        for i in range(len(part) - 2):
+            grams.add(part[i:i + 3])
+    return grams
+
+
+def _word_starts(text: str) -> List[int]:
+    ## name words and the tg_user_id (the username has its own array)
+    return [m.start() for m in _WORD.finditer(text, text.find(_SEP) + 1) if m.start() <= _OFF_MASK]
+
+
+def _lower_bound(entries: array, q: str, key) -> int:
+    lo, hi = 0, len(entries)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if key(entries[mid]) < q:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+class UserIndex:
+    """
+    One normalized text per user ("username\\x01first last\\x01tg_user_id") and three lookups:
+    - names / words: entries sorted by the text from the username / a name word or the id on;
+      all texts with a prefix q form one run found by bisect. Both are built in one pass by
+      sort() (load) and kept sorted by put() afterwards (array insert/remove, C speed).
+    - trigram postings: append-only arrays of slot numbers; postings of text a user no longer
+      has stay behind and are filtered out because every candidate is checked against its text.
+    Results are ranked: exact username, username prefix, name word or id prefix, then any
+    substring; ties go to the shorter text. Each prefix rank looks at the first max_scan entries
+    of its run (alphabetical, so the texts closest to q); substring matches come from the
+    max_scan most recently registered candidates of the rarest trigram.
+    """
+
+    def __init__(self, max_scan: int = 10000):
+        self.max_scan = max(1, int(max_scan))
+        self._postings: Dict[str, array] = {}
+        self._ids = array("Q")
+        self._text: List[str] = []
+        self._slot: Dict[int, int] = {}
+        self._by_username: Dict[str, int] = {}  ## normalized username -> slot
+        self._names = array("Q")
+        self._words = array("Q")
+        self._sorted = False  ## names/words cover every slot and are maintained by put()
+        self._changed: Optional[List[int]] = None  ## slots put() while sort() runs in its thread
+        self.ready = False
+
+    def __len__(self) -> int:
+        return len(self._text)
+
+    def put(self, tg_user_id: int, username: Optional[str], first_name: Optional[str], last_name: Optional[str]):
+        full = normalize(f"{first_name or ''} {last_name or ''}")
+        name = normalize(username)
+        tg_user_id = int(tg_user_id)
+        text = f"{name}{_SEP}{full}{_SEP}{tg_user_id}"
+        slot = self._slot.get(tg_user_id)
+        if slot is None:
+            slot = len(self._text)
+            self._slot[tg_user_id] = slot
+            self._ids.append(tg_user_id)
+            self._text.append(text)
+            grams = _grams(text)
+        else:
+            old = self._text[slot]
+            if old == text:
+                return
+            if self._sorted:
+                self._unsort(slot)
+            self._text[slot] = text
+            grams = _grams(text) - _grams(old)
+            old_name = old.partition(_SEP)[0]
+            if old_name != name and self._by_username.get(old_name) == slot:
+                del self._by_username[old_name]
+        if name:
+            self._by_username[name] = slot
+        for g in grams:
+            posting = self._postings.get(g)
+            if posting is None:
+                self._postings[g] = array("I", (slot,))
+            else:
+                posting.append(slot)
+        if self._sorted:
+            self._insort(slot)
+        elif self._changed is not None:
+            self._changed.append(slot)
+
+    def put_many(self, rows: Iterable):
+        """
+        rows of (tg_user_id, username, first_name, last_name)
+        """
+        for r in rows:
+            self.put(r[0], r[1], r[2], r[3])
+
+    ## Sorted entries
+
+    def _key(self, entry: int) -> str:
+        return self._text[entry >> _OFF_BITS][entry & _OFF_MASK:]
+
+    def _entries(self, slot: int) -> Tuple[List[int], List[int]]:
+        text = self._text[slot]
+        base = slot << _OFF_BITS
+        names = [base] if not text.startswith(_SEP) else []
+        return names, [base | off for off in _word_starts(text)]
+
+    def _build(self, count: int) -> Tuple[array, array]:
+        ## read only: runs in a thread while put() may go on in the event loop
+        names: List[int] = []
+        words: List[int] = []
+        for slot in range(count):
+            n, w = self._entries(slot)
+            names += n
+            words += w
+        return array("Q", sorted(names, key=self._key)), array("Q", sorted(words, key=self._key))
+
+    async def sort(self):
+        """
+        Build the sorted name/word arrays off the event loop (after loading); users put()
+        meanwhile are re-sorted in afterwards. search() builds them inline if never called.
+        """
+        if self._sorted or self._changed is not None:
+            return
+        self._changed = []
+        count = len(self._text)
+        try:
+            names, words = await asyncio.to_thread(self._build, count)
+            self._names, self._words, self._sorted = names, words, True
+            for slot in dict.fromkeys(self._changed):
+                if slot < count:
+                    self._purge(slot)  ## the build may have seen the old or the new text
+                self._insort(slot)
+        finally:
+            self._changed = None
+
+    def _insort(self, slot: int):
+        names, words = self._entries(slot)
+        for arr, entries in ((self._names, names), (self._words, words)):
+            for e in entries:
+                arr.insert(_lower_bound(arr, self._key(e), self._key), e)
+
+    def _unsort(self, slot: int):
+        ## entries of the slot's current text (before it changes)
+        names, words = self._entries(slot)
+        for arr, entries in ((self._names, names), (self._words, words)):
+            for e in entries:
+                arr.remove(e)
+
+    def _purge(self, slot: int):
+        lo, hi = slot << _OFF_BITS, (slot + 1) << _OFF_BITS
+        self._names = array("Q", [e for e in self._names if not lo <= e < hi])
+        self._words = array("Q", [e for e in self._words if not lo <= e < hi])
+
+    def _prefixed(self, entries: array, q: str) -> array:
+        lo = _lower_bound(entries, q, self._key)
+        hi = min(_lower_bound(entries, q + _TOP, self._key), lo + self.max_scan)
+        return entries[lo:hi]
+
+    def search(self, query: str, limit: int = 20) -> List[int]:
+        """
+        tg_user_ids matching query, best first.
+        """
+        q = normalize(query).lstrip("@").replace(_SEP, "")
+        if not q:
+            return []
+        if not self._sorted:
+            self._names, self._words = self._build(len(self._text))
+            self._sorted = True
+        texts, ids = self._text, self._ids
+        exact = self._by_username.get(q)
+        found: List[int] = [] if exact is None else [exact]
+        taken = set(found)
+
+        ## username prefix (rank 1), then name word or tg_user_id prefix (rank 2)
+        for entries in (self._names, self._words):
+            hits = [s for s in dict.fromkeys(e >> _OFF_BITS for e in self._prefixed(entries, q)) if s not in taken]
+            best = nsmallest(limit - len(found), hits, key=lambda s: len(texts[s]))
+            found += best
+            taken.update(best)
+            if len(found) >= limit:
+                return [ids[s] for s in found]
+        if len(q) < 3:
+            return [ids[s] for s in found]
+
+        ## plain substrings (rank 3): the rarest trigram bounds the candidates, each is verified.
+        ## Slots grow with registration order, so the newest candidates are at the end
+        ## (a slot can repeat in a posting if a user's name changed back and forth)
+        postings = []
+        for k in (q[i:i + 3] for i in range(len(q) - 2)):
+            p = self._postings.get(k)
+            if p is None:
+                return [ids[s] for s in found]
+            postings.append(p)
+        rarest = min(postings, key=len)
+        scored = []
+        for slot in dict.fromkeys(islice(reversed(rarest), self.max_scan)):
+            if slot not in taken and q in texts[slot]:
+                scored.append((len(texts[slot]), slot))
+        found += [slot for _, slot in nsmallest(limit - len(found), scored)]
+        return [ids[s] for s in found]
@@ -0,0 +1,42 @@
+-- 001: daily usage rollups (usage_daily_owner, usage_daily_participant) and their catch-up watermark
+-- Apply once on existing installs: mysql -u root -p tgringer < install/migrations/001_usage_rollups.sql
+-- The server's rollup job backfills both tables from call_logs / call_participants on its first runs.
+
+CREATE INDEX IF NOT EXISTS idx_ended ON call_logs(ended_at);
+
+
+-- Daily usage rollups (maintained by server/db/usage.py, rebuildable from the tables above)
+-- Owner rows count finished calls by the day they started; participant rows by the day of first join
+CREATE TABLE IF NOT EXISTS usage_daily_owner (
+    day              DATE NOT NULL,
+    owner_id         BIGINT UNSIGNED NOT NULL,
+    calls            INT UNSIGNED NOT NULL DEFAULT 0,
+    completed_calls  INT UNSIGNED NOT NULL DEFAULT 0,
+    solo_calls       INT UNSIGNED NOT NULL DEFAULT 0,
+    duration_sec     BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    participants     INT UNSIGNED NOT NULL DEFAULT 0,     -- sum of call_logs.participant_count
+    updated_at       DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (owner_id, day),
+    KEY idx_udo_day (day)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+
+CREATE TABLE IF NOT EXISTS usage_daily_participant (
+    day              DATE NOT NULL,
+    user_id          BIGINT UNSIGNED NOT NULL,
+    calls            INT UNSIGNED NOT NULL DEFAULT 0,
+    joins            INT UNSIGNED NOT NULL DEFAULT 0,
+    duration_sec     BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    updated_at       DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, day),
+    KEY idx_udp_day (day)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+
+-- Catch-up job watermark: last (ended_at, id) of call_logs folded into the rollups
+CREATE TABLE IF NOT EXISTS usage_rollup_state (
+    name             VARCHAR(32) NOT NULL PRIMARY KEY,
+    last_ended_at    DATETIME NOT NULL,
+    last_call_id     BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    updated_at       DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
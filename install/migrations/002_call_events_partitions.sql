@@ -0,0 +1,27 @@
+-- 002: monthly RANGE partitioning of call_events (retention/archival in server/db/eventarchive.py)
+-- Apply once on existing installs: mysql -u root -p tgringer < install/migrations/002_call_events_partitions.sql
+-- The ALTER TABLE ... PARTITION BY rebuilds the table: run it in a quiet window.
+--
+-- Partitioned InnoDB tables cannot have foreign keys and every unique key must include the
+-- partitioning column, so the FKs go and the primary key becomes (id, created_at).
+-- Everything up to the end of the current month lands in p_hist; the server's retention job
+-- splits monthly partitions (pYYYYMM) off p_future ahead of time and later archives and drops
+-- whole partitions past EVENTS_RETENTION_MONTHS.
+
+ALTER TABLE call_events
+    DROP FOREIGN KEY fk_ce_call,
+    DROP FOREIGN KEY fk_ce_user;
+
+ALTER TABLE call_events
+    DROP PRIMARY KEY,
+    ADD PRIMARY KEY (id, created_at);
+
+SET @p_hist_end = DATE_FORMAT(CURDATE() + INTERVAL 1 MONTH, '%Y-%m-01');
+SET @ddl = CONCAT(
+    'ALTER TABLE call_events PARTITION BY RANGE (TO_DAYS(created_at)) (',
+    'PARTITION p_hist VALUES LESS THAN (TO_DAYS(''', @p_hist_end, ''')), ',
+    'PARTITION p_future VALUES LESS THAN MAXVALUE)'
+);
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
@@ -69,6 +69,7 @@ CREATE TABLE IF NOT EXISTS call_logs (
     KEY idx_room_started (room_uid, started_at),
     KEY idx_owner_started (owner_id, started_at),
     KEY idx_status (status),
+    KEY idx_ended (ended_at),
     CONSTRAINT fk_call_logs_owner FOREIGN KEY (owner_id) REFERENCES users(id) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
@@ -111,10 +112,12 @@ CREATE TABLE IF NOT EXISTS call_recordings (
 
 
 -- Optional event journal for diagnostics and analytics
+-- Partitioned by month (no FKs, PK includes created_at); old months are archived to
+-- EVENTS_ARCHIVE_DIR and dropped by the server's retention job (server/db/eventarchive.py)
 CREATE TABLE IF NOT EXISTS call_events (
-    id           BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    id           BIGINT UNSIGNED AUTO_INCREMENT,
     call_id      BIGINT UNSIGNED NOT NULL,
-    user_id      BIGINT UNSIGNED DEFAULT NULL,     -- actor if present (FK to users.id)
+    user_id      BIGINT UNSIGNED DEFAULT NULL,     -- actor if present (users.id)
     event_type   ENUM(
                     'owner_join',
                     'peer_join',
@@ -129,9 +132,49 @@ CREATE TABLE IF NOT EXISTS call_events (
                  ) NOT NULL,
     payload      JSON DEFAULT NULL,                -- arbitrary event details
     created_at   DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-    KEY idx_ce_call_time (call_id, created_at),
-    CONSTRAINT fk_ce_call FOREIGN KEY (call_id) REFERENCES call_logs(id) ON DELETE CASCADE,
-    CONSTRAINT fk_ce_user FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE SET NULL
+    PRIMARY KEY (id, created_at),
+    KEY idx_ce_call_time (call_id, created_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+PARTITION BY RANGE (TO_DAYS(created_at)) (
+    PARTITION p_hist VALUES LESS THAN (TO_DAYS('2000-01-01')),
+    PARTITION p_future VALUES LESS THAN MAXVALUE
+);
+
+
+-- Daily usage rollups (maintained by server/db/usage.py, rebuildable from the tables above)
+-- Owner rows count finished calls by the day they started; participant rows by the day of first join
+CREATE TABLE IF NOT EXISTS usage_daily_owner (
+    day              DATE NOT NULL,
+    owner_id         BIGINT UNSIGNED NOT NULL,
+    calls            INT UNSIGNED NOT NULL DEFAULT 0,
+    completed_calls  INT UNSIGNED NOT NULL DEFAULT 0,
+    solo_calls       INT UNSIGNED NOT NULL DEFAULT 0,
+    duration_sec     BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    participants     INT UNSIGNED NOT NULL DEFAULT 0,     -- sum of call_logs.participant_count
+    updated_at       DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (owner_id, day),
+    KEY idx_udo_day (day)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+
+CREATE TABLE IF NOT EXISTS usage_daily_participant (
+    day              DATE NOT NULL,
+    user_id          BIGINT UNSIGNED NOT NULL,
+    calls            INT UNSIGNED NOT NULL DEFAULT 0,
+    joins            INT UNSIGNED NOT NULL DEFAULT 0,
+    duration_sec     BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    updated_at       DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, day),
+    KEY idx_udp_day (day)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+
+-- Catch-up job watermark: last (ended_at, id) of call_logs folded into the rollups
+CREATE TABLE IF NOT EXISTS usage_rollup_state (
+    name             VARCHAR(32) NOT NULL PRIMARY KEY,
+    last_ended_at    DATETIME NOT NULL,
+    last_call_id     BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    updated_at       DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 
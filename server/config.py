@@ -5,6 +5,12 @@ load_dotenv()
 
 APP_BASE_URL = os.getenv("APP_BASE_URL", "http://localhost:91")
 BOT_TOKEN = os.getenv("BOT_TOKEN", "")
+
+## Owner-scoped read APIs (/calls, /usage): the caller proves its Telegram user with WebApp initData
+## (X-Telegram-Init-Data, signed with BOT_TOKEN) at most N s old; internal callers may send
+## X-Internal-Token = INTERNAL_API_TOKEN instead (empty = disabled)
+TG_INIT_DATA_MAX_AGE_SEC = float(os.getenv("TG_INIT_DATA_MAX_AGE_SEC", "86400"))
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN", "").strip()
 TURN_URLS = [u.strip() for u in os.getenv("TURN_URLS", "stun:stun.l.google.com:19302").split(",") if u.strip()]
 TURN_USERNAME = os.getenv("TURN_USERNAME") or ""
 TURN_PASSWORD = os.getenv("TURN_PASSWORD") or ""
@@ -28,3 +34,99 @@ RECORD_TARGET_GOP = int(os.getenv("RECORD_TARGET_GOP", "60"))
 
 ## Per-segment duration in seconds for pipeline B
 RECORD_SEGMENT_TIME = int(os.getenv("RECORD_SEGMENT_TIME", "4"))
+
+## Pipeline A mp4 transcode jobs: concurrent ffmpeg processes, their nice level,
+## max queued jobs (beyond that the webm is delivered as is), seconds finished jobs stay queryable
+TRANSCODE_WORKERS = int(os.getenv("TRANSCODE_WORKERS", "1"))
+TRANSCODE_NICE = int(os.getenv("TRANSCODE_NICE", "10"))
+TRANSCODE_QUEUE_MAX = int(os.getenv("TRANSCODE_QUEUE_MAX", "100"))
+TRANSCODE_KEEP_SEC = float(os.getenv("TRANSCODE_KEEP_SEC", "3600"))
+
+## Recording session manifests and pending transcode jobs survive restarts in this directory;
+## sessions without a chunk for RECORD_SESSION_IDLE_SEC are finalized (checked every RECORD_SWEEP_INTERVAL s, 0 = off);
+## paused sessions (the client pings /record/ping instead of sending chunks) after RECORD_SESSION_PAUSED_IDLE_SEC
+RECORD_STATE_DIR = os.getenv("RECORD_STATE_DIR") or os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "state", "recordings"))
+RECORD_SESSION_IDLE_SEC = float(os.getenv("RECORD_SESSION_IDLE_SEC", "900"))
+RECORD_SESSION_PAUSED_IDLE_SEC = float(os.getenv("RECORD_SESSION_PAUSED_IDLE_SEC", "14400"))
+RECORD_SWEEP_INTERVAL = float(os.getenv("RECORD_SWEEP_INTERVAL", "60"))
+
+## Pipeline A chunk writes run in their own threads: thread count, coalesce chunks up to N KiB or
+## N ms, max MiB buffered per session before /record/chunk waits for the disk
+RECORD_WRITE_THREADS = int(os.getenv("RECORD_WRITE_THREADS", "2"))
+RECORD_WRITE_COALESCE_KB = int(os.getenv("RECORD_WRITE_COALESCE_KB", "256"))
+RECORD_WRITE_MAX_DELAY_MS = float(os.getenv("RECORD_WRITE_MAX_DELAY_MS", "1000"))
+RECORD_WRITE_MAX_BUFFER_MB = int(os.getenv("RECORD_WRITE_MAX_BUFFER_MB", "32"))
+## fsync policy for recording files: none | chunks (every RECORD_FSYNC_EVERY chunks and on finish) | finish
+RECORD_FSYNC = os.getenv("RECORD_FSYNC", "finish").lower().strip()
+RECORD_FSYNC_EVERY = int(os.getenv("RECORD_FSYNC_EVERY", "10"))
+
+## Signaling: number of RoomManager shards (rooms in different shards never contend)
+ROOM_SHARDS = int(os.getenv("ROOM_SHARDS", "64"))
+
+## Signaling: per-peer outbound queue size and overflow policy (drop | coalesce | disconnect)
+WS_OUTBOX_SIZE = int(os.getenv("WS_OUTBOX_SIZE", "256"))
+WS_OUTBOX_POLICY = os.getenv("WS_OUTBOX_POLICY", "coalesce").lower().strip()
+
+## Signaling: room bus backend shared by workers (local | redis) and its URL for redis
+ROOM_BUS = os.getenv("ROOM_BUS", "local").lower().strip()
+ROOM_BUS_URL = os.getenv("ROOM_BUS_URL", "redis://127.0.0.1:6379/0")
+## peers of a node silent on the bus for ROOM_BUS_NODE_TTL seconds (crashed worker) are dropped (0 = never)
+ROOM_BUS_NODE_TTL = float(os.getenv("ROOM_BUS_NODE_TTL", "30"))
+
+## Signaling: coalesce trickle ICE candidates per (from, to) pair into 'ice-batch' frames
+## WS_ICE_BATCH_MS = max added latency in ms (0 disables batching), WS_ICE_BATCH_MAX = flush early at N candidates
+WS_ICE_BATCH_MS = int(os.getenv("WS_ICE_BATCH_MS", "0"))
+WS_ICE_BATCH_MAX = int(os.getenv("WS_ICE_BATCH_MAX", "16"))
+
+## Signaling: log every relayed offer/answer/ice frame (noisy; failures are always logged)
+WS_LOG_RELAY = os.getenv("WS_LOG_RELAY", "0").strip() in ("1", "true", "yes")
+
+## Signaling heartbeat: server ping interval and silence timeout in seconds (interval 0 disables);
+## peers silent for longer than the timeout are dropped through the normal disconnect path
+WS_PING_INTERVAL = float(os.getenv("WS_PING_INTERVAL", "20"))
+WS_PING_TIMEOUT = float(os.getenv("WS_PING_TIMEOUT", "60"))
+
+## Call accounting (write-behind): events of one room per transaction, transactions in flight at once,
+## retries per transaction, queue bound
+ACCOUNTING_BATCH_MAX = int(os.getenv("ACCOUNTING_BATCH_MAX", "64"))
+ACCOUNTING_CONCURRENCY = int(os.getenv("ACCOUNTING_CONCURRENCY", "16"))
+ACCOUNTING_RETRIES = int(os.getenv("ACCOUNTING_RETRIES", "3"))
+ACCOUNTING_QUEUE_SIZE = int(os.getenv("ACCOUNTING_QUEUE_SIZE", "10000"))
+
+## tg_user_id -> users.id cache (server/db/usercache.py): max entries, TTL for found users
+## and TTL for unknown ids in seconds (how long a fresh bot registration may stay unseen)
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "50000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "3600"))
+USER_CACHE_NEG_TTL = float(os.getenv("USER_CACHE_NEG_TTL", "30"))
+
+## call_events sink (server/db/eventsink.py): rows per multi-row INSERT, max buffering delay,
+## buffer bound, what to drop when full (drop_oldest | drop_new), retries of an unapplied batch before row-by-row fallback
+EVENTS_BATCH_MAX = int(os.getenv("EVENTS_BATCH_MAX", "200"))
+EVENTS_FLUSH_MS = int(os.getenv("EVENTS_FLUSH_MS", "250"))
+EVENTS_BUFFER_SIZE = int(os.getenv("EVENTS_BUFFER_SIZE", "10000"))
+EVENTS_OVERFLOW = os.getenv("EVENTS_OVERFLOW", "drop_oldest").lower().strip()
+EVENTS_RETRIES = int(os.getenv("EVENTS_RETRIES", "3"))
+
+## Daily usage rollups (server/db/usage.py): refresh rollup rows inside finalize/leave transactions,
+## catch-up job interval in seconds (0 disables), calls per catch-up batch, and how many seconds
+## a finished call is left alone before the job picks it up
+ROLLUP_ON_WRITE = os.getenv("ROLLUP_ON_WRITE", "1").strip() in ("1", "true", "yes")
+ROLLUP_INTERVAL = float(os.getenv("ROLLUP_INTERVAL", "300"))
+ROLLUP_BATCH = int(os.getenv("ROLLUP_BATCH", "500"))
+ROLLUP_LAG_SEC = int(os.getenv("ROLLUP_LAG_SEC", "60"))
+
+## call_events retention (server/db/eventarchive.py, needs install/migrations/002_*): months of events
+## kept in the database (0 keeps everything), job interval in seconds (0 disables), monthly partitions
+## created ahead, and whether/where dropped months are archived as gzip NDJSON (keep out of static/)
+EVENTS_RETENTION_MONTHS = int(os.getenv("EVENTS_RETENTION_MONTHS", "6"))
+EVENTS_RETENTION_INTERVAL = float(os.getenv("EVENTS_RETENTION_INTERVAL", "3600"))
+EVENTS_PARTITIONS_AHEAD = int(os.getenv("EVENTS_PARTITIONS_AHEAD", "2"))
+EVENTS_ARCHIVE = os.getenv("EVENTS_ARCHIVE", "1").strip() in ("1", "true", "yes")
+EVENTS_ARCHIVE_DIR = os.getenv("EVENTS_ARCHIVE_DIR") or os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "archive", "events"))
+
+## Room -> (owner, call_id) directory for the recording routes (server/utils/calldir.py):
+## max rooms kept and how long an entry outlives its call in seconds
+CALL_DIRECTORY_SIZE = int(os.getenv("CALL_DIRECTORY_SIZE", "10000"))
+CALL_DIRECTORY_TTL = float(os.getenv("CALL_DIRECTORY_TTL", "3600"))
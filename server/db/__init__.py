@@ -1,42 +1,20 @@
 ## Async MariaDB pool using aiomysql
-## Reads connection params from environment variables (MYSQL_* primary)
+## Reads connection params from environment variables (MYSQL_* primary); see server/db/pool.py
 
-import os
 import asyncio
-import aiomysql
+from typing import Any, Dict, Optional
 
-
-_POOL = None
-_POOL_LOCK = asyncio.Lock()
+from server.db.pool import DBPool, PoolTimeout, pool_from_env, not_applied, rejected, _env  ## noqa: F401 (re-exported)
 
 
-def _env(name: str, default: str = "", alt: str = "") -> str:
-    """
-    Read env with primary name first, then optional alt fallback, then default.
-    Primary names are MYSQL_* per project convention.
-    """
-    val = os.getenv(name)
-    if val is not None and val != "":
-        return val
-    if alt:
-        val = os.getenv(alt)
-        if val is not None and val != "":
-            return val
-    return default
+_POOL: Optional[DBPool] = None
+_POOL_LOCK = asyncio.Lock()
 
 
-async def get_pool():
+async def get_pool() -> DBPool:
     """
-    Get or create a global aiomysql pool using MYSQL_* environment variables.
-    Required:
-      - MYSQL_HOST
-      - MYSQL_PORT
-      - MYSQL_USER
-      - MYSQL_PASSWORD
-      - MYSQL_DB
-    Optional:
-      - MYSQL_POOL_MIN (default 1)
-      - MYSQL_POOL_MAX (default 5)
+    Get or create the server's shared pool (MYSQL_* environment variables,
+    MYSQL_POOL_MAX defaults to 5). See pool_from_env for all settings.
     """
     global _POOL
     if _POOL:
@@ -44,24 +22,19 @@ async def get_pool():
     async with _POOL_LOCK:
         if _POOL:
             return _POOL
+        _POOL = await pool_from_env(default_max=5).start()
+        return _POOL
 
-        host = _env("MYSQL_HOST", "127.0.0.1", alt="DB_HOST")
-        port = int(_env("MYSQL_PORT", "3306", alt="DB_PORT") or "3306")
-        user = _env("MYSQL_USER", "root", alt="DB_USER")
-        password = _env("MYSQL_PASSWORD", "", alt="DB_PASSWORD")
-        dbname = _env("MYSQL_DB", "tgringer01", alt="DB_NAME")
-        minsize = int(_env("MYSQL_POOL_MIN", "1", alt="DB_POOL_MIN") or "1")
-        maxsize = int(_env("MYSQL_POOL_MAX", "5", alt="DB_POOL_MAX") or "5")
 
-        _POOL = await aiomysql.create_pool(
-            host=host,
-            port=port,
-            user=user,
-            password=password,
-            db=dbname,
-            minsize=minsize,
-            maxsize=maxsize,
-            autocommit=True,
-            charset="utf8mb4",
-        )
-        return _POOL
+def pool_stats() -> Optional[Dict[str, Any]]:
+    """
+    Stats of the shared pool, or None if nothing has used the database yet.
+    """
+    return _POOL.stats() if _POOL else None
+
+
+async def close_pool():
+    global _POOL
+    if _POOL:
+        await _POOL.close()
+        _POOL = None
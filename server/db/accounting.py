@@ -0,0 +1,231 @@
+## Write-behind call accounting
+## Signaling code submits typed events and returns immediately; per-room worker tasks
+## apply them through server/db/calls.py in submit order, in batches, with retries.
+## The resolved call_logs.id is kept on the Room record (Room.call_id) and in the call directory.
+
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional
+
+from server.config import (
+    ACCOUNTING_BATCH_MAX,
+    ACCOUNTING_CONCURRENCY,
+    ACCOUNTING_RETRIES,
+    ACCOUNTING_QUEUE_SIZE,
+)
+from server.db import not_applied, rejected
+from server.db import calls as callsdb
+from server.utils.calldir import call_directory
+
+
+@dataclass
+class OwnerJoin:
+    room: Any
+    room_id: str
+    owner_uid: str
+
+
+@dataclass
+class PeerJoin:
+    room: Any
+    room_id: str
+    owner_uid: str
+    uid: str
+    name: str
+    avatar: str
+    joined: bool = False  ## participant row written; a retry must not count the join again
+
+
+@dataclass
+class RecordMark:
+    room: Any
+    room_id: str
+    event_type: str  ## record_start | record_pause | record_resume | record_stop
+    ts: str
+
+
+@dataclass
+class PeerLeave:
+    room: Any
+    room_id: str
+    uid: str
+
+
+@dataclass
+class CallEnd:
+    room: Any
+    room_id: str
+    reason: str  ## owner_leave | no_peers_left
+
+
+class CallAccounting:
+    """
+    Per-room event chains.
+    submit() appends the event to its room's chain; a room with pending events has one worker
+    task applying them strictly in submit order, so a room whose event is backing off delays
+    only itself. At most `concurrency` applies hit the database at once.
+    Participant and call-end events of a room whose call is known that queued up meanwhile
+    (up to batch_max) go out as one transaction (calls.write_call_ops); if the server rejects
+    the batch, its events are applied one by one so a single bad event cannot sink the rest.
+    Only errors that guarantee nothing was applied (see server.db.pool.not_applied) are retried, with
+    exponential backoff; any other failure (e.g. a connection lost mid-query, which may have
+    committed) is logged and the event skipped, so joins and events are never counted twice.
+    After close() submit() rejects events (counted in `rejected`).
+    """
+
+    def __init__(self, batch_max: int = 64, concurrency: int = 16, retries: int = 3, maxsize: int = 10000):
+        self.batch_max = max(1, int(batch_max))
+        self.concurrency = max(1, int(concurrency))
+        self.retries = max(0, int(retries))
+        self.maxsize = max(1, int(maxsize))
+        self.closed = False
+        self._chains: Dict[str, Deque[Any]] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._pending = 0
+        self.applied = 0
+        self.batches = 0
+        self.retried = 0
+        self.failed = 0
+        self.dropped = 0
+        self.rejected = 0
+
+    def submit(self, event) -> bool:
+        """
+        Enqueue an accounting event without waiting for the database.
+        """
+        if self.closed:
+            self.rejected += 1
+            print(f"[ACCOUNTING] shutting down, rejected {type(event).__name__} room={getattr(event, 'room_id', '')}")
+            return False
+        if self._pending >= self.maxsize:
+            self.dropped += 1
+            print(f"[ACCOUNTING] queue full, dropped {type(event).__name__} room={getattr(event, 'room_id', '')}")
+            return False
+        self._chains.setdefault(event.room_id, deque()).append(event)
+        self._pending += 1
+        if event.room_id not in self._workers:
+            self._workers[event.room_id] = asyncio.create_task(self._run(event.room_id))
+        return True
+
+    def pending(self) -> int:
+        return self._pending
+
+    async def close(self, timeout: float = 15.0):
+        """
+        Stop accepting events, apply the queued ones and stop the workers (app shutdown).
+        """
+        self.closed = True
+        workers = list(self._workers.values())
+        if not workers:
+            return
+        _, unfinished = await asyncio.wait(workers, timeout=timeout)
+        if unfinished:
+            print(f"[ACCOUNTING] drain timed out, {self.pending()} events lost")
+            for t in unfinished:
+                t.cancel()
+            await asyncio.gather(*unfinished, return_exceptions=True)
+
+    async def _run(self, room_id: str):
+        chain = self._chains[room_id]
+        try:
+            while chain:
+                batch = [chain.popleft()]
+                if self._batchable(batch[0]):
+                    while chain and len(batch) < self.batch_max and self._batchable(chain[0]):
+                        batch.append(chain.popleft())
+                self._pending -= len(batch)
+                await self._apply_retrying(batch)
+        finally:
+            ## no await between the empty check and here: a later submit starts a new worker
+            self._pending -= len(chain)
+            self._chains.pop(room_id, None)
+            self._workers.pop(room_id, None)
+
+    @staticmethod
+    def _batchable(ev) -> bool:
+        return isinstance(ev, (PeerJoin, PeerLeave, CallEnd)) and bool(ev.room.call_id)
+
+    async def _apply_retrying(self, events: List[Any]):
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.concurrency)
+        what = type(events[0]).__name__ if len(events) == 1 else f"batch of {len(events)}"
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._sem:
+                    if len(events) == 1:
+                        await self._apply(events[0])
+                    else:
+                        await self._apply_batch(events)
+                        self.batches += 1
+                self.applied += len(events)
+                return
+            except Exception as e:
+                if len(events) > 1 and rejected(e) and not not_applied(e):
+                    print(f"[ACCOUNTING] {what} room={events[0].room_id} rejected, applying one by one: {e}")
+                    for ev in events:
+                        await self._apply_retrying([ev])
+                    return
+                if attempt >= self.retries or not not_applied(e):
+                    self.failed += len(events)
+                    print(f"[ACCOUNTING] {what} room={events[0].room_id} failed after {attempt + 1} attempts: {e}")
+                    return
+                self.retried += 1
+            await asyncio.sleep(0.2 * (2 ** attempt))
+
+    async def _apply_batch(self, events: List[Any]):
+        ops = []
+        for ev in events:
+            call_id = ev.room.call_id
+            if isinstance(ev, PeerJoin):
+                ops += [("participant_join", (call_id, ev.uid, ev.name, ev.avatar)), ("mark_call_active", (call_id,))]
+            elif isinstance(ev, PeerLeave):
+                ops.append(("participant_leave", (call_id, ev.uid, None)))
+            else:
+                ops.append(("finalize_call", (call_id, ev.reason)))
+        await callsdb.write_call_ops(ops)
+        for ev in events:
+            if isinstance(ev, CallEnd):
+                call_directory.end(ev.room_id)
+
+    async def _apply(self, ev):
+        room = ev.room
+        if isinstance(ev, OwnerJoin):
+            call_id = await callsdb.create_call_if_absent(ev.room_id, ev.owner_uid)
+            room.call_id = call_id
+            call_directory.set_call(ev.room_id, ev.owner_uid, call_id)
+            return
+
+        if isinstance(ev, PeerJoin):
+            call_id = room.call_id
+            if not call_id and ev.owner_uid:
+                call_id = await callsdb.create_call_if_absent(ev.room_id, ev.owner_uid)
+                room.call_id = call_id
+                call_directory.set_call(ev.room_id, ev.owner_uid, call_id)
+            if call_id:
+                if not ev.joined:
+                    await callsdb.participant_join(call_id, ev.uid, ev.name, ev.avatar)
+                    ev.joined = True
+                await callsdb.mark_call_active(call_id)
+            return
+
+        call_id = room.call_id
+        if not call_id:
+            return
+
+        if isinstance(ev, RecordMark):
+            await callsdb.add_event(call_id, None, ev.event_type, {"ts": ev.ts})
+        elif isinstance(ev, PeerLeave):
+            await callsdb.participant_leave(call_id, ev.uid, None)
+        elif isinstance(ev, CallEnd):
+            await callsdb.finalize_call(call_id, ended_reason=ev.reason)
+            call_directory.end(ev.room_id)
+
+
+accounting = CallAccounting(
+    batch_max=ACCOUNTING_BATCH_MAX,
+    concurrency=ACCOUNTING_CONCURRENCY,
+    retries=ACCOUNTING_RETRIES,
+    maxsize=ACCOUNTING_QUEUE_SIZE,
+)
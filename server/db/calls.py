@@ -3,9 +3,43 @@
 
 import json
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 
+from server.config import ROLLUP_ON_WRITE
 from server.db import get_pool
+from server.db.usercache import user_ids
+from server.db.eventsink import event_sink
+from server.db.usage import (
+    OWNER_DAY_OF_CALL,
+    PARTICIPANT_DAY_OF_CALL_USER,
+    refresh_owner_days_sql,
+    refresh_participant_days_sql,
+)
+
+
+## Transactions
+
+async def _exec_tx(conn, statements: List[Tuple[str, tuple]]) -> List[int]:
+    """
+    Run (sql, args) statements as one transaction in a single round trip:
+    START TRANSACTION; ...; COMMIT go out as one multi-statement query
+    (aiomysql connects with CLIENT.MULTI_STATEMENTS).
+    Returns the rowcount of each statement. On error the transaction is rolled back.
+    """
+    async with conn.cursor() as cur:
+        parts = ["START TRANSACTION"] + [cur.mogrify(sql, args) for sql, args in statements] + ["COMMIT"]
+        counts: List[int] = []
+        try:
+            await cur.execute(";\n".join(parts))
+            while await cur.nextset():
+                counts.append(cur.rowcount)
+        except Exception:
+            try:
+                await conn.rollback()
+            except Exception:
+                conn.close()
+            raise
+    return counts[:len(statements)]
 
 
 ## Resolve users.id by tg_user_id
@@ -14,9 +48,14 @@ from server.db import get_pool
 async def get_user_id_by_tg(tg_user_id: str) -> Optional[int]:
     """
     Return users.id for given Telegram user id string, or None if not found.
+    Served from the shared user id cache; concurrent misses share one query.
     """
     if not tg_user_id:
         return None
+    return await user_ids.get(str(tg_user_id), _load_user_id)
+
+
+async def _load_user_id(tg_user_id: str) -> Optional[int]:
     pool = await get_pool()
     async with pool.acquire() as conn:
         async with conn.cursor() as cur:
@@ -56,144 +95,173 @@ async def create_call_if_absent(room_uid: str, owner_tg_uid: str) -> Optional[in
             return call_id
 
 
+def _mark_call_active_sql(call_id: int) -> List[Tuple[str, tuple]]:
+    ## the event first: it is written only while the status is still 'created'
+    return [
+        (
+            "INSERT INTO call_events (call_id, user_id, event_type, payload, created_at) "
+            "SELECT id, NULL, 'call_status_change', JSON_OBJECT('to', 'active'), NOW() "
+            "FROM call_logs WHERE id=%s AND status='created'",
+            (call_id,)
+        ),
+        ("UPDATE call_logs SET status='active' WHERE id=%s AND status='created'", (call_id,)),
+    ]
+
+
 async def mark_call_active(call_id: int) -> None:
     """
-    Switch call status from 'created' to 'active' once a non-owner joins.
+    Switch call status from 'created' to 'active' once a non-owner joins
+    (status change and its event in one transaction).
     """
     pool = await get_pool()
     async with pool.acquire() as conn:
-        async with conn.cursor() as cur:
-            await cur.execute(
-                "UPDATE call_logs SET status='active' WHERE id=%s AND status='created'",
-                (call_id,)
-            )
-            if cur.rowcount:
-                await add_event(call_id, None, "call_status_change", {"to": "active"})
+        await _exec_tx(conn, _mark_call_active_sql(call_id))
+
+
+def _finalize_call_sql(call_id: int, ended_reason: str) -> List[Tuple[str, tuple]]:
+    statements = [
+        (
+            "UPDATE call_logs c "
+            "LEFT JOIN ("
+            "    SELECT call_id, COUNT(DISTINCT user_id) AS n, JSON_ARRAYAGG(user_id) AS uids "
+            "    FROM call_participants WHERE call_id=%s GROUP BY call_id"
+            ") p ON p.call_id=c.id "
+            "SET c.ended_at=NOW(), "
+            "    c.duration_sec=TIMESTAMPDIFF(SECOND, c.started_at, NOW()), "
+            "    c.status=IF(COALESCE(p.n, 0) > 0, 'completed', 'solo'), "
+            "    c.participant_count=COALESCE(p.n, 0), "
+            "    c.participants_json=COALESCE(p.uids, '[]'), "
+            "    c.metadata=JSON_SET(COALESCE(c.metadata, '{}'), '$.ended_reason', %s) "
+            "WHERE c.id=%s",
+            (call_id, ended_reason, call_id)
+        ),
+        (
+            "INSERT INTO call_events (call_id, user_id, event_type, payload, created_at) "
+            "SELECT id, NULL, 'call_status_change', JSON_OBJECT('to', status), NOW() FROM call_logs WHERE id=%s",
+            (call_id,)
+        ),
+    ]
+    if ROLLUP_ON_WRITE:
+        statements.append((refresh_owner_days_sql(OWNER_DAY_OF_CALL), (call_id,)))
+    return statements
 
 
 async def finalize_call(call_id: int, ended_reason: str = "owner_leave") -> None:
     """
     Finalize call: set ended_at, duration, final status ('completed' or 'solo'),
     update participant_count and participants_json (distinct user ids).
+    One set-based UPDATE aggregates call_participants on the server, then the status
+    event is read back from the updated row; both run in one transaction and one round trip.
+    With ROLLUP_ON_WRITE the owner's usage_daily_owner row for the call's day is refreshed too.
     """
     pool = await get_pool()
     async with pool.acquire() as conn:
-        async with conn.cursor() as cur:
-            await cur.execute(
-                "SELECT COUNT(DISTINCT user_id) FROM call_participants WHERE call_id=%s",
-                (call_id,)
-            )
-            row = await cur.fetchone()
-            distinct_count = int(row[0]) if row else 0
-
-            await cur.execute("SELECT started_at FROM call_logs WHERE id=%s", (call_id,))
-            row = await cur.fetchone()
-            if not row:
-                return
-            started_at: datetime = row[0]  # type: ignore
-
-            await cur.execute(
-                "SELECT user_id FROM call_participants WHERE call_id=%s",
-                (call_id,)
-            )
-            uids = [int(r[0]) for r in await cur.fetchall()]
-
-            final_status = "completed" if distinct_count > 0 else "solo"
-
-            await cur.execute(
-                "UPDATE call_logs "
-                "SET ended_at=NOW(), "
-                "    duration_sec=TIMESTAMPDIFF(SECOND, %s, NOW()), "
-                "    status=%s, "
-                "    participant_count=%s, "
-                "    participants_json=%s, "
-                "    metadata=JSON_SET(COALESCE(metadata, '{}'), '$.ended_reason', %s) "
-                "WHERE id=%s",
-                (started_at, final_status, distinct_count, json.dumps(uids), ended_reason, call_id)
-            )
-
-            await add_event(call_id, None, "call_status_change", {"to": final_status})
+        await _exec_tx(conn, _finalize_call_sql(call_id, ended_reason))
 
 
 ## Participants
+## Both helpers resolve users.id inside the statement and write the participant row and its
+## event in one transaction sent as a single multi-statement round trip (see _exec_tx).
+## Timestamps are the DB's NOW(), like call_logs.started_at: the usage rollups bucket the owner's
+## and the participants' rows of one call by day, so both must come from the same clock.
+
+def _participant_join_sql(call_id: int, user_tg_uid: str, display_name: Optional[str],
+                          avatar_url: Optional[str]) -> List[Tuple[str, tuple]]:
+    payload = json.dumps({"name": display_name or "", "avatar": avatar_url or ""})
+    return [
+        (
+            "INSERT INTO call_participants "
+            "(call_id, user_id, first_joined_at, joins_count, display_name, avatar_url) "
+            "SELECT %s, u.id, NOW(), 1, %s, %s FROM users u WHERE u.tg_user_id=%s "
+            "ON DUPLICATE KEY UPDATE joins_count=joins_count+1, last_left_at=NULL",
+            (call_id, display_name or None, avatar_url or None, user_tg_uid)
+        ),
+        (
+            "INSERT INTO call_events (call_id, user_id, event_type, payload, created_at) "
+            "SELECT %s, u.id, 'peer_join', %s, NOW() FROM users u WHERE u.tg_user_id=%s",
+            (call_id, payload, user_tg_uid)
+        ),
+    ]
+
 
 async def participant_join(call_id: int, user_tg_uid: str, display_name: Optional[str], avatar_url: Optional[str]) -> None:
     """
-    Upsert participant row on join, increment joins_count when repeats.
+    Upsert participant row on join (uq_call_user), increment joins_count when repeats.
+    Unknown users are ignored.
     """
-    user_id = await get_user_id_by_tg(user_tg_uid)
-    if not user_id:
+    if not user_tg_uid:
         return
-    now = datetime.utcnow()
     pool = await get_pool()
     async with pool.acquire() as conn:
-        async with conn.cursor() as cur:
-            await cur.execute(
-                "SELECT id, joins_count FROM call_participants WHERE call_id=%s AND user_id=%s",
-                (call_id, user_id)
-            )
-            row = await cur.fetchone()
-            if row:
-                pid = int(row[0])
-                joins = int(row[1]) + 1
-                await cur.execute(
-                    "UPDATE call_participants SET joins_count=%s, last_left_at=NULL WHERE id=%s",
-                    (joins, pid)
-                )
-            else:
-                await cur.execute(
-                    "INSERT INTO call_participants "
-                    "(call_id, user_id, first_joined_at, joins_count, display_name, avatar_url) "
-                    "VALUES (%s, %s, %s, %s, %s, %s)",
-                    (call_id, user_id, now, 1, display_name or None, avatar_url or None)
-                )
-
-            await add_event(call_id, user_id, "peer_join", {"name": display_name or "", "avatar": avatar_url or ""})
+        await _exec_tx(conn, _participant_join_sql(call_id, user_tg_uid, display_name, avatar_url))
+
+
+def _participant_leave_sql(call_id: int, user_tg_uid: str,
+                           joined_at_hint: Optional[datetime] = None) -> List[Tuple[str, tuple]]:
+    statements = [
+        (
+            ## assignments run left to right: total_duration_sec must still see the old last_left_at
+            "INSERT INTO call_participants "
+            "(call_id, user_id, first_joined_at, last_left_at, total_duration_sec, joins_count) "
+            "SELECT %s, u.id, NOW(), NOW(), 0, 1 FROM users u WHERE u.tg_user_id=%s "
+            "ON DUPLICATE KEY UPDATE "
+            "  total_duration_sec=IF(last_left_at IS NULL, "
+            "      total_duration_sec + GREATEST(0, TIMESTAMPDIFF(SECOND, COALESCE(%s, first_joined_at), NOW())), "
+            "      total_duration_sec), "
+            "  last_left_at=NOW()",
+            (call_id, user_tg_uid, joined_at_hint)
+        ),
+        (
+            "INSERT INTO call_events (call_id, user_id, event_type, payload, created_at) "
+            "SELECT %s, u.id, 'peer_leave', NULL, NOW() FROM users u WHERE u.tg_user_id=%s",
+            (call_id, user_tg_uid)
+        ),
+    ]
+    if ROLLUP_ON_WRITE:
+        statements.append((refresh_participant_days_sql(PARTICIPANT_DAY_OF_CALL_USER), (call_id, user_tg_uid)))
+    return statements
 
 
 async def participant_leave(call_id: int, user_tg_uid: str, joined_at_hint: Optional[datetime] = None) -> None:
     """
-    On leave, set last_left_at and add elapsed seconds to total_duration_sec.
+    On leave, set last_left_at and add elapsed seconds (since joined_at_hint, in DB time, or
+    first_joined_at) to total_duration_sec unless already closed.
     If row absent, create minimal row and close it.
+    With ROLLUP_ON_WRITE the user's usage_daily_participant row is refreshed in the same transaction.
     """
-    user_id = await get_user_id_by_tg(user_tg_uid)
-    if not user_id:
+    if not user_tg_uid:
         return
-    now = datetime.utcnow()
     pool = await get_pool()
     async with pool.acquire() as conn:
-        async with conn.cursor() as cur:
-            await cur.execute(
-                "SELECT id, first_joined_at, last_left_at, total_duration_sec "
-                "FROM call_participants WHERE call_id=%s AND user_id=%s",
-                (call_id, user_id)
-            )
-            row = await cur.fetchone()
-            if not row:
-                await cur.execute(
-                    "INSERT INTO call_participants "
-                    "(call_id, user_id, first_joined_at, last_left_at, total_duration_sec, joins_count) "
-                    "VALUES (%s, %s, %s, %s, %s, %s)",
-                    (call_id, user_id, now, now, 0, 1)
-                )
-            else:
-                pid = int(row[0])
-                first_joined_at: datetime = row[1]  # type: ignore
-                last_left_at = row[2]
-                total_dur = int(row[3]) if row[3] is not None else 0
-
-                start_ref = joined_at_hint or first_joined_at
-                if last_left_at:
-                    await cur.execute("UPDATE call_participants SET last_left_at=%s WHERE id=%s", (now, pid))
-                else:
-                    delta = int((now - start_ref).total_seconds())
-                    new_total = max(0, total_dur + max(0, delta))
-                    await cur.execute(
-                        "UPDATE call_participants SET last_left_at=%s, total_duration_sec=%s WHERE id=%s",
-                        (now, new_total, pid)
-                    )
-
-            await add_event(call_id, user_id, "peer_leave", {})
+        await _exec_tx(conn, _participant_leave_sql(call_id, user_tg_uid, joined_at_hint))
+
+
+## Batches (call accounting): several of the changes above, in order, as one transaction
+
+_CALL_OPS = {
+    "participant_join": _participant_join_sql,
+    "mark_call_active": _mark_call_active_sql,
+    "participant_leave": _participant_leave_sql,
+    "finalize_call": _finalize_call_sql,
+}
+
+
+async def write_call_ops(ops: List[Tuple[str, tuple]]) -> None:
+    """
+    Apply (name, args) operations, name one of participant_join, mark_call_active,
+    participant_leave, finalize_call with that function's arguments, in one transaction
+    and one round trip. All or none are applied.
+    """
+    statements: List[Tuple[str, tuple]] = []
+    for name, args in ops:
+        if name in ("participant_join", "participant_leave") and not args[1]:
+            continue  ## no user: nothing to write
+        statements += _CALL_OPS[name](*args)
+    if not statements:
+        return
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        await _exec_tx(conn, statements)
 
 
 ## Events
@@ -201,49 +269,46 @@ async def participant_leave(call_id: int, user_tg_uid: str, joined_at_hint: Opti
 async def add_event(call_id: int, user_id: Optional[int], event_type: str, payload: Dict[str, Any]) -> None:
     """
     Append a call_events row with JSON payload and current timestamp.
+    Buffered: the row is written by the event sink with other events in a multi-row INSERT.
     """
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        async with conn.cursor() as cur:
-            await cur.execute(
-                "INSERT INTO call_events (call_id, user_id, event_type, payload, created_at) "
-                "VALUES (%s, %s, %s, %s, NOW())",
-                (call_id, user_id, event_type, json.dumps(payload) if payload else None)
-            )
+    event_sink.add(call_id, user_id, event_type, payload)
 
 
 ## Recordings
 
 async def add_recording(call_id: int, file_name: str, started_ts: int, ended_ts: int, duration_sec: Optional[int], fmt: str, size_bytes: Optional[int], sent_to_bot: bool, base_name: Optional[str]) -> None:
     """
-    Insert call_recordings row and update call_logs.recordings_json (distinct list).
+    Insert call_recordings row, append file_name to call_logs.recordings_json (distinct list)
+    and log record_stop, in one transaction.
+    The list is updated in SQL under the row lock, so recordings finishing concurrently
+    for the same call cannot overwrite each other's entry.
     """
     pool = await get_pool()
     started_dt = datetime.utcfromtimestamp(started_ts)
     ended_dt = datetime.utcfromtimestamp(ended_ts)
     fmt_clean = "mp4" if (fmt or "").lower() == "mp4" else "webm"
 
-    async with pool.acquire() as conn:
-        async with conn.cursor() as cur:
-            await cur.execute(
-                "INSERT INTO call_recordings "
-                "(call_id, file_name, started_at, ended_at, duration_sec, format, size_bytes, sent_to_bot, base_name) "
-                "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
-                (call_id, file_name, started_dt, ended_dt, duration_sec, fmt_clean, size_bytes, 1 if sent_to_bot else 0, base_name)
-            )
-
-            await cur.execute("SELECT recordings_json FROM call_logs WHERE id=%s", (call_id,))
-            row = await cur.fetchone()
-            current: List[str] = []
-            if row and row[0]:
-                try:
-                    current = json.loads(row[0])
-                except Exception:
-                    current = []
+    statements = [
+        (
+            "INSERT INTO call_recordings "
+            "(call_id, file_name, started_at, ended_at, duration_sec, format, size_bytes, sent_to_bot, base_name) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
+            (call_id, file_name, started_dt, ended_dt, duration_sec, fmt_clean, size_bytes, 1 if sent_to_bot else 0, base_name)
+        ),
+    ]
+    if file_name:
+        ## invalid or missing JSON is treated as an empty list, as before
+        statements.append((
+            "UPDATE call_logs "
+            "SET recordings_json=JSON_ARRAY_APPEND(IF(JSON_VALID(recordings_json), recordings_json, '[]'), '$', %s) "
+            "WHERE id=%s AND NOT COALESCE(JSON_CONTAINS(IF(JSON_VALID(recordings_json), recordings_json, '[]'), JSON_QUOTE(%s)), 0)",
+            (file_name, call_id, file_name)
+        ))
+    statements.append((
+        "INSERT INTO call_events (call_id, user_id, event_type, payload, created_at) "
+        "VALUES (%s, NULL, 'record_stop', %s, NOW())",
+        (call_id, json.dumps({"file": file_name}))
+    ))
 
-            if file_name and file_name not in current:
-                current.append(file_name)
-
-            await cur.execute("UPDATE call_logs SET recordings_json=%s WHERE id=%s", (json.dumps(current), call_id))
-
-            await add_event(call_id, None, "record_stop", {"file": file_name})
+    async with pool.acquire() as conn:
+        await _exec_tx(conn, statements)
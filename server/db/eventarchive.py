@@ -0,0 +1,344 @@
+## call_events retention: monthly partitions, archival to gzip NDJSON, reads across both
+## call_events is RANGE partitioned on TO_DAYS(created_at) (install/migrations/002_*): pYYYYMM holds
+## one month, p_hist everything before the first monthly partition, p_future (MAXVALUE) stays empty.
+## EventRetention keeps a few monthly partitions ready ahead of time and, for months past the
+## retention window, streams the partition to <dir>/call_events-<partition>.ndjson.gz with a
+## <...>.calls.json sidecar (sorted call ids) and then drops it; dropping a partition is a
+## metadata operation, no row-by-row DELETE and no index churn on the hot months.
+## load_call_events() returns the events of one call from the live table and from the archive.
+
+import asyncio
+import bisect
+import gzip
+import os
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiomysql
+
+from server.config import (
+    EVENTS_RETENTION_MONTHS,
+    EVENTS_RETENTION_INTERVAL,
+    EVENTS_PARTITIONS_AHEAD,
+    EVENTS_ARCHIVE,
+    EVENTS_ARCHIVE_DIR,
+)
+from server.db import get_pool
+from server.utils import codec
+
+_LOCK = "tgringer_events_retention"
+_FETCH_ROWS = 5000
+_TS_FMT = "%Y-%m-%d %H:%M:%S"
+
+
+def _month_start(d: date, add: int = 0) -> date:
+    n = d.year * 12 + (d.month - 1) + add
+    return date(n // 12, n % 12 + 1, 1)
+
+
+def _to_days(d: date) -> int:
+    """
+    MariaDB TO_DAYS() of a date.
+    """
+    return d.toordinal() + 365
+
+
+def _from_days(n: int) -> date:
+    return date.fromordinal(n - 365)
+
+
+def _partition_name(bound: date) -> str:
+    ## a monthly partition is named after the month it holds (the month before its bound)
+    return "p" + _month_start(bound, -1).strftime("%Y%m")
+
+
+## Archive files
+
+def _archive_paths(directory: str, partition: str) -> Tuple[str, str]:
+    base = os.path.join(directory, f"call_events-{partition}")
+    return base + ".ndjson.gz", base + ".calls.json"
+
+
+def _event_dict(row) -> Dict[str, Any]:
+    payload = row[4]
+    if payload is not None:
+        try:
+            payload = codec.loads(payload)
+        except ValueError:
+            pass
+    return {
+        "id": int(row[0]),
+        "call_id": int(row[1]),
+        "user_id": int(row[2]) if row[2] is not None else None,
+        "event_type": row[3],
+        "payload": payload,
+        "created_at": row[5].strftime(_TS_FMT),
+    }
+
+
+def _event_line(row) -> str:
+    ## call_id comes second and is always followed by a comma: readers pre-filter lines on '"call_id":N,'
+    return codec.dumps(_event_dict(row)) + "\n"
+
+
+class EventArchive:
+    """
+    Read side of the archive directory. Sidecars are cached by mtime, so a lookup
+    reads only the sidecar lists and then the gzip files that contain the call.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._sidecars: Dict[str, Tuple[float, List[int]]] = {}
+
+    def files_for(self, call_id: int) -> List[str]:
+        try:
+            entries = [e for e in os.scandir(self.directory) if e.name.endswith(".calls.json")]
+        except FileNotFoundError:
+            return []
+        found = []
+        for e in entries:
+            mtime = e.stat().st_mtime
+            cached = self._sidecars.get(e.path)
+            if cached is None or cached[0] != mtime:
+                with open(e.path, "r", encoding="utf-8") as f:
+                    cached = (mtime, codec.loads(f.read()).get("call_ids") or [])
+                self._sidecars[e.path] = cached
+            ids = cached[1]
+            i = bisect.bisect_left(ids, call_id)
+            if i < len(ids) and ids[i] == call_id:
+                found.append(e.path[:-len(".calls.json")] + ".ndjson.gz")
+        return sorted(found)
+
+    def read_call(self, call_id: int) -> List[Dict[str, Any]]:
+        """
+        Archived events of one call (blocking, run it in a thread).
+        """
+        needle = f'"call_id":{int(call_id)},'
+        out: List[Dict[str, Any]] = []
+        for path in self.files_for(int(call_id)):
+            try:
+                with gzip.open(path, "rt", encoding="utf-8") as f:
+                    for line in f:
+                        if needle in line:
+                            out.append(codec.loads(line))
+            except (OSError, EOFError) as e:
+                print(f"[EVENTS] archive {os.path.basename(path)} unreadable: {e}")
+        return out
+
+
+archive = EventArchive(EVENTS_ARCHIVE_DIR)
+
+
+class EventRetention:
+    """
+    Periodic partition maintenance for call_events.
+    - keeps `ahead` monthly partitions after the current month split off p_future
+    - partitions whose upper bound is at or before the start of (current month - months)
+      are archived (when archive_dir is set) and dropped; months <= 0 keeps everything
+    A partition is only dropped after its archive and sidecar are fully written and
+    renamed into place. Only one worker process runs a pass at a time (GET_LOCK).
+    interval <= 0 disables the job.
+    """
+
+    def __init__(self, months: int = 6, interval: float = 3600, ahead: int = 2, archive_dir: str = ""):
+        self.months = int(months)
+        self.interval = float(interval)
+        self.ahead = max(1, int(ahead))
+        self.archive_dir = archive_dir
+        self.created = 0
+        self.dropped = 0
+        self.archived_rows = 0
+        self.last_run: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "partitions_created": self.created,
+            "partitions_dropped": self.dropped,
+            "archived_rows": self.archived_rows,
+            "last_run": self.last_run,
+        }
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"[EVENTS] retention pass failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self, today: Optional[date] = None):
+        today = today or date.today()
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT GET_LOCK(%s, 0)", (_LOCK,))
+                row = await cur.fetchone()
+                if not row or not row[0]:
+                    return
+                try:
+                    parts = await self._partitions(cur)
+                    if not parts:
+                        print("[EVENTS] call_events is not partitioned, apply install/migrations/002_call_events_partitions.sql")
+                        return
+                    await self._ensure_ahead(cur, parts, today)
+                    if self.months > 0:
+                        cutoff = _month_start(today, -self.months)
+                        for name, bound in parts:
+                            if bound is not None and bound <= cutoff:
+                                await self._retire(conn, name)
+                finally:
+                    await cur.execute("SELECT RELEASE_LOCK(%s)", (_LOCK,))
+        self.last_run = datetime.now().strftime(_TS_FMT)
+
+    async def _partitions(self, cur) -> List[Tuple[str, Optional[date]]]:
+        """
+        [(name, upper bound date or None for MAXVALUE)] in partition order.
+        """
+        await cur.execute(
+            "SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME='call_events' AND PARTITION_NAME IS NOT NULL "
+            "ORDER BY PARTITION_ORDINAL_POSITION"
+        )
+        out = []
+        for name, desc in await cur.fetchall():
+            out.append((name, None if str(desc).upper() == "MAXVALUE" else _from_days(int(desc))))
+        return out
+
+    async def _ensure_ahead(self, cur, parts: List[Tuple[str, Optional[date]]], today: date):
+        last = max((b for _, b in parts if b is not None), default=None)
+        ## split p_future while it is (almost always) empty, so the reorganize moves no rows
+        for i in range(1, self.ahead + 2):
+            bound = _month_start(today, i)
+            if last is not None and bound <= last:
+                continue
+            name = _partition_name(bound)
+            await cur.execute(
+                "ALTER TABLE call_events REORGANIZE PARTITION p_future INTO ("
+                f"PARTITION {name} VALUES LESS THAN ({_to_days(bound)}), "
+                "PARTITION p_future VALUES LESS THAN MAXVALUE)"
+            )
+            last = bound
+            self.created += 1
+            print(f"[EVENTS] added partition {name} (< {bound.isoformat()})")
+
+    async def _retire(self, conn, name: str):
+        if self.archive_dir:
+            rows = await self._archive(conn, name)
+            self.archived_rows += rows
+            print(f"[EVENTS] archived {rows} events of partition {name}")
+        async with conn.cursor() as cur:
+            await cur.execute(f"ALTER TABLE call_events DROP PARTITION {name}")
+        self.dropped += 1
+        print(f"[EVENTS] dropped partition {name}")
+
+    async def _archive(self, conn, name: str) -> int:
+        os.makedirs(self.archive_dir, exist_ok=True)
+        gz_path, ids_path = _archive_paths(self.archive_dir, name)
+        tmp = gz_path + ".part"
+        call_ids = set()
+        rows = 0
+        first = last = None
+        gz = await asyncio.to_thread(gzip.open, tmp, "wt", encoding="utf-8")
+        try:
+            ## unbuffered cursor: the partition is streamed, not loaded into memory
+            async with conn.cursor(aiomysql.SSCursor) as cur:
+                await cur.execute(
+                    f"SELECT id, call_id, user_id, event_type, payload, created_at "
+                    f"FROM call_events PARTITION ({name}) ORDER BY created_at, id"
+                )
+                while True:
+                    chunk = await cur.fetchmany(_FETCH_ROWS)
+                    if not chunk:
+                        break
+                    for r in chunk:
+                        call_ids.add(int(r[1]))
+                    first = first or chunk[0][5]
+                    last = chunk[-1][5]
+                    rows += len(chunk)
+                    ## compress off the event loop
+                    await asyncio.to_thread(gz.write, "".join(_event_line(r) for r in chunk))
+            await asyncio.to_thread(_close_synced, gz, tmp)
+        except BaseException:
+            gz.close()
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        if not rows:
+            os.remove(tmp)
+            return 0
+
+        side = {
+            "partition": name,
+            "rows": rows,
+            "from": first.strftime(_TS_FMT) if first else None,
+            "to": last.strftime(_TS_FMT) if last else None,
+            "call_ids": sorted(call_ids),
+        }
+        with open(ids_path + ".part", "w", encoding="utf-8") as f:
+            f.write(codec.dumps(side))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, gz_path)
+        os.replace(ids_path + ".part", ids_path)
+        return rows
+
+
+def _close_synced(gz, path: str):
+    gz.close()
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+retention = EventRetention(
+    months=EVENTS_RETENTION_MONTHS,
+    interval=EVENTS_RETENTION_INTERVAL,
+    ahead=EVENTS_PARTITIONS_AHEAD,
+    archive_dir=EVENTS_ARCHIVE_DIR if EVENTS_ARCHIVE else "",
+)
+
+
+## Reader
+
+async def load_call_events(call_id: int) -> List[Dict[str, Any]]:
+    """
+    All events of one call, oldest first: live rows from call_events plus rows from
+    archived partitions. The live query is bounded by the call's time window (with a
+    day of slack) so MariaDB only touches the partitions that can hold them.
+    """
+    archived = await asyncio.to_thread(archive.read_call, call_id)
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT started_at, COALESCE(ended_at, NOW()) FROM call_logs WHERE id=%s", (call_id,))
+            window = await cur.fetchone()
+            sql = "SELECT id, call_id, user_id, event_type, payload, created_at FROM call_events WHERE call_id=%s"
+            args: List[Any] = [call_id]
+            if window:
+                sql += " AND created_at >= %s AND created_at < %s"
+                args += [window[0] - timedelta(days=1), window[1] + timedelta(days=1)]
+            await cur.execute(sql, args)
+            live = [_event_dict(r) for r in await cur.fetchall()]
+
+    ## an archive may overlap live rows if a drop failed after archiving
+    seen = {e["id"] for e in live}
+    events = live + [e for e in archived if e["id"] not in seen]
+    events.sort(key=lambda e: (e["created_at"], e["id"]))
+    return events
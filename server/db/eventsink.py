@@ -0,0 +1,175 @@
+## Buffered call_events writer
+## add_event() callers only append to an in-memory buffer; a background task writes the
+## buffer with multi-row INSERTs once batch_max rows or flush_ms have accumulated.
+## Events written together with other rows in one transaction (participant join/leave,
+## finalize, recordings) do not go through here.
+
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from server.config import EVENTS_BATCH_MAX, EVENTS_FLUSH_MS, EVENTS_BUFFER_SIZE, EVENTS_OVERFLOW, EVENTS_RETRIES
+from server.db import get_pool, not_applied, rejected
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_new")
+
+## created_at is the DB clock (like the events written by server/db/calls.py) moved back by
+## the time the row spent in the buffer; it also picks the row's monthly partition
+_INSERT = "INSERT INTO call_events (call_id, user_id, event_type, payload, created_at) VALUES "
+_VALUES = "(%s, %s, %s, %s, NOW(6) - INTERVAL %s MICROSECOND)"
+
+## (call_id, user_id, event_type, payload json, time.monotonic() when added)
+Row = Tuple[int, Optional[int], str, Optional[str], float]
+
+
+class EventSink:
+    """
+    Bounded buffer of call_events rows plus one flusher task.
+    - created_at is the DB's time when the event was added, not when it is written
+    - when the buffer is full the overflow policy drops the oldest or the new row
+    - a batch that failed without being applied (see not_applied) is put back and retried
+      with backoff; after `retries` failures, or if the server rejected it, its rows are
+      inserted one by one so a single bad row cannot block the rest
+    - a batch that failed ambiguously (connection lost after the INSERT was sent) may be
+      in the table already, so it is counted as failed and not written again
+    - close() writes everything still buffered (app shutdown)
+    """
+
+    def __init__(self, batch_max: int = 200, flush_ms: int = 250, maxsize: int = 10000,
+                 overflow: str = "drop_oldest", retries: int = 3):
+        self.batch_max = max(1, int(batch_max))
+        self.flush_wait = max(0, int(flush_ms)) / 1000.0
+        self.maxsize = max(self.batch_max, int(maxsize))
+        self.overflow = overflow if overflow in OVERFLOW_POLICIES else "drop_oldest"
+        self.retries = max(0, int(retries))
+        self._buf: Deque[Row] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def add(self, call_id: int, user_id: Optional[int], event_type: str, payload: Optional[Dict[str, Any]]) -> bool:
+        """
+        Buffer one event row. Never waits; returns False if the row was dropped.
+        """
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        if len(self._buf) >= self.maxsize:
+            self.dropped += 1
+            if self.overflow == "drop_new":
+                print(f"[EVENTS] buffer full, dropped {event_type} call={call_id}")
+                return False
+            old = self._buf.popleft()
+            print(f"[EVENTS] buffer full, dropped oldest {old[2]} call={old[0]}")
+        self._buf.append((call_id, user_id, event_type, json.dumps(payload) if payload else None, time.monotonic()))
+        if len(self._buf) >= self.batch_max:
+            self._wakeup.set()
+        return True
+
+    def pending(self) -> int:
+        return len(self._buf)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._buf),
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+    async def close(self, timeout: float = 15.0):
+        """
+        Flush buffered rows and stop the flusher.
+        """
+        if self._task is None:
+            return
+        self._closing = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"[EVENTS] flush on shutdown timed out, {len(self._buf)} events lost")
+            self._task.cancel()
+        self._task = None
+        self._closing = False
+
+    async def _run(self):
+        failures = 0
+        while True:
+            if not self._closing and len(self._buf) < self.batch_max:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_wait)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+            if not self._buf:
+                if self._closing:
+                    return
+                continue
+
+            n = min(len(self._buf), self.batch_max)
+            batch: List[Row] = [self._buf.popleft() for _ in range(n)]
+            try:
+                await self._write(batch)
+                failures = 0
+                continue
+            except Exception as e:
+                error = e
+                failures += 1
+                print(f"[EVENTS] insert of {len(batch)} events failed (attempt {failures}): {e}")
+
+            if not not_applied(error) or failures > self.retries:
+                failures = 0
+                if not_applied(error) or (rejected(error) and len(batch) > 1):
+                    await self._write_each(batch)
+                else:
+                    ## ambiguous (the rows may be in already) or a single row the server refused
+                    self.failed += len(batch)
+                    print(f"[EVENTS] dropped {len(batch)} events, not retried: {error}")
+                continue
+            ## keep order: put the batch back in front, the overflow policy still bounds the buffer
+            self._buf.extendleft(reversed(batch))
+            while len(self._buf) > self.maxsize:
+                if self.overflow == "drop_new":
+                    self._buf.pop()
+                else:
+                    self._buf.popleft()
+                self.dropped += 1
+            await asyncio.sleep(min(5.0, 0.2 * (2 ** failures)))
+
+    async def _write(self, rows: List[Row]):
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                ## one multi-row statement, built here: executemany only does that for plain %s values
+                now = time.monotonic()
+                args: List[Any] = []
+                for call_id, user_id, event_type, payload, added in rows:
+                    args += (call_id, user_id, event_type, payload, int((now - added) * 1_000_000))
+                await cur.execute(_INSERT + ", ".join([_VALUES] * len(rows)), args)
+        self.written += len(rows)
+        self.batches += 1
+
+    async def _write_each(self, rows: List[Row]):
+        for row in rows:
+            try:
+                await self._write([row])
+            except Exception as e:
+                self.failed += 1
+                print(f"[EVENTS] dropped {row[2]} call={row[0]}: {e}")
+
+
+event_sink = EventSink(
+    batch_max=EVENTS_BATCH_MAX,
+    flush_ms=EVENTS_FLUSH_MS,
+    maxsize=EVENTS_BUFFER_SIZE,
+    overflow=EVENTS_OVERFLOW,
+    retries=EVENTS_RETRIES,
+)
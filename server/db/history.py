@@ -0,0 +1,73 @@
+## DB helpers for the call history API
+## Keyset pagination over call_logs (owner_id, started_at, id): idx_owner_started is
+## (owner_id, started_at) and InnoDB appends the primary key, so every page is an index
+## range scan that starts at the cursor, however deep the page is.
+## participants_json / recordings_json are returned as raw JSON text for the route to splice in.
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from server.db import get_pool
+
+_CALL_COLUMNS = (
+    "id, room_uid, started_at, ended_at, duration_sec, status, participant_count, "
+    "IF(JSON_VALID(participants_json), participants_json, NULL), "
+    "IF(JSON_VALID(recordings_json), recordings_json, NULL)"
+)
+
+
+async def list_owner_calls(owner_id: int, limit: int, before: Optional[Tuple[datetime, int]] = None) -> List[tuple]:
+    """
+    Calls of one owner, newest first. `before` is the (started_at, id) of the last
+    row of the previous page. Rows are tuples in _CALL_COLUMNS order.
+    """
+    sql = f"SELECT {_CALL_COLUMNS} FROM call_logs WHERE owner_id=%s "
+    args: List[Any] = [owner_id]
+    if before is not None:
+        ## spelled out rather than (started_at, id) < (%s, %s) so the optimizer uses a range on the index
+        sql += "AND (started_at < %s OR (started_at = %s AND id < %s)) "
+        args += [before[0], before[0], before[1]]
+    sql += "ORDER BY started_at DESC, id DESC LIMIT %s"
+    args.append(int(limit))
+
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(sql, args)
+            return list(await cur.fetchall())
+
+
+async def owner_has_call(owner_id: int, call_id: int) -> bool:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT 1 FROM call_logs WHERE id=%s AND owner_id=%s", (call_id, owner_id))
+            return await cur.fetchone() is not None
+
+
+async def get_owner_call(owner_id: int, call_id: int) -> Optional[Dict[str, Any]]:
+    """
+    One call of the owner with its participant and recording rows, or None.
+    """
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(f"SELECT {_CALL_COLUMNS} FROM call_logs WHERE id=%s AND owner_id=%s", (call_id, owner_id))
+            call = await cur.fetchone()
+            if not call:
+                return None
+            await cur.execute(
+                "SELECT u.tg_user_id, cp.display_name, cp.avatar_url, cp.first_joined_at, cp.last_left_at, "
+                "       cp.total_duration_sec, cp.joins_count "
+                "FROM call_participants cp JOIN users u ON u.id = cp.user_id "
+                "WHERE cp.call_id=%s ORDER BY cp.first_joined_at",
+                (call_id,)
+            )
+            participants = list(await cur.fetchall())
+            await cur.execute(
+                "SELECT file_name, started_at, ended_at, duration_sec, format, size_bytes, sent_to_bot "
+                "FROM call_recordings WHERE call_id=%s ORDER BY started_at",
+                (call_id,)
+            )
+            recordings = list(await cur.fetchall())
+    return {"call": call, "participants": participants, "recordings": recordings}
@@ -0,0 +1,247 @@
+## Shared MariaDB pool for the server and the bot
+## One place for MYSQL_* settings and pool behaviour: idle connection recycling,
+## pre-ping on checkout, bounded acquire wait, and stats (in use / idle / waiters,
+## acquire-wait and query-time histograms) for sizing the pool from real numbers.
+
+import asyncio
+import os
+import time
+from typing import Any, Dict, Optional
+
+import aiomysql
+from pymysql.err import MySQLError
+
+from server.utils.metrics import Histogram
+
+
+def _env(name: str, default: str = "", alt: str = "") -> str:
+    """
+    Read env with primary name first, then optional alt fallback, then default.
+    Primary names are MYSQL_* per project convention.
+    """
+    val = os.getenv(name)
+    if val is not None and val != "":
+        return val
+    if alt:
+        val = os.getenv(alt)
+        if val is not None and val != "":
+            return val
+    return default
+
+
+class PoolTimeout(Exception):
+    """
+    No connection became free within the acquire timeout.
+    """
+
+
+## MariaDB errors after which the statement is known not to have been applied:
+## too many connections, lock wait timeout, deadlock (transaction rolled back),
+## can't connect, server gone away (query never sent)
+_NOT_APPLIED = {1040, 1203, 1205, 1213, 2003, 2006}
+
+
+def not_applied(e: BaseException) -> bool:
+    """
+    True if nothing of the failed statement or transaction reached the database,
+    so running it again cannot apply it twice.
+    """
+    if isinstance(e, PoolTimeout):
+        return True
+    return isinstance(e, MySQLError) and bool(e.args) and e.args[0] in _NOT_APPLIED
+
+
+def rejected(e: BaseException) -> bool:
+    """
+    True if the server answered with an error (codes below 2000 are server side): the
+    statement or transaction was rolled back, but running it again would fail the same way.
+    Anything that is neither this nor not_applied (e.g. connection lost mid-query) is ambiguous.
+    """
+    return isinstance(e, MySQLError) and bool(e.args) and isinstance(e.args[0], int) and e.args[0] < 2000
+
+
+class TimedCursor(aiomysql.Cursor):
+    """
+    Cursor that records execute/executemany time into the pool's query histogram.
+    """
+
+    async def execute(self, query, args=None):
+        t0 = time.perf_counter()
+        try:
+            return await super().execute(query, args)
+        finally:
+            _observe_query(self, t0)
+
+    async def executemany(self, query, args):
+        t0 = time.perf_counter()
+        try:
+            return await super().executemany(query, args)
+        finally:
+            _observe_query(self, t0)
+
+
+class TimedDictCursor(aiomysql.DictCursor):
+    async def execute(self, query, args=None):
+        t0 = time.perf_counter()
+        try:
+            return await super().execute(query, args)
+        finally:
+            _observe_query(self, t0)
+
+    async def executemany(self, query, args):
+        t0 = time.perf_counter()
+        try:
+            return await super().executemany(query, args)
+        finally:
+            _observe_query(self, t0)
+
+
+def _observe_query(cur, t0: float):
+    hist = getattr(cur.connection, "query_ms", None)
+    if hist is not None:
+        hist.observe((time.perf_counter() - t0) * 1000)
+
+
+class _Checkout:
+    def __init__(self, pool: "DBPool"):
+        self._pool = pool
+        self._conn = None
+
+    async def __aenter__(self):
+        self._conn = await self._pool._checkout()
+        return self._conn
+
+    async def __aexit__(self, exc_type, exc, tb):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            await self._pool.release(conn)
+
+
+class DBPool:
+    """
+    aiomysql pool wrapper, used as `async with pool.acquire() as conn`.
+    - recycle: close connections idle longer than this (seconds, -1 off) instead of reusing them
+    - ping_idle: ping (and transparently reconnect) a connection idle longer than this
+      before handing it out (seconds, -1 off)
+    - acquire_timeout: raise PoolTimeout after waiting this long for a free connection (0 = wait forever)
+    """
+
+    def __init__(self, minsize: int = 1, maxsize: int = 5, recycle: float = 3600, ping_idle: float = 30,
+                 acquire_timeout: float = 10, **connect_kwargs):
+        self.minsize = max(0, int(minsize))
+        self.maxsize = max(1, int(maxsize), self.minsize)
+        self.recycle = float(recycle)
+        self.ping_idle = float(ping_idle)
+        self.acquire_timeout = float(acquire_timeout)
+        self.connect_kwargs = connect_kwargs
+        self._pool: Optional[aiomysql.Pool] = None
+        self.waiters = 0
+        self.acquired = 0
+        self.timeouts = 0
+        self.pings = 0
+        self.acquire_ms = Histogram()
+        self.query_ms = Histogram()
+
+    async def start(self):
+        if self._pool is None:
+            self._pool = await aiomysql.create_pool(
+                minsize=self.minsize,
+                maxsize=self.maxsize,
+                pool_recycle=int(self.recycle) if self.recycle >= 0 else -1,
+                cursorclass=TimedCursor,
+                autocommit=True,
+                charset="utf8mb4",
+                **self.connect_kwargs,
+            )
+        return self
+
+    def acquire(self) -> _Checkout:
+        return _Checkout(self)
+
+    async def _checkout(self):
+        t0 = time.perf_counter()
+        self.waiters += 1
+        try:
+            if self.acquire_timeout > 0:
+                conn = await asyncio.wait_for(self._pool.acquire(), timeout=self.acquire_timeout)
+            else:
+                conn = await self._pool.acquire()
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise PoolTimeout(
+                f"no DB connection within {self.acquire_timeout:g}s "
+                f"(size={self._pool.size} free={self._pool.freesize} waiters={self.waiters - 1})"
+            ) from None
+        finally:
+            self.waiters -= 1
+        self.acquire_ms.observe((time.perf_counter() - t0) * 1000)
+        self.acquired += 1
+        conn.query_ms = self.query_ms
+
+        if self.ping_idle >= 0 and asyncio.get_running_loop().time() - conn.last_usage > self.ping_idle:
+            self.pings += 1
+            try:
+                await conn.ping(reconnect=True)
+            except Exception:
+                conn.close()
+                self._pool.release(conn)
+                raise
+        return conn
+
+    async def release(self, conn):
+        self._pool.release(conn)
+
+    async def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+            self._pool = None
+
+    @property
+    def size(self) -> int:
+        return self._pool.size if self._pool else 0
+
+    @property
+    def freesize(self) -> int:
+        return self._pool.freesize if self._pool else 0
+
+    def stats(self) -> Dict[str, Any]:
+        size = self.size
+        idle = self.freesize
+        return {
+            "minsize": self.minsize,
+            "maxsize": self.maxsize,
+            "size": size,
+            "in_use": size - idle,
+            "idle": idle,
+            "waiters": self.waiters,
+            "acquired": self.acquired,
+            "timeouts": self.timeouts,
+            "pings": self.pings,
+            "acquire_ms": self.acquire_ms.snapshot(),
+            "query_ms": self.query_ms.snapshot(),
+        }
+
+
+def pool_from_env(default_max: int = 5) -> DBPool:
+    """
+    Build (not start) a pool from MYSQL_* environment variables.
+    Required:
+      - MYSQL_HOST, MYSQL_PORT, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DB
+    Optional:
+      - MYSQL_POOL_MIN (default 1), MYSQL_POOL_MAX (default default_max)
+      - MYSQL_POOL_RECYCLE seconds (default 3600), MYSQL_POOL_PING_IDLE seconds (default 30)
+      - MYSQL_POOL_ACQUIRE_TIMEOUT seconds (default 10, 0 = no limit)
+    """
+    return DBPool(
+        host=_env("MYSQL_HOST", "127.0.0.1", alt="DB_HOST"),
+        port=int(_env("MYSQL_PORT", "3306", alt="DB_PORT") or "3306"),
+        user=_env("MYSQL_USER", "root", alt="DB_USER"),
+        password=_env("MYSQL_PASSWORD", "", alt="DB_PASSWORD"),
+        db=_env("MYSQL_DB", "tgringer01", alt="DB_NAME"),
+        minsize=int(_env("MYSQL_POOL_MIN", "1", alt="DB_POOL_MIN") or "1"),
+        maxsize=int(_env("MYSQL_POOL_MAX", str(default_max), alt="DB_POOL_MAX") or str(default_max)),
+        recycle=float(_env("MYSQL_POOL_RECYCLE", "3600")),
+        ping_idle=float(_env("MYSQL_POOL_PING_IDLE", "30")),
+        acquire_timeout=float(_env("MYSQL_POOL_ACQUIRE_TIMEOUT", "10")),
+    )
@@ -1,51 +1,60 @@
 ## DB helpers for recording routes: owner resolution and call resolution
 ## All DB access is centralized here.
+## The recording routes consult server/utils/calldir.py first; these run on a directory miss.
 
-from typing import Optional
+from typing import Optional, Tuple
 
 from server.db import get_pool
-from server.db import calls as callsdb
+from server.db.usercache import user_ids
 
 
-async def fallback_owner_uid(room_uid: str) -> Optional[str]:
+async def resolve_room_call(
+    room_uid: str,
+    owner_tg_uid: Optional[str] = None,
+    rec_started_ts: Optional[int] = None,
+) -> Tuple[Optional[str], Optional[int]]:
     """
-    Best-effort resolve current or last owner Telegram user id (tg_user_id) for the room.
-    - Prefer an active (not ended) call for the room
-    - Otherwise, take the most recent call's owner
-    Returns tg_user_id as string, or None.
+    Resolve (owner tg_user_id, call_logs.id) for the room in one query.
+    - Prefer an active (not ended) call, otherwise the most recent one
+    - owner_tg_uid restricts the match to calls of that owner
+    - rec_started_ts restricts ended calls to those started at or before the recording
+    Returns (None, None) when nothing matches.
     """
+    sql = (
+        "SELECT u.tg_user_id, u.id, cl.id "
+        "FROM call_logs cl "
+        "JOIN users u ON u.id = cl.owner_id "
+        "WHERE cl.room_uid=%s"
+    )
+    args: list = [room_uid]
+    if owner_tg_uid:
+        sql += " AND u.tg_user_id=%s"
+        args.append(owner_tg_uid)
+    if rec_started_ts is not None:
+        sql += " AND (cl.ended_at IS NULL OR cl.started_at<=FROM_UNIXTIME(%s))"
+        args.append(int(rec_started_ts))
+    sql += " ORDER BY (cl.ended_at IS NULL) DESC, cl.started_at DESC LIMIT 1"
     try:
         pool = await get_pool()
         async with pool.acquire() as conn:
             async with conn.cursor() as cur:
-                ## Prefer active call owner
-                await cur.execute(
-                    "SELECT u.tg_user_id "
-                    "FROM call_logs cl "
-                    "JOIN users u ON u.id = cl.owner_id "
-                    "WHERE cl.room_uid=%s AND cl.ended_at IS NULL "
-                    "ORDER BY cl.started_at DESC LIMIT 1",
-                    (room_uid,)
-                )
+                await cur.execute(sql, args)
                 row = await cur.fetchone()
-                if row and row[0]:
-                    return str(row[0])
-
-                ## Otherwise, last call owner
-                await cur.execute(
-                    "SELECT u.tg_user_id "
-                    "FROM call_logs cl "
-                    "JOIN users u ON u.id = cl.owner_id "
-                    "WHERE cl.room_uid=%s "
-                    "ORDER BY cl.started_at DESC LIMIT 1",
-                    (room_uid,)
-                )
-                row = await cur.fetchone()
-                if row and row[0]:
-                    return str(row[0])
+        if row and row[0]:
+            user_ids.put(str(row[0]), int(row[1]))  ## add_event/add_recording usually follow
+            return str(row[0]), int(row[2])
     except Exception as e:
-        print(f"[DB:recording] fallback_owner_uid failed (ignored): {e}")
-    return None
+        print(f"[DB:recording] resolve_room_call failed (ignored): {e}")
+    return None, None
+
+
+async def fallback_owner_uid(room_uid: str) -> Optional[str]:
+    """
+    Best-effort resolve current or last owner Telegram user id (tg_user_id) for the room.
+    Returns tg_user_id as string, or None.
+    """
+    owner, _ = await resolve_room_call(room_uid)
+    return owner
 
 
 async def resolve_call_id(room_uid: str, owner_tg_uid: str, rec_started_ts: int) -> Optional[int]:
@@ -54,35 +63,5 @@ async def resolve_call_id(room_uid: str, owner_tg_uid: str, rec_started_ts: int)
     If none active, pick the latest call started at or before recording start time.
     Returns call_logs.id or None.
     """
-    try:
-        pool = await get_pool()
-        async with pool.acquire() as conn:
-            async with conn.cursor() as cur:
-                owner_id = await callsdb.get_user_id_by_tg(owner_tg_uid)
-                if not owner_id:
-                    return None
-
-                ## Prefer active call
-                await cur.execute(
-                    "SELECT id FROM call_logs "
-                    "WHERE room_uid=%s AND owner_id=%s AND ended_at IS NULL "
-                    "ORDER BY started_at DESC LIMIT 1",
-                    (room_uid, owner_id)
-                )
-                row = await cur.fetchone()
-                if row and row[0]:
-                    return int(row[0])
-
-                ## Fallback to latest call started before recording
-                await cur.execute(
-                    "SELECT id FROM call_logs "
-                    "WHERE room_uid=%s AND owner_id=%s AND started_at<=FROM_UNIXTIME(%s) "
-                    "ORDER BY started_at DESC LIMIT 1",
-                    (room_uid, owner_id, rec_started_ts)
-                )
-                row = await cur.fetchone()
-                if row and row[0]:
-                    return int(row[0])
-    except Exception as e:
-        print(f"[DB:recording] resolve_call_id failed (ignored): {e}")
-    return None
+    _, call_id = await resolve_room_call(room_uid, owner_tg_uid, rec_started_ts)
+    return call_id
@@ -0,0 +1,201 @@
+## Daily usage rollups: usage_daily_owner (day x owner) and usage_daily_participant (day x user)
+## A rollup row is never incremented, it is recomputed from the raw rows of its (key, day), which is
+## one short index range (idx_owner_started / idx_cp_user_first). So refreshing a row twice is
+## harmless and the two writers below cannot double count:
+##   - finalize_call / participant_leave refresh the rows they touch in their own transaction
+##   - RollupJob walks call_logs by (ended_at, id) from a watermark and refreshes every row that
+##     finished calls map to (backfill, rows missed while ROLLUP_ON_WRITE was off, failed writes)
+
+import asyncio
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from server.config import ROLLUP_INTERVAL, ROLLUP_BATCH, ROLLUP_LAG_SEC
+from server.db import get_pool
+
+_WATERMARK = "call_logs"
+_LOCK = "tgringer_usage_rollup"
+
+
+## Refresh statements; `keys` is a derived table of (owner_id | user_id, d) pairs to recompute
+
+def refresh_owner_days_sql(keys: str) -> str:
+    return (
+        "INSERT INTO usage_daily_owner (day, owner_id, calls, completed_calls, solo_calls, duration_sec, participants) "
+        "SELECT k.d, c.owner_id, COUNT(*), SUM(c.status='completed'), SUM(c.status='solo'), "
+        "       COALESCE(SUM(c.duration_sec), 0), SUM(c.participant_count) "
+        f"FROM ({keys}) k "
+        "JOIN call_logs c ON c.owner_id=k.owner_id AND c.started_at >= k.d AND c.started_at < k.d + INTERVAL 1 DAY "
+        "WHERE c.ended_at IS NOT NULL "
+        "GROUP BY k.d, c.owner_id "
+        "ON DUPLICATE KEY UPDATE calls=VALUES(calls), completed_calls=VALUES(completed_calls), "
+        "  solo_calls=VALUES(solo_calls), duration_sec=VALUES(duration_sec), participants=VALUES(participants)"
+    )
+
+
+def refresh_participant_days_sql(keys: str) -> str:
+    return (
+        "INSERT INTO usage_daily_participant (day, user_id, calls, joins, duration_sec) "
+        "SELECT k.d, p.user_id, COUNT(*), SUM(p.joins_count), SUM(p.total_duration_sec) "
+        f"FROM ({keys}) k "
+        "JOIN call_participants p ON p.user_id=k.user_id "
+        "  AND p.first_joined_at >= k.d AND p.first_joined_at < k.d + INTERVAL 1 DAY "
+        "GROUP BY k.d, p.user_id "
+        "ON DUPLICATE KEY UPDATE calls=VALUES(calls), joins=VALUES(joins), duration_sec=VALUES(duration_sec)"
+    )
+
+
+## Keys for one call (finalize_call) and for one participant of one call (participant_leave)
+OWNER_DAY_OF_CALL = "SELECT owner_id, DATE(started_at) AS d FROM call_logs WHERE id=%s"
+PARTICIPANT_DAY_OF_CALL_USER = (
+    "SELECT p.user_id, DATE(p.first_joined_at) AS d FROM call_participants p "
+    "JOIN users u ON u.id=p.user_id WHERE p.call_id=%s AND u.tg_user_id=%s"
+)
+
+
+class RollupJob:
+    """
+    Periodic catch-up of the daily rollups.
+    Each run takes finished calls after the watermark in (ended_at, id) order, batch rows at a
+    time, refreshes the owner and participant days they map to and moves the watermark, all in
+    one transaction per batch; it loops until it is caught up.
+    Calls that ended less than lag seconds ago are left for the next run, so a finalize that
+    commits late with an earlier ended_at is not skipped.
+    Only one worker process runs a pass at a time (GET_LOCK). interval <= 0 disables the job.
+    """
+
+    def __init__(self, interval: float = 300, batch: int = 500, lag: int = 60):
+        self.interval = float(interval)
+        self.batch = max(1, int(batch))
+        self.lag = max(0, int(lag))
+        self.calls = 0
+        self.runs = 0
+        self.last_run: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"runs": self.runs, "calls": self.calls, "last_run": self.last_run}
+
+    async def _run(self):
+        while True:
+            try:
+                n = await self.run_once()
+                if n:
+                    print(f"[ROLLUP] folded {n} calls into daily usage")
+            except Exception as e:
+                print(f"[ROLLUP] catch-up failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self) -> int:
+        """
+        Fold everything after the watermark. Returns the number of calls processed
+        (0 if another worker holds the lock).
+        """
+        pool = await get_pool()
+        total = 0
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT GET_LOCK(%s, 0)", (_LOCK,))
+                row = await cur.fetchone()
+                if not row or not row[0]:
+                    return 0
+                try:
+                    while True:
+                        n = await self._step(conn, cur)
+                        total += n
+                        if n < self.batch:
+                            break
+                finally:
+                    await cur.execute("SELECT RELEASE_LOCK(%s)", (_LOCK,))
+        self.calls += total
+        self.runs += 1
+        self.last_run = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return total
+
+    async def _step(self, conn, cur) -> int:
+        await cur.execute(
+            "SELECT last_ended_at, last_call_id FROM usage_rollup_state WHERE name=%s", (_WATERMARK,)
+        )
+        row = await cur.fetchone()
+        wm_at, wm_id = (row[0], int(row[1])) if row else (datetime(1970, 1, 1), 0)
+
+        ## idx_ended range scan; (ended_at, id) ties are broken by id
+        await cur.execute(
+            "SELECT id, ended_at FROM call_logs "
+            "WHERE ended_at >= %s AND (ended_at > %s OR id > %s) "
+            "  AND ended_at <= NOW() - INTERVAL %s SECOND "
+            "ORDER BY ended_at, id LIMIT %s",
+            (wm_at, wm_at, wm_id, self.lag, self.batch)
+        )
+        calls = list(await cur.fetchall())
+        if not calls:
+            return 0
+        ids = ",".join(str(int(c[0])) for c in calls)
+        last_id, last_at = int(calls[-1][0]), calls[-1][1]
+
+        await conn.begin()
+        try:
+            await cur.execute(refresh_owner_days_sql(
+                f"SELECT DISTINCT owner_id, DATE(started_at) AS d FROM call_logs WHERE id IN ({ids})"
+            ))
+            await cur.execute(refresh_participant_days_sql(
+                f"SELECT DISTINCT user_id, DATE(first_joined_at) AS d FROM call_participants WHERE call_id IN ({ids})"
+            ))
+            await cur.execute(
+                "INSERT INTO usage_rollup_state (name, last_ended_at, last_call_id) VALUES (%s, %s, %s) "
+                "ON DUPLICATE KEY UPDATE last_ended_at=VALUES(last_ended_at), last_call_id=VALUES(last_call_id)",
+                (_WATERMARK, last_at, last_id)
+            )
+            await conn.commit()
+        except Exception:
+            await conn.rollback()
+            raise
+        return len(calls)
+
+
+## Queries (primary key ranges, one row per day)
+
+async def owner_days(owner_id: int, day_from: date, day_to: date) -> List[Tuple]:
+    """
+    (day, calls, completed_calls, solo_calls, duration_sec, participants) per day, oldest first.
+    """
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "SELECT day, calls, completed_calls, solo_calls, duration_sec, participants "
+                "FROM usage_daily_owner WHERE owner_id=%s AND day BETWEEN %s AND %s ORDER BY day",
+                (owner_id, day_from, day_to)
+            )
+            return list(await cur.fetchall())
+
+
+async def participant_days(user_id: int, day_from: date, day_to: date) -> List[Tuple]:
+    """
+    (day, calls, joins, duration_sec) per day, oldest first.
+    """
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "SELECT day, calls, joins, duration_sec "
+                "FROM usage_daily_participant WHERE user_id=%s AND day BETWEEN %s AND %s ORDER BY day",
+                (user_id, day_from, day_to)
+            )
+            return list(await cur.fetchall())
+
+
+rollup_job = RollupJob(interval=ROLLUP_INTERVAL, batch=ROLLUP_BATCH, lag=ROLLUP_LAG_SEC)
@@ -0,0 +1,103 @@
+## In-process cache for tg_user_id -> users.id
+## The mapping never changes once a user row exists, so lookups on the signaling and
+## recording paths are served from memory; unknown users are cached briefly (negative TTL)
+## so a user registering with the bot shows up again within that window.
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from server.config import USER_CACHE_SIZE, USER_CACHE_TTL, USER_CACHE_NEG_TTL
+
+
+class AsyncTTLCache:
+    """
+    Bounded LRU with per-entry expiry for async loaders.
+    - found values live ttl seconds, None (not found) lives negative_ttl seconds
+    - concurrent misses for one key share a single loader call (single flight)
+    - loader errors are not cached; every waiter of that flight gets the error
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 3600.0, negative_ttl: float = 30.0):
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = float(ttl)
+        self.negative_ttl = float(negative_ttl)
+        self._data: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    async def get(self, key: Hashable, loader: Callable[[Hashable], Awaitable[Any]]) -> Any:
+        while True:
+            entry = self._data.get(key)
+            if entry is not None:
+                if entry[1] > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._data[key]
+
+            fut = self._inflight.get(key)
+            if fut is None:
+                break
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(fut)
+            except asyncio.CancelledError:
+                if fut.cancelled():
+                    continue  ## the loading caller was cancelled: try again ourselves
+                raise
+
+        self.misses += 1
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            value = await loader(key)
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except Exception as e:
+            fut.set_exception(e)
+            fut.exception()  ## mark retrieved: no waiters is fine
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        self.put(key, value)
+        fut.set_result(value)
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        ttl = self.ttl if value is not None else self.negative_ttl
+        if ttl <= 0:
+            self._data.pop(key, None)
+            return
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+## Shared by server/db/calls.py and server/db/recording.py
+user_ids = AsyncTTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL, negative_ttl=USER_CACHE_NEG_TTL)
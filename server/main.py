@@ -6,10 +6,19 @@ from fastapi.middleware.cors import CORSMiddleware
 from server.routes.app import router as app_router
 from server.routes.invite import router as invite_router
 from server.routes.login import router as login_router
-from server.routes.ws import router as ws_router
+from server.routes.ws import router as ws_router, rooms as ws_rooms, heartbeat as ws_heartbeat
+from server.db.accounting import accounting
+from server.db.eventsink import event_sink
+from server.db.usage import rollup_job
+from server.db.eventarchive import retention as events_retention
+from server.utils.transcode import transcoder
+from server.utils.chunkwriter import chunk_writer
+from server.db import close_pool
 from server.routes.health import router as health_router
 from server.routes.avatar import router as avatar_router
-from server.routes.record import router as record_router
+from server.routes.record import router as record_router, recover_recordings, sweeper as record_sweeper
+from server.routes.calls import router as calls_router
+from server.routes.usage import router as usage_router
 from bot.routes.record_notify import router as bot_record_router
 from server.routes.bot_send_record import router as bot_send_router
 
@@ -35,6 +44,8 @@ app.include_router(ws_router)
 app.include_router(health_router)
 app.include_router(avatar_router)
 app.include_router(record_router)
+app.include_router(calls_router)
+app.include_router(usage_router)
 app.include_router(bot_record_router)
 app.include_router(bot_send_router)
 
@@ -44,6 +55,29 @@ os.makedirs(static_dir, exist_ok=True)
 app.mount("/static", StaticFiles(directory=static_dir), name="static")
 
 
+@app.on_event("startup")
+async def on_startup():
+    rollup_job.start()
+    events_retention.start()
+    transcoder.start()
+    await recover_recordings()
+    record_sweeper.start()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await rollup_job.close()
+    await events_retention.close()
+    await record_sweeper.close()
+    await transcoder.close()
+    await chunk_writer.close_all()  ## after the sweeper: it may still finalize sessions
+    await ws_heartbeat.close()
+    await accounting.close()
+    await event_sink.close()  ## after accounting: draining it may still add events
+    await close_pool()
+    await ws_rooms.close()
+
+
 @app.get("/")
 async def root():
     return {"ok": True, "msg": "Tgringer server running"}
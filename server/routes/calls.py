@@ -0,0 +1,119 @@
+## Call history API (owner scoped, read only)
+## GET /calls/{owner_uid}?limit=20&cursor=...  calls newest first, keyset pagination via next_cursor
+## GET /calls/{owner_uid}/{call_id}            one call with its participant and recording rows
+## GET /calls/{owner_uid}/{call_id}/events     event journal of one call (live partitions + archive)
+## List items splice participants_json / recordings_json into the response as stored (no re-parse).
+## Only owner_uid itself (Telegram WebApp initData) or an internal caller may read (server/utils/tgauth.py).
+
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response
+
+from server.db import calls as callsdb
+from server.db import history as historydb
+from server.db.eventarchive import load_call_events
+from server.utils import codec
+from server.utils.tgauth import require_user
+
+router = APIRouter()
+
+PAGE_DEFAULT = 20
+PAGE_MAX = 100
+_TS_FMT = "%Y-%m-%dT%H:%M:%S"
+
+
+def _ts(v: Optional[datetime]) -> Optional[str]:
+    return v.strftime(_TS_FMT) if v else None
+
+
+def _encode_cursor(started_at: datetime, call_id: int) -> str:
+    raw = f"{started_at.strftime(_TS_FMT)}|{call_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, call_id = raw.split("|", 1)
+        return datetime.strptime(ts, _TS_FMT), int(call_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+
+def _call_json(row) -> str:
+    head = codec.dumps({
+        "id": int(row[0]),
+        "room_uid": row[1],
+        "started_at": _ts(row[2]),
+        "ended_at": _ts(row[3]),
+        "duration_sec": row[4],
+        "status": row[5],
+        "participant_count": int(row[6] or 0),
+    })
+    ## JSON columns are validated in SQL (NULL if not valid JSON)
+    return f'{head[:-1]},"participants":{row[7] or "null"},"recordings":{row[8] or "null"}}}'
+
+
+@router.get("/calls/{owner_uid}")
+async def list_calls(request: Request, owner_uid: str, limit: int = PAGE_DEFAULT, cursor: str = ""):
+    require_user(request, owner_uid)
+    limit = max(1, min(int(limit), PAGE_MAX))
+    before = _decode_cursor(cursor) if cursor else None
+    owner_id = await callsdb.get_user_id_by_tg(owner_uid)
+    rows = await historydb.list_owner_calls(owner_id, limit + 1, before) if owner_id else []
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1][2], int(rows[-1][0]))
+    body = '{"items":[' + ",".join(_call_json(r) for r in rows) + '],"next_cursor":' + codec.dumps(next_cursor) + "}"
+    return Response(content=body, media_type="application/json")
+
+
+@router.get("/calls/{owner_uid}/{call_id}")
+async def get_call(request: Request, owner_uid: str, call_id: int):
+    require_user(request, owner_uid)
+    owner_id = await callsdb.get_user_id_by_tg(owner_uid)
+    found = await historydb.get_owner_call(owner_id, call_id) if owner_id else None
+    if not found:
+        raise HTTPException(status_code=404, detail="Call not found")
+
+    participants = [
+        {
+            "uid": str(p[0]),
+            "name": p[1] or "",
+            "avatar": p[2] or "",
+            "first_joined_at": _ts(p[3]),
+            "last_left_at": _ts(p[4]),
+            "total_duration_sec": int(p[5] or 0),
+            "joins_count": int(p[6] or 0),
+        }
+        for p in found["participants"]
+    ]
+    recordings = [
+        {
+            "file_name": r[0],
+            "started_at": _ts(r[1]),
+            "ended_at": _ts(r[2]),
+            "duration_sec": r[3],
+            "format": r[4],
+            "size_bytes": r[5],
+            "sent_to_bot": bool(r[6]),
+        }
+        for r in found["recordings"]
+    ]
+    head = _call_json(found["call"])
+    body = f'{head[:-1]},"participant_rows":{codec.dumps(participants)},"recording_rows":{codec.dumps(recordings)}}}'
+    return Response(content=body, media_type="application/json")
+
+
+@router.get("/calls/{owner_uid}/{call_id}/events")
+async def get_call_events(request: Request, owner_uid: str, call_id: int):
+    require_user(request, owner_uid)
+    owner_id = await callsdb.get_user_id_by_tg(owner_uid)
+    if not owner_id or not await historydb.owner_has_call(owner_id, call_id):
+        raise HTTPException(status_code=404, detail="Call not found")
+    return {"call_id": call_id, "events": await load_call_events(call_id)}
@@ -1,8 +1,29 @@
-from fastapi import APIRouter
-
-router = APIRouter()
-
-
-@router.get("/health")
-async def health():
-    return {"ok": True}
+from fastapi import APIRouter
+
+from server.db import pool_stats
+from server.db.usercache import user_ids
+from server.db.eventsink import event_sink
+from server.db.usage import rollup_job
+from server.db.eventarchive import retention as events_retention
+from server.utils.calldir import call_directory
+from server.utils.transcode import transcoder
+from server.routes.record import sweeper as record_sweeper
+from server.utils.chunkwriter import chunk_writer
+
+router = APIRouter()
+
+
+@router.get("/health")
+async def health():
+    return {
+        "ok": True,
+        "db_pool": pool_stats(),
+        "user_cache": user_ids.stats(),
+        "events": event_sink.stats(),
+        "rollups": rollup_job.stats(),
+        "events_retention": events_retention.stats(),
+        "call_directory": call_directory.stats(),
+        "transcode": transcoder.stats(),
+        "recordings": record_sweeper.stats(),
+        "chunk_writer": chunk_writer.stats(),
+    }
@@ -1,17 +1,21 @@
 ## Recording routes with selectable pipeline (A or B) via RECORD_PIPELINE_MODE
-## - A: single .webm accumulation (+ optional mp4 transcode)
+## - A: single .webm accumulation (+ optional mp4 transcode as a background job, GET /record/jobs/{id})
 ## - B: FIFO -> ffmpeg segmentation to mp4 chunks, concat to final on finish
 ## Features:
-## - owner_uid/chat_id from client + DB fallback (moved to server/db/)
+## - owner_uid/chat_id from client, then the in-process call directory, then one DB query
 ## - absolute URL for bot notify using APP_BASE_URL
 ## - best-effort DB logging (events + recordings), errors do not fail API
 ## - detailed logs for start/chunk/finish and bot delivery
+## - session manifests on disk (server/utils/recstate.py): restart recovery and an idle sweeper;
+##   a paused client sends no chunks and pings /record/ping instead
+## - A chunks are appended off the event loop by server/utils/chunkwriter.py (coalescing, fsync policy)
 
+import asyncio
 import os
 import time
 import shutil
 import subprocess
-from typing import Dict, Optional, Any, List
+from typing import Dict, Optional, Any, List, Tuple
 
 import httpx
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form
@@ -27,10 +31,16 @@ from server.config import (
     RECORD_TARGET_FPS,
     RECORD_TARGET_GOP,
     RECORD_SEGMENT_TIME,
+    RECORD_SESSION_IDLE_SEC,
+    RECORD_SESSION_PAUSED_IDLE_SEC,
+    RECORD_SWEEP_INTERVAL,
 )
 from server.db import calls as callsdb
-from server.db.recording import fallback_owner_uid as db_fallback_owner_uid
-from server.db.recording import resolve_call_id as db_resolve_call_id
+from server.db.recording import resolve_room_call as db_resolve_room_call
+from server.utils.calldir import call_directory
+from server.utils.transcode import TranscodeJob, transcoder
+from server.utils.recstate import SessionSweeper, last_activity, store
+from server.utils.chunkwriter import chunk_writer
 
 RECORD_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "static", "records"))
 os.makedirs(RECORD_DIR, exist_ok=True)
@@ -39,7 +49,7 @@ APP_BASE_URL = (os.environ.get("APP_BASE_URL", "") or os.environ.get("PUBLIC_BAS
 
 router = APIRouter()
 
-## Active recording sessions in memory
+## Active recording sessions in memory (mirrored as manifests in the recording state store)
 ACTIVE: Dict[str, Dict[str, Any]] = {}
 
 
@@ -100,6 +110,19 @@ def _ffmpeg_segment_cmd_for_fifo(fifo_path: str, out_pattern: str, segment_time:
     ]
 
 
+async def _resolve_room(room_id: str, owner_uid: str, started_ts: int) -> Tuple[str, Optional[int]]:
+    """
+    (owner_uid, call_id) for a recording: the call directory fed by signaling first,
+    one combined DB query when it has no entry, a different owner, or no call id yet.
+    owner_uid may be empty (browser without WebApp data); the room's owner is used then.
+    """
+    got_owner, call_id = call_directory.lookup(room_id, owner_uid)
+    if got_owner and call_id:
+        return got_owner, call_id
+    db_owner, db_call_id = await db_resolve_room_call(room_id, owner_uid or got_owner or None, started_ts)
+    return (owner_uid or got_owner or db_owner or ""), db_call_id
+
+
 def _absolute_url(u: str) -> str:
     if not u:
         return u
@@ -110,6 +133,11 @@ def _absolute_url(u: str) -> str:
     return u
 
 
+async def _activate(recording_id: str, session: Dict[str, Any]):
+    ACTIVE[recording_id] = session
+    await store.asave_session(recording_id, session)
+
+
 @router.post("/record/start")
 async def record_start(
     room_id: str = Form(...),
@@ -118,14 +146,12 @@ async def record_start(
 ):
     started_ts = str(int(time.time()))
 
-    ## Owner fallback if empty (common in browser non-WebView)
-    if not owner_uid:
-        try:
-            got = await db_fallback_owner_uid(room_id)
-            if got:
-                owner_uid = got
-        except Exception as e:
-            print(f"[RECORD] owner_uid fallback at start failed: {e}")
+    ## Owner fallback if empty (common in browser non-WebView) and the call for DB events
+    call_id = None
+    try:
+        owner_uid, call_id = await _resolve_room(room_id, owner_uid, int(started_ts))
+    except Exception as e:
+        print(f"[RECORD] owner/call resolve at start failed: {e}")
 
     owner_uid_for_base = owner_uid or "unknown"
     recording_id = f"{room_id}-{owner_uid_for_base}-{started_ts}"
@@ -144,11 +170,11 @@ async def record_start(
         "started_ts": started_ts,
         "base": base,
         "last_seq": 0,
+        "last_activity": time.time(),
     }
 
     ## DB event
     try:
-        call_id = await db_resolve_call_id(room_id, owner_uid, int(started_ts)) if owner_uid else None
         if call_id:
             await callsdb.add_event(call_id, None, "record_start", {"ts": started_ts})
         session["call_id"] = call_id
@@ -168,7 +194,7 @@ async def record_start(
             raise HTTPException(status_code=500, detail=f"Cannot open file: {e}")
         session["part_path"] = part_path
         session["file_handle"] = fh
-        ACTIVE[recording_id] = session
+        await _activate(recording_id, session)
         return {"ok": True, "recording_id": recording_id, "started_ts": started_ts}
 
     ## mode == "B"
@@ -191,7 +217,7 @@ async def record_start(
         session["fifo_writer"] = writer
         session["ffmpeg_proc"] = proc
 
-        ACTIVE[recording_id] = session
+        await _activate(recording_id, session)
         return {"ok": True, "recording_id": recording_id, "started_ts": started_ts}
 
     except Exception as e:
@@ -218,7 +244,7 @@ async def record_start(
         session.pop("ffmpeg_proc", None)
         session["part_path"] = part_path
         session["file_handle"] = fh
-        ACTIVE[recording_id] = session
+        await _activate(recording_id, session)
         return {"ok": True, "recording_id": recording_id, "started_ts": started_ts}
 
 
@@ -231,7 +257,15 @@ async def record_chunk(
     session = ACTIVE.get(recording_id)
     if not session:
         raise HTTPException(status_code=404, detail="No active recording")
+    ## the idle sweeper leaves the session alone until this chunk is written
+    session["writing"] = session.get("writing", 0) + 1
+    try:
+        return await _write_chunk(recording_id, session, seq, file)
+    finally:
+        session["writing"] -= 1
+
 
+async def _write_chunk(recording_id: str, session: Dict[str, Any], seq: int, file: UploadFile):
     mode = session["mode"]
 
     if mode == "A":
@@ -242,13 +276,14 @@ async def record_chunk(
             data = await file.read()
             if not data:
                 raise HTTPException(status_code=400, detail="Empty chunk")
-            fh.write(data)
-            fh.flush()
+            await chunk_writer.write(recording_id, fh, data)
         except HTTPException:
             raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Write failed: {e}")
         session["last_seq"] = max(session.get("last_seq", 0), int(seq))
+        session["last_activity"] = time.time()
+        session["paused"] = False
         return {"ok": True, "seq": int(seq)}
 
     ## mode == "B"
@@ -268,9 +303,30 @@ async def record_chunk(
         raise HTTPException(status_code=500, detail=f"FIFO write failed: {e}")
 
     session["last_seq"] = max(session.get("last_seq", 0), int(seq))
+    session["last_activity"] = time.time()
+    session["paused"] = False
     return {"ok": True, "seq": int(seq)}
 
 
+@router.post("/record/ping")
+async def record_ping(
+    recording_id: str = Form(...),
+    paused: int = Form(0),
+):
+    """
+    Keep-alive of a client that sends no chunks (recording paused). A paused session is
+    finalized by the idle sweeper only after RECORD_SESSION_PAUSED_IDLE_SEC.
+    """
+    session = ACTIVE.get(recording_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="No active recording")
+    session["last_activity"] = time.time()
+    if bool(paused) != bool(session.get("paused")):
+        session["paused"] = bool(paused)
+        await store.asave_session(recording_id, session)  ## recovery applies the same limit
+    return {"ok": True, "paused": bool(session["paused"])}
+
+
 @router.post("/record/finish")
 async def record_finish(
     recording_id: str = Form(...),
@@ -281,40 +337,50 @@ async def record_finish(
     session = ACTIVE.pop(recording_id, None)
     if not session:
         raise HTTPException(status_code=404, detail="Recording not found")
+    return await finalize_session(recording_id, session, send_to_bot, owner_uid, chat_id)
+
+
+async def finalize_session(recording_id: str, session: Dict[str, Any], send_to_bot: int = 1,
+                           owner_uid: str = "", chat_id: str = "") -> Dict[str, Any]:
+    """
+    Close a session taken out of ACTIVE and produce its final file: the webm (+ transcode job)
+    for A, the concatenated mp4 for B; then deliver. Used by /record/finish, the idle sweeper
+    and startup recovery. The session manifest is removed whatever the outcome.
+    Raises HTTPException like the route.
+    """
+    try:
+        return await _finalize(recording_id, session, send_to_bot, owner_uid, chat_id)
+    finally:
+        await store.aremove_session(recording_id)
 
+
+async def _finalize(recording_id: str, session: Dict[str, Any], send_to_bot: int, owner_uid: str,
+                    chat_id: str) -> Dict[str, Any]:
     mode = session["mode"]
     room_id = session["room_id"]
 
-    ## Resolve effective owner and chat via DB helper
+    base = session["base"]
+    started_ts = int(session["started_ts"])
+
+    ## Resolve effective owner and call: the call resolved at start if the owner is unchanged,
+    ## otherwise the call directory, then the DB
     owner_uid_eff = (owner_uid or "").strip() or (session.get("owner_uid") or "").strip()
-    if not owner_uid_eff:
+    call_id = session.get("call_id") if owner_uid_eff and owner_uid_eff == session.get("owner_uid") else None
+    if not call_id:
         try:
-            got = await db_fallback_owner_uid(room_id)
-            if got:
-                owner_uid_eff = got
+            owner_uid_eff, call_id = await _resolve_room(room_id, owner_uid_eff, started_ts)
         except Exception as e:
-            print(f"[RECORD] owner_uid fallback at finish failed: {e}")
+            print(f"[RECORD] owner/call resolve at finish failed: {e}")
 
     chat_id_eff = (chat_id or "").strip() or (session.get("chat_id") or "").strip() or owner_uid_eff
-
-    base = session["base"]
-    started_ts = int(session["started_ts"])
     ended_ts = int(time.time())
 
-    file_name_logged: Optional[str] = None
-    fmt_logged = "mp4"
-    size_bytes_logged: Optional[int] = None
-
     print(f"[RECORD] finish room={room_id} owner_uid={owner_uid_eff} chat_id={chat_id_eff} mode={mode}")
 
     if mode == "A":
         ## Close and finalize webm
-        fh = session.get("file_handle")
-        if fh:
-            try:
-                fh.close()
-            except Exception:
-                pass
+        ## buffered chunks are written and synced (per RECORD_FSYNC) before the rename
+        await _close_part(recording_id, session)
         part_path = session.get("part_path")
         if not part_path or not os.path.exists(part_path):
             raise HTTPException(status_code=500, detail="Partial file missing")
@@ -325,37 +391,35 @@ async def record_finish(
             raise HTTPException(status_code=500, detail=f"Finalize failed: {e}")
 
         final_url = f"/static/records/{os.path.basename(webm_path)}"
-        file_name_logged = os.path.basename(webm_path)
-        fmt_logged = "webm"
-        size_bytes_logged = os.path.getsize(webm_path)
-
-        ## Optional mp4 transcode
-        ffmpeg = shutil.which("ffmpeg")
-        if ffmpeg:
+        delivery = {
+            "room_id": room_id,
+            "owner_uid": owner_uid_eff,
+            "chat_id": chat_id_eff,
+            "send_to_bot": int(send_to_bot),
+            "call_id": call_id,
+            "started_ts": started_ts,
+            "ended_ts": ended_ts,
+            "base": base,
+            "url": final_url,
+            "file": os.path.basename(webm_path),
+            "fmt": "webm",
+            "size_bytes": os.path.getsize(webm_path),
+        }
+
+        ## mp4 transcode runs as a background job; bot notify and DB log follow when it ends
+        if shutil.which("ffmpeg"):
             mp4_path = os.path.join(RECORD_DIR, base + ".mp4")
-            cmd = _ffmpeg_transcode_cmd_for_file(webm_path, mp4_path)
-            try:
-                subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                final_url = f"/static/records/{os.path.basename(mp4_path)}"
-                file_name_logged = os.path.basename(mp4_path)
-                fmt_logged = "mp4"
-                size_bytes_logged = os.path.getsize(mp4_path)
-            except Exception as e:
-                print(f"[RECORD] ffmpeg convert failed: {e} (keeping webm)")
-
-        ## Bot notify
-        if send_to_bot:
-            await _notify_bot(room_id, owner_uid_eff, chat_id_eff, final_url)
-
-        ## DB log
-        try:
-            call_id = await db_resolve_call_id(room_id, owner_uid_eff, started_ts) if owner_uid_eff else None
-            if call_id:
-                await callsdb.add_recording(call_id, file_name_logged, started_ts, ended_ts, max(0, ended_ts - started_ts), fmt_logged, size_bytes_logged, bool(send_to_bot), base)
-        except Exception as e:
-            print(f"[RECORD] _log_recording failed (ignored): {e}")
-
-        return {"ok": True, "url": final_url, "file": os.path.basename(final_url)}
+            job = await transcoder.submit(
+                _ffmpeg_transcode_cmd_for_file(webm_path, mp4_path), mp4_path, input_path=webm_path,
+                duration_sec=max(0, ended_ts - started_ts), meta=delivery,
+            )
+            if job:
+                print(f"[RECORD] transcode job {job.id} queued for {delivery['file']}")
+                return {"ok": True, "url": final_url, "file": delivery["file"], "job_id": job.id, "status": job.status}
+            print("[RECORD] transcode queue full (keeping webm)")
+
+        await _deliver(delivery)
+        return {"ok": True, "url": final_url, "file": delivery["file"]}
 
     ## mode == "B"
     writer = session.get("fifo_writer")
@@ -372,7 +436,7 @@ async def record_finish(
 
     if proc:
         try:
-            proc.wait(timeout=60)
+            await asyncio.to_thread(proc.wait, timeout=60)
         except Exception:
             try:
                 proc.terminate()
@@ -406,9 +470,19 @@ async def record_finish(
         final_mp4_tmp
     ]
     try:
-        subprocess.run(cmd_concat, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        await asyncio.to_thread(subprocess.run, cmd_concat, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Concat failed: {e}")
+        ## ffmpeg killed mid-segment (restart) leaves a last segment without an index
+        if len(segs) < 2:
+            raise HTTPException(status_code=500, detail=f"Concat failed: {e}")
+        print(f"[RECORD] concat failed ({e}), retrying without the last segment")
+        with open(list_path, "w", encoding="utf-8") as lf:
+            for p in segs[:-1]:
+                lf.write(f"file '{p}'\n")
+        try:
+            await asyncio.to_thread(subprocess.run, cmd_concat, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except Exception as e2:
+            raise HTTPException(status_code=500, detail=f"Concat failed: {e2}")
 
     final_mp4 = os.path.join(RECORD_DIR, f"{base}.mp4")
     try:
@@ -417,9 +491,6 @@ async def record_finish(
         raise HTTPException(status_code=500, detail=f"Move final failed: {e}")
 
     final_url = f"/static/records/{os.path.basename(final_mp4)}"
-    file_name_logged = os.path.basename(final_mp4)
-    fmt_logged = "mp4"
-    size_bytes_logged = os.path.getsize(final_mp4)
 
     ## Cleanup session dir
     try:
@@ -432,19 +503,144 @@ async def record_finish(
     except Exception as e:
         print(f"[RECORD] cleanup warning: {e}")
 
-    ## Bot notify
-    if send_to_bot:
-        await _notify_bot(room_id, owner_uid_eff, chat_id_eff, final_url)
+    await _deliver({
+        "room_id": room_id,
+        "owner_uid": owner_uid_eff,
+        "chat_id": chat_id_eff,
+        "send_to_bot": int(send_to_bot),
+        "call_id": call_id,
+        "started_ts": started_ts,
+        "ended_ts": ended_ts,
+        "base": base,
+        "url": final_url,
+        "file": os.path.basename(final_mp4),
+        "fmt": "mp4",
+        "size_bytes": os.path.getsize(final_mp4),
+    })
 
-    ## DB log
+    return {"ok": True, "url": final_url, "file": os.path.basename(final_mp4)}
+
+
+async def _deliver(d: Dict[str, Any]):
+    """
+    Bot notify and DB log for a finished recording file; d is the delivery dict built by
+    /record/finish (for pipeline A also the meta of its transcode job).
+    """
+    if d["send_to_bot"]:
+        await _notify_bot(d["room_id"], d["owner_uid"], d["chat_id"], d["url"])
     try:
-        call_id = await db_resolve_call_id(room_id, owner_uid_eff, started_ts) if owner_uid_eff else None
-        if call_id:
-            await callsdb.add_recording(call_id, file_name_logged, started_ts, ended_ts, max(0, ended_ts - started_ts), fmt_logged, size_bytes_logged, bool(send_to_bot), base)
+        if d["call_id"]:
+            await callsdb.add_recording(d["call_id"], d["file"], d["started_ts"], d["ended_ts"], max(0, d["ended_ts"] - d["started_ts"]), d["fmt"], d["size_bytes"], bool(d["send_to_bot"]), d["base"])
     except Exception as e:
         print(f"[RECORD] _log_recording failed (ignored): {e}")
 
-    return {"ok": True, "url": final_url, "file": os.path.basename(final_mp4)}
+
+async def _transcode_done(job: TranscodeJob):
+    d = job.meta
+    if job.status == "done":
+        d.update(
+            url=f"/static/records/{os.path.basename(job.output_path)}",
+            file=os.path.basename(job.output_path),
+            fmt="mp4",
+            size_bytes=os.path.getsize(job.output_path),
+        )
+    else:
+        print(f"[RECORD] ffmpeg convert failed for {d['file']} (keeping webm)")
+    await _deliver(d)
+
+
+transcoder.on_done = _transcode_done
+
+
+@router.get("/record/jobs/{job_id}")
+async def record_job(job_id: str):
+    job = transcoder.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    info = job.describe()
+    ## the final file is known once the job ended (mp4, or the webm if the transcode failed)
+    finished = job.status in ("done", "failed")
+    info["url"] = job.meta.get("url") if finished else None
+    info["file"] = job.meta.get("file") if finished else None
+    return info
+
+
+async def _close_part(recording_id: str, session: Dict[str, Any]):
+    """
+    Flush and close a mode A part file. If a chunk write failed the file has a gap: it is
+    kept as <base>.webm.failed for inspection, never delivered, and the request fails.
+    """
+    try:
+        await chunk_writer.close(recording_id, session.get("file_handle"))
+    except Exception as e:
+        part_path = session.get("part_path")
+        if part_path and os.path.exists(part_path):
+            try:
+                os.replace(part_path, os.path.join(RECORD_DIR, session["base"] + ".webm.failed"))
+            except OSError:
+                pass
+        print(f"[RECORD] recording {recording_id} not delivered, chunk write failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Write failed: {e}")
+
+
+async def _finalize_abandoned(recording_id: str, session: Dict[str, Any]):
+    """
+    Finalize a session its client left behind (idle sweeper, startup recovery).
+    Sessions that never got data are just removed.
+    """
+    part_path = session.get("part_path")
+    if session["mode"] == "A":
+        try:
+            await _close_part(recording_id, session)
+        except HTTPException:
+            await store.aremove_session(recording_id)
+            raise
+        if not part_path or not os.path.exists(part_path) or not os.path.getsize(part_path):
+            if part_path and os.path.exists(part_path):
+                os.remove(part_path)
+            await store.aremove_session(recording_id)
+            print(f"[RECORD] dropped empty session {recording_id}")
+            return
+    await finalize_session(recording_id, session, send_to_bot=1)
+
+
+sweeper = SessionSweeper(ACTIVE, _finalize_abandoned, interval=RECORD_SWEEP_INTERVAL,
+                         idle_sec=RECORD_SESSION_IDLE_SEC, paused_idle_sec=RECORD_SESSION_PAUSED_IDLE_SEC)
+
+
+async def recover_recordings():
+    """
+    Startup pass over what a previous run left behind:
+    - transcode jobs are queued again
+    - mode A sessions active within the sweeper's limit are resumed: the part file is
+      reopened and the client's next chunk/finish with the same recording_id just works
+    - everything else (B sessions, whose ffmpeg died with the old process, and idle A
+      sessions) is handed to the sweeper, which finalizes and delivers it from the data
+      on disk once started, so concat and bot calls do not hold up the startup
+    """
+    await transcoder.recover()
+    resumed = queued = 0
+    for session in await asyncio.to_thread(store.load_sessions):
+        recording_id = session.pop("recording_id", None)
+        session.pop("saved_at", None)
+        if not recording_id or recording_id in ACTIVE or "mode" not in session:
+            continue
+        idle = time.time() - last_activity(session)
+        part_path = session.get("part_path")
+        if session["mode"] == "A" and idle < sweeper.limit(session) and part_path and os.path.exists(part_path):
+            try:
+                session["file_handle"] = open(part_path, "ab")
+            except OSError as e:
+                print(f"[RECORD] cannot reopen {part_path}: {e}")
+            else:
+                session["last_activity"] = time.time()
+                ACTIVE[recording_id] = session
+                resumed += 1
+                continue
+        sweeper.adopt(recording_id, session)
+        queued += 1
+    if resumed or queued:
+        print(f"[RECORD] recovery: {resumed} sessions resumed, {queued} queued for finalizing")
 
 
 async def _notify_bot(room_id: str, owner_uid: str, chat_id: str, url: str):
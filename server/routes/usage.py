@@ -0,0 +1,69 @@
+## Usage reporting over the daily rollups (server/db/usage.py)
+## GET /usage/{uid}?from=YYYY-MM-DD&to=YYYY-MM-DD
+##   owned: per-day totals of calls the user owned; joined: per-day totals of calls the user joined
+## Both are primary key ranges on the rollup tables: at most one row per day of the range.
+## Only uid itself (Telegram WebApp initData) or an internal caller may read (server/utils/tgauth.py).
+
+from datetime import date, timedelta
+
+from fastapi import APIRouter, HTTPException, Query, Request
+
+from server.db import calls as callsdb
+from server.db import usage as usagedb
+from server.utils.tgauth import require_user
+
+router = APIRouter()
+
+RANGE_DEFAULT_DAYS = 30
+RANGE_MAX_DAYS = 366
+
+
+def _parse_day(value: str, name: str) -> date:
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"invalid {name} date, expected YYYY-MM-DD")
+
+
+@router.get("/usage/{uid}")
+async def get_usage(request: Request, uid: str, day_from: str = Query("", alias="from"), day_to: str = Query("", alias="to")):
+    require_user(request, uid)
+    end = _parse_day(day_to, "to") if day_to else date.today()
+    start = _parse_day(day_from, "from") if day_from else end - timedelta(days=RANGE_DEFAULT_DAYS - 1)
+    if start > end:
+        raise HTTPException(status_code=400, detail="from is after to")
+    if (end - start).days >= RANGE_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"range is limited to {RANGE_MAX_DAYS} days")
+
+    user_id = await callsdb.get_user_id_by_tg(uid)
+    owned = await usagedb.owner_days(user_id, start, end) if user_id else []
+    joined = await usagedb.participant_days(user_id, start, end) if user_id else []
+
+    owned_days = [
+        {
+            "day": r[0].isoformat(),
+            "calls": int(r[1]),
+            "completed": int(r[2]),
+            "solo": int(r[3]),
+            "duration_sec": int(r[4]),
+            "participants": int(r[5]),
+        }
+        for r in owned
+    ]
+    joined_days = [
+        {"day": r[0].isoformat(), "calls": int(r[1]), "joins": int(r[2]), "duration_sec": int(r[3])}
+        for r in joined
+    ]
+    return {
+        "uid": uid,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "owned": owned_days,
+        "joined": joined_days,
+        "totals": {
+            "owned_calls": sum(d["calls"] for d in owned_days),
+            "owned_duration_sec": sum(d["duration_sec"] for d in owned_days),
+            "joined_calls": sum(d["calls"] for d in joined_days),
+            "joined_duration_sec": sum(d["duration_sec"] for d in joined_days),
+        },
+    }
@@ -1,102 +1,158 @@
 ## WebSocket signaling route with recording broadcast support and call logging
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+import asyncio
+import time
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from server.config import (
+    ROOM_SHARDS,
+    ROOM_BUS,
+    ROOM_BUS_URL,
+    ROOM_BUS_NODE_TTL,
+    WS_OUTBOX_SIZE,
+    WS_OUTBOX_POLICY,
+    WS_ICE_BATCH_MS,
+    WS_ICE_BATCH_MAX,
+    WS_LOG_RELAY,
+    WS_PING_INTERVAL,
+    WS_PING_TIMEOUT,
+)
 from server.utils.rooms import RoomManager
-from server.db import calls as callsdb
+from server.utils.outbox import Outbox
+from server.utils.roombus import make_bus
+from server.utils.icebatch import IceBatcher
+from server.utils.heartbeat import Heartbeat, rtt_from_pong
+from server.utils import codec
+from server.db import accounting as acct
+from server.db.accounting import accounting
+from server.utils.calldir import call_directory
 
 router = APIRouter()
-rooms = RoomManager()
+_RECORD_STATE = {"record-start": "recording", "record-resume": "recording", "record-pause": "paused", "record-stop": None}
+rooms = RoomManager(shards=ROOM_SHARDS, bus=make_bus(ROOM_BUS, ROOM_BUS_URL), node_ttl=ROOM_BUS_NODE_TTL)
+ice_batcher = IceBatcher(WS_ICE_BATCH_MS, WS_ICE_BATCH_MAX) if WS_ICE_BATCH_MS > 0 else None
+heartbeat = Heartbeat(rooms, WS_PING_INTERVAL, WS_PING_TIMEOUT)
+
+
+def _relay(room_id: str, src, dst, msg_type: str, data, tag: str = "relay"):
+    """
+    Forward offer/answer/ice to one peer; ICE goes through the batcher when enabled.
+    """
+    if ice_batcher:
+        if msg_type == "ice":
+            ice_batcher.add(src.id, dst, data)
+            return
+        ## keep candidates queued before this frame ahead of it
+        ice_batcher.flush_pair(src.id, dst.id)
+    if dst.send(codec.dumps({"type": msg_type, "from": src.id, "data": data})):
+        if WS_LOG_RELAY:
+            print(f"[WS] {tag} {msg_type} room={room_id} from={src.id} to={dst.id}")
+    else:
+        print(f"[WS] {tag} dropped {msg_type} room={room_id} from={src.id} to={dst.id}")
+
+
+def _on_remote(event: str, room_id: str, room, peer, extra):
+    """
+    Room bus callback: a peer held by another worker changed state.
+    Notify peers connected here, mirroring what ws_room sends for local changes.
+    """
+    if event == "joined":
+        joined = codec.dumps(dict(peer.describe(), type="peer-joined", owner_uid=room.owner_uid or ""))
+        for p in extra.get("to") or []:
+            p.send(joined)
+    elif event == "here":
+        ## roster of another node for a peer that just joined here
+        peer.send({
+            "type": "peers",
+            "owner_uid": room.owner_uid or "",
+            "peers": [m.describe() for m in extra.get("peers") or []]
+        })
+    elif event == "info":
+        info = codec.dumps(dict(peer.describe(), type="peer-info"))
+        for p in room.local_peers_except(peer.id):
+            p.send(info, key=f"peer-info:{peer.id}")
+    elif event == "owner":
+        call_directory.set_owner(room_id, room.owner_uid)
+        owner_set = codec.dumps({"type": "owner-set", "owner_uid": room.owner_uid})
+        for p in room.local_snapshot:
+            p.send(owner_set, key="owner-set")
+    elif event == "left":
+        left = codec.dumps({"type": "peer-left", "id": peer.id})
+        for p in room.local_peers_except(peer.id):
+            p.send(left)
+        print(f"[WS] peer-left(remote) room={room_id} from={peer.id}")
+
+
+rooms.on_remote = _on_remote
 
 
 @router.websocket("/ws/{room_id}")
 async def ws_room(websocket: WebSocket, room_id: str):
     await websocket.accept()
     peer = await rooms.join(room_id, websocket)
+    peer.outbox = Outbox(websocket, WS_OUTBOX_SIZE, WS_OUTBOX_POLICY, label=f"{room_id}/{peer.id}")
+    peer.outbox.start()
+    peer.task = asyncio.current_task()
+    peer.last_seen = time.monotonic()
+    heartbeat.start()
     print(f"[WS] joined room={room_id} peer={peer.id}")
     try:
         room = await rooms.get_room(room_id)
         if room:
-            existing = room.list_peers_except(peer.id)
-            await websocket.send_json({
+            ## Peers on other workers arrive as separate 'peers' frames via the room bus
+            existing = room.local_peers_except(peer.id)
+            peer.send({
                 "type": "peers",
                 "owner_uid": room.owner_uid or "",
-                "peers": [
-                    {
-                        "id": p.id,
-                        "name": p.name or "",
-                        "avatar": p.avatar or "",
-                        "uid": p.uid or ""
-                    } for p in existing
-                ]
+                "peers": [p.describe() for p in existing]
             })
+            joined = codec.dumps(dict(peer.describe(), type="peer-joined", owner_uid=room.owner_uid or ""))
             for p in existing:
-                try:
-                    await p.ws.send_json({
-                        "type": "peer-joined",
-                        "id": peer.id,
-                        "name": peer.name or "",
-                        "avatar": peer.avatar or "",
-                        "uid": peer.uid or "",
-                        "owner_uid": room.owner_uid or ""
-                    })
-                except Exception as e:
-                    print(f"[WS] failed peer-joined notify to={p.id}: {e}")
+                p.send(joined)
 
         while True:
-            msg = await websocket.receive_json()
+            msg = codec.loads(await websocket.receive_text())
+            peer.last_seen = time.monotonic()
             msg_type = msg.get("type")
             room = await rooms.get_room(room_id)
             if not room:
                 print(f"[WS] room missing room={room_id} peer={peer.id}")
                 break
 
+            if msg_type == "pong":
+                peer.heartbeat = True
+                rtt = rtt_from_pong(msg.get("ts"))
+                if rtt is not None:
+                    peer.rtt_ms = rtt
+                continue
+
             if msg_type == "hello":
                 peer.name = msg.get("name") or None
-                peer.uid = (msg.get("uid") or "").strip() or None
+                room.set_uid(peer, (msg.get("uid") or "").strip() or None)
                 peer.avatar = msg.get("avatar") or None
                 is_owner = bool(msg.get("is_owner"))
 
                 ## Owner assignment (only first claim)
                 if is_owner and peer.uid and not room.owner_uid:
-                    room.owner_uid = peer.uid
+                    room.set_owner(peer.uid)
                     print(f"[WS] owner set room={room_id} owner_uid={room.owner_uid}")
-                    ## create call session in DB
-                    try:
-                        call_id = await callsdb.create_call_if_absent(room_id, room.owner_uid)
-                        setattr(room, "call_id", call_id)
-                    except Exception as e:
-                        print(f"[WS] call create failed: {e}")
-                    for p in room.peers.values():
-                        try:
-                            await p.ws.send_json({"type": "owner-set", "owner_uid": room.owner_uid})
-                        except Exception as e:
-                            print(f"[WS] failed to send owner-set to={p.id}: {e}")
+                    call_directory.set_owner(room_id, room.owner_uid)
+                    ## create call session in DB (write-behind)
+                    accounting.submit(acct.OwnerJoin(room, room_id, room.owner_uid))
+                    rooms.publish_owner(room_id, room.owner_uid)
+                    owner_set = codec.dumps({"type": "owner-set", "owner_uid": room.owner_uid})
+                    for p in room.local_snapshot:
+                        p.send(owner_set, key="owner-set")
 
                 print(f"[WS] hello room={room_id} peer={peer.id} name={peer.name} uid={peer.uid} is_owner={is_owner}")
 
                 ## participants accounting for non-owner
                 if peer.uid and room.owner_uid and peer.uid != room.owner_uid:
-                    try:
-                        call_id = getattr(room, "call_id", None)
-                        if not call_id and room.owner_uid:
-                            call_id = await callsdb.create_call_if_absent(room_id, room.owner_uid)
-                            setattr(room, "call_id", call_id)
-                        if call_id:
-                            await callsdb.participant_join(call_id, peer.uid, peer.name or "", peer.avatar or "")
-                            await callsdb.mark_call_active(call_id)
-                    except Exception as e:
-                        print(f"[WS] participant join log failed: {e}")
+                    accounting.submit(acct.PeerJoin(room, room_id, room.owner_uid, peer.uid, peer.name or "", peer.avatar or ""))
 
-                for p in room.list_peers_except(peer.id):
-                    try:
-                        await p.ws.send_json({
-                            "type": "peer-info",
-                            "id": peer.id,
-                            "name": peer.name or "",
-                            "avatar": peer.avatar or "",
-                            "uid": peer.uid or ""
-                        })
-                    except Exception as e:
-                        print(f"[WS] failed to send peer-info to={p.id}: {e}")
+                rooms.publish_info(room_id, peer)
+                info = codec.dumps(dict(peer.describe(), type="peer-info"))
+                for p in room.local_peers_except(peer.id):
+                    p.send(info, key=f"peer-info:{peer.id}")
                 continue
 
             if msg_type in ("offer", "answer", "ice"):
@@ -105,30 +161,20 @@ async def ws_room(websocket: WebSocket, room_id: str):
                 if target:
                     dst = room.peers.get(target)
                     if dst:
-                        try:
-                            await dst.ws.send_json({"type": msg_type, "from": peer.id, "data": data})
-                            print(f"[WS] relay {msg_type} room={room_id} from={peer.id} to={dst.id}")
-                        except Exception as e:
-                            print(f"[WS] relay error {msg_type} room={room_id} from={peer.id} to={target}: {e}")
+                        _relay(room_id, peer, dst, msg_type, data)
                     else:
                         print(f"[WS] relay skip unknown target room={room_id} from={peer.id} to={target}")
                 else:
                     other = room.other_peer(peer.id)
                     if other:
-                        try:
-                            await other.ws.send_json({"type": msg_type, "from": peer.id, "data": data})
-                            print(f"[WS] relay(1to1) {msg_type} room={room_id} from={peer.id} to={other.id}")
-                        except Exception as e:
-                            print(f"[WS] relay(1to1) error {msg_type} room={room_id} from={peer.id}: {e}")
+                        _relay(room_id, peer, other, msg_type, data, tag="relay(1to1)")
                 continue
 
             if msg_type == "bye":
+                bye = codec.dumps({"type": "bye", "id": peer.id})
                 for p in room.list_peers_except(peer.id):
-                    try:
-                        await p.ws.send_json({"type": "bye", "id": peer.id})
-                        print(f"[WS] bye room={room_id} from={peer.id} to={p.id}")
-                    except Exception as e:
-                        print(f"[WS] failed to send bye to={p.id}: {e}")
+                    p.send(bye)
+                    print(f"[WS] bye room={room_id} from={peer.id} to={p.id}")
                 continue
 
             ## Recording broadcast (owner only)
@@ -139,23 +185,13 @@ async def ws_room(websocket: WebSocket, room_id: str):
                         "owner_uid": room.owner_uid,
                         "timestamp": msg.get("timestamp") or ""
                     }
+                    frame = codec.dumps(payload)
+                    ## not coalesced: start/pause/resume/stop are transitions, each must arrive in order
                     for p in room.list_peers_except(peer.id):
-                        try:
-                            await p.ws.send_json(payload)
-                        except Exception as e:
-                            print(f"[WS] failed record broadcast type={msg_type} to={p.id}: {e}")
-                    try:
-                        call_id = getattr(room, "call_id", None)
-                        if call_id:
-                            evmap = {
-                                "record-start": "record_start",
-                                "record-pause": "record_pause",
-                                "record-resume": "record_resume",
-                                "record-stop": "record_stop",
-                            }
-                            await callsdb.add_event(call_id, None, evmap.get(msg_type, "record"), {"ts": payload["timestamp"]})
-                    except Exception as e:
-                        print(f"[WS] record event log failed: {e}")
+                        p.send(frame)
+                    room.record_state = _RECORD_STATE[msg_type]
+                    room.record_since = time.time()
+                    accounting.submit(acct.RecordMark(room, room_id, msg_type.replace("-", "_"), payload["timestamp"]))
                 else:
                     print(f"[WS] record attempt denied (not owner) room={room_id} peer={peer.id}")
                 continue
@@ -163,32 +199,68 @@ async def ws_room(websocket: WebSocket, room_id: str):
             print(f"[WS] ignore msg type={msg_type} room={room_id} peer={peer.id}")
     except WebSocketDisconnect:
         print(f"[WS] disconnect room={room_id} peer={peer.id}")
-    finally:
+    except asyncio.CancelledError:
+        if not peer.reaped:
+            raise
+        ## reaped by the heartbeat: finish like a disconnect. Task.uncancel() (Python 3.11+) clears the
+        ## pending cancel request; on older versions swallowing the CancelledError is enough
+        uncancel = getattr(asyncio.current_task(), "uncancel", None)
+        if uncancel is not None:
+            uncancel()
+        print(f"[WS] reaped room={room_id} peer={peer.id}")
         try:
-            room = await rooms.get_room(room_id)
-            call_id = getattr(room, "call_id", None) if room else None
-            if call_id and peer.uid:
-                if room and room.owner_uid and peer.uid == room.owner_uid:
-                    await callsdb.finalize_call(call_id, ended_reason="owner_leave")
-                else:
-                    await callsdb.participant_leave(call_id, peer.uid, None)
-                    if room:
-                        other_non_owner = 0
-                        for pid, p in room.peers.items():
-                            if p.uid and room.owner_uid and p.uid != room.owner_uid and pid != peer.id:
-                                other_non_owner += 1
-                        if other_non_owner == 0 and room.owner_uid:
-                            await callsdb.finalize_call(call_id, ended_reason="no_peers_left")
-        except Exception as e:
-            print(f"[WS] finalize/leave log failed: {e}")
+            await websocket.close(code=1001)
+        except Exception:
+            pass  ## the transport is usually gone already
+    finally:
+        ## call accounting (write-behind); call_id is checked when the event is applied
+        room = await rooms.get_room(room_id)
+        if room and peer.uid:
+            if room.owner_uid and peer.uid == room.owner_uid:
+                accounting.submit(acct.CallEnd(room, room_id, "owner_leave"))
+            else:
+                accounting.submit(acct.PeerLeave(room, room_id, peer.uid))
+                if room.owner_uid and room.other_non_owner_count(peer) == 0:
+                    accounting.submit(acct.CallEnd(room, room_id, "no_peers_left"))
 
         await rooms.leave(room_id, peer.id)
+        peer.outbox.close()
+        if ice_batcher:
+            ice_batcher.drop_peer(peer.id)
         room = await rooms.get_room(room_id)
         if room:
-            for p in room.list_peers_except(peer.id):
-                try:
-                    await p.ws.send_json({"type": "peer-left", "id": peer.id})
-                    print(f"[WS] peer-left room={room_id} from={peer.id} to={p.id}")
-                except Exception as e:
-                    print(f"[WS] failed to send peer-left to={p.id}: {e}")
+            left = codec.dumps({"type": "peer-left", "id": peer.id})
+            for p in room.local_peers_except(peer.id):
+                p.send(left)
+                print(f"[WS] peer-left room={room_id} from={peer.id} to={p.id}")
+
+
 
+@router.get("/ws/{room_id}/state")
+async def ws_room_state(room_id: str):
+    """
+    Live room state on this node: owner, call/recording state and per-peer
+    liveness (RTT of the last heartbeat, seconds since the last inbound frame).
+    Peers held by other nodes are listed with their node id and no RTT.
+    """
+    room = await rooms.get_room(room_id)
+    if not room:
+        raise HTTPException(status_code=404, detail="Room not found")
+    now = time.monotonic()
+    return {
+        "room_id": room_id,
+        "owner_uid": room.owner_uid or "",
+        "call_id": room.call_id,
+        "record_state": room.record_state,
+        "created_at": int(room.created_at),
+        "peers": [
+            dict(
+                p.describe(),
+                node=p.node,
+                joined_at=int(p.joined_at),
+                rtt_ms=p.rtt_ms,
+                idle_s=round(now - p.last_seen, 1) if p.node is None else None,
+            )
+            for p in room.snapshot
+        ],
+    }
@@ -24,7 +24,7 @@
 
   let recorder = null, recordingId = null, startedTs = null;
   let audioCtx = null, mixDest = null, compNode = null, masterGain = null;
-  let paused = false, chunkSeq = 0;
+  let paused = false, chunkSeq = 0, pingTimer = null;
 
   function setStatus(t) { recordStatusEl.textContent = t; }
   function isStageInDebounce() {
@@ -141,18 +141,36 @@
     recordBtn.disabled = true; pauseBtn.disabled = false; stopBtn.disabled = false;
   }
 
+  // no chunks flow while paused: tell the server, and keep pinging so the session is not
+  // taken for abandoned and finalized half way
+  function pingRecording() {
+    if (!recordingId) return;
+    const formPing = new FormData();
+    formPing.append('recording_id', recordingId);
+    formPing.append('paused', paused ? '1' : '0');
+    fetch('/record/ping', { method: 'POST', body: formPing })
+      .catch(err => console.warn('[REC] ping failed', err));
+  }
+
+  function stopPinging() {
+    if (pingTimer) { clearInterval(pingTimer); pingTimer = null; }
+  }
+
   function pauseRecording() {
     if (!recorder) return;
     if (paused) {
       try { recorder.resume(); } catch(_){}
       paused = false; setStatus('Recording...'); pauseBtn.textContent = 'Pause';
+      stopPinging(); pingRecording();
     } else {
       try { recorder.pause(); } catch(_){}
       paused = true; setStatus('Paused'); pauseBtn.textContent = 'Resume';
+      pingRecording(); stopPinging(); pingTimer = setInterval(pingRecording, 60000);
     }
   }
 
   async function finishRecording() {
+    stopPinging();
     const sendFlag = (sendToBotChk && sendToBotChk.checked) ? '1' : '0';
     const formFinish = new FormData();
     formFinish.append('recording_id', recordingId);
@@ -167,8 +185,13 @@
     const resp = await fetch('/record/finish', { method: 'POST', body: formFinish });
     if (resp.ok) {
       const data = await resp.json();
-      if (data && data.url) showDownloadLink(data.url);
-      setStatus('Uploaded');
+      if (data && data.job_id) {
+        setStatus('Processing...');
+        pollTranscodeJob(data.job_id, data.url);
+      } else {
+        if (data && data.url) showDownloadLink(data.url);
+        setStatus('Uploaded');
+      }
     } else {
       setStatus('Upload failed');
     }
@@ -178,6 +201,26 @@
     recordBtn.disabled = false; pauseBtn.disabled = true; stopBtn.disabled = true; pauseBtn.textContent = 'Pause';
   }
 
+  // mp4 transcode runs on the server after finish: poll its job, link the result when it ends
+  // (status text is left alone once a new recording started)
+  async function pollTranscodeJob(jobId, fallbackUrl) {
+    for (;;) {
+      await new Promise(r => setTimeout(r, 2000));
+      let job = null;
+      try {
+        const r = await fetch(`/record/jobs/${encodeURIComponent(jobId)}`);
+        if (r.ok) job = await r.json();
+      } catch(_){}
+      if (!job || job.status === 'done' || job.status === 'failed') {
+        const url = (job && job.url) || fallbackUrl;
+        if (url) showDownloadLink(url);
+        if (!recorder) setStatus('Uploaded');
+        return;
+      }
+      if (!recorder) setStatus(job.percent != null ? `Processing ${Math.round(job.percent)}%` : 'Processing...');
+    }
+  }
+
   function stopRecording() {
     if (!recorder) return;
     setStatus('Stopping...'); pauseBtn.disabled = true; stopBtn.disabled = true;
@@ -486,6 +486,11 @@
           case 'error':
             alert(msg.message || 'Server error'); break;
 
+          case 'ping':
+            // server heartbeat: echo ts so the server can measure RTT
+            try { state.ws.send(JSON.stringify({ type: 'pong', ts: msg.ts })); } catch(_){}
+            break;
+
           case 'owner-set': {
             state.ownerUid = msg.owner_uid || '';
             for (const [, entry] of state.peers.entries()) {
@@ -554,6 +559,12 @@
           case 'offer': await handleOffer(msg.from, msg.data); break;
           case 'answer': await handleAnswer(msg.from, msg.data); break;
           case 'ice': await handleIce(msg.from, msg.data); break;
+          case 'ice-batch': {
+            // server-side coalesced trickle ICE: candidates in arrival order
+            const list = Array.isArray(msg.data) ? msg.data : [];
+            for (const cand of list) await handleIce(msg.from, cand);
+            break;
+          }
 
           case 'peer-left':
           case 'bye': {
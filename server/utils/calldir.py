@@ -0,0 +1,83 @@
+## In-process room -> (owner_uid, call_id) directory
+## Signaling learns a room's owner on hello and call accounting learns the call_logs.id; both are
+## recorded here so the recording routes can resolve them without a database round trip.
+## Entries outlive the room for `ttl` seconds after the call ends, because a recording's
+## /record/finish usually arrives after everybody has left.
+
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from server.config import CALL_DIRECTORY_SIZE, CALL_DIRECTORY_TTL
+
+
+@dataclass(slots=True)
+class _Entry:
+    owner_uid: str = ""
+    call_id: Optional[int] = None
+    ended_at: Optional[float] = None  ## time.monotonic() of the call end, None while live
+
+
+class CallDirectory:
+    """
+    Bounded LRU of room_id -> _Entry. A new owner for a room starts a new entry (the old
+    call_id belongs to the previous owner); lookups for a different owner are misses.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 3600.0):
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = float(ttl)
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _put(self, room_id: str, entry: _Entry):
+        self._entries[room_id] = entry
+        self._entries.move_to_end(room_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def set_owner(self, room_id: str, owner_uid: str):
+        if not owner_uid:
+            return
+        entry = self._entries.get(room_id)
+        if entry is None or entry.owner_uid != owner_uid or entry.ended_at is not None:
+            entry = _Entry(owner_uid=owner_uid)
+        self._put(room_id, entry)
+
+    def set_call(self, room_id: str, owner_uid: str, call_id: Optional[int]):
+        if not call_id:
+            return
+        entry = self._entries.get(room_id)
+        if entry is None or (owner_uid and entry.owner_uid != owner_uid):
+            entry = _Entry(owner_uid=owner_uid or "")
+        entry.call_id = int(call_id)
+        entry.ended_at = None
+        self._put(room_id, entry)
+
+    def end(self, room_id: str):
+        entry = self._entries.get(room_id)
+        if entry is not None and entry.ended_at is None:
+            entry.ended_at = time.monotonic()
+
+    def lookup(self, room_id: str, owner_uid: str = "") -> Tuple[str, Optional[int]]:
+        """
+        (owner_uid, call_id) for the room; ("", None) when unknown, expired or owned by
+        someone other than owner_uid. call_id may be None while accounting catches up.
+        """
+        entry = self._entries.get(room_id)
+        if entry is not None and entry.ended_at is not None and time.monotonic() - entry.ended_at > self.ttl:
+            del self._entries[room_id]
+            entry = None
+        if entry is None or not entry.owner_uid or (owner_uid and owner_uid != entry.owner_uid):
+            self.misses += 1
+            return "", None
+        self.hits += 1
+        return entry.owner_uid, entry.call_id
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+call_directory = CallDirectory(maxsize=CALL_DIRECTORY_SIZE, ttl=CALL_DIRECTORY_TTL)
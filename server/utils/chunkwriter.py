@@ -0,0 +1,231 @@
+## Off-loop writer for recording chunks (pipeline A)
+## /record/chunk hands the chunk to a per-session buffer and returns; a dedicated thread pool does
+## the write(), flush() and optional fsync(), so a slow disk delays only the recording files, not
+## the event loop that also serves signaling.
+## Chunks that arrive while a session's previous write is in flight are coalesced into one write.
+## Small chunks wait up to max_delay_ms for company (or until coalesce_bytes are buffered).
+## Durability (fsync policy):
+##   none   - never fsync, the OS writes back on its own
+##   chunks - fsync after every `fsync_every` chunks and on finish
+##   finish - fsync once when the session is closed
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from server.config import (
+    RECORD_WRITE_THREADS,
+    RECORD_WRITE_COALESCE_KB,
+    RECORD_WRITE_MAX_DELAY_MS,
+    RECORD_WRITE_MAX_BUFFER_MB,
+    RECORD_FSYNC,
+    RECORD_FSYNC_EVERY,
+)
+from server.utils.metrics import Histogram
+
+FSYNC_POLICIES = ("none", "chunks", "finish")
+
+
+class _Stream:
+    __slots__ = ("fh", "buf", "size", "chunks", "inflight", "unsynced", "task", "timer", "error")
+
+    def __init__(self, fh):
+        self.fh = fh
+        self.buf: List[bytes] = []
+        self.size = 0  ## bytes in buf
+        self.chunks = 0  ## chunks in buf
+        self.inflight = 0  ## bytes being written by the thread
+        self.unsynced = 0  ## chunks written since the last fsync
+        self.task: Optional[asyncio.Task] = None
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.error: Optional[BaseException] = None
+
+
+def _write(fh, data: bytes, sync: bool) -> Tuple[float, float]:
+    ## runs in the writer pool; returns (write ms, fsync ms)
+    t0 = time.perf_counter()
+    if data:
+        fh.write(data)
+        fh.flush()
+    t1 = time.perf_counter()
+    if sync:
+        os.fsync(fh.fileno())
+    return (t1 - t0) * 1000, (time.perf_counter() - t1) * 1000
+
+
+class ChunkWriter:
+    """
+    Per-session (key = recording_id) append buffers in front of open binary files.
+    - write() buffers and returns; a session never has more than one write in flight, so
+      chunks land in order. It waits only when the session has more than max_buffer bytes
+      pending (disk slower than the upload), which pushes back on that one client.
+    - a failed background write fails the session for good: every later write() raises it
+      without buffering and close() raises it, since the file has a gap and must not be delivered
+    - close() writes what is left, fsyncs unless the policy is none, and closes the file;
+      write() on a closed file (a chunk racing finish) raises instead of opening a new buffer
+    write_ms/fsync_ms are measured in the writer thread; chunk_lag_ms runs from the oldest
+    buffered chunk to the end of its write, i.e. how much a crash of the process could lose.
+    """
+
+    def __init__(self, threads: int = 2, coalesce_bytes: int = 256 * 1024, max_delay_ms: float = 1000,
+                 max_buffer: int = 32 * 1024 * 1024, fsync: str = "finish", fsync_every: int = 10):
+        self.threads = max(1, int(threads))
+        self.coalesce_bytes = max(0, int(coalesce_bytes))
+        self.max_delay = max(0.0, float(max_delay_ms)) / 1000.0
+        self.max_buffer = max(1, int(max_buffer))
+        self.fsync = fsync if fsync in FSYNC_POLICIES else "finish"
+        self.fsync_every = max(1, int(fsync_every))
+        self._streams: Dict[str, _Stream] = {}
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self.chunks = 0
+        self.writes = 0
+        self.bytes = 0
+        self.fsyncs = 0
+        self.errors = 0
+        self.write_ms = Histogram()
+        self.fsync_ms = Histogram()
+        self.chunk_lag_ms = Histogram()
+
+    def _executor(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="chunkwriter")
+        return self._pool
+
+    async def write(self, key: str, fh, data: bytes):
+        st = self._streams.get(key)
+        if st is None:
+            if fh.closed:
+                raise ValueError("recording file is closed")
+            st = self._streams[key] = _Stream(fh)
+        if st.error is not None:
+            raise st.error  ## sticky: the file has a gap, nothing after it may be written
+        st.buf.append(data)
+        st.size += len(data)
+        st.chunks += 1
+        self.chunks += 1
+        if st.size >= self.coalesce_bytes or not self.max_delay:
+            self._kick(key, time.perf_counter())
+        elif st.timer is None:
+            st.timer = asyncio.get_running_loop().call_later(self.max_delay, self._kick, key, time.perf_counter())
+        if st.size + st.inflight > self.max_buffer and st.task is not None:
+            await asyncio.shield(st.task)
+
+    def _kick(self, key: str, queued_at: float):
+        st = self._streams.get(key)
+        if st is None:
+            return
+        if st.timer is not None:
+            st.timer.cancel()
+            st.timer = None
+        if st.task is None or st.task.done():
+            st.task = asyncio.create_task(self._drain(st, queued_at))
+
+    async def _drain(self, st: _Stream, queued_at: float):
+        ## everything buffered meanwhile goes out in the next write
+        loop = asyncio.get_running_loop()
+        while st.buf:
+            data, chunks = b"".join(st.buf), st.chunks
+            st.buf, st.size, st.chunks, st.inflight = [], 0, 0, len(data)
+            sync = self.fsync == "chunks" and st.unsynced + chunks >= self.fsync_every
+            try:
+                write_ms, fsync_ms = await loop.run_in_executor(self._executor(), _write, st.fh, data, sync)
+            except Exception as e:
+                self.errors += 1
+                st.error = e
+                print(f"[RECORD] chunk write failed ({len(data)} bytes lost): {e}")
+                return
+            finally:
+                st.inflight = 0
+            self._account(len(data), write_ms, fsync_ms if sync else None)
+            st.unsynced = 0 if sync else st.unsynced + chunks
+            self.chunk_lag_ms.observe((time.perf_counter() - queued_at) * 1000)
+            queued_at = time.perf_counter()
+
+    def _account(self, size: int, write_ms: float, fsync_ms: Optional[float]):
+        if size:
+            self.writes += 1
+            self.bytes += size
+            self.write_ms.observe(write_ms)
+        if fsync_ms is not None:
+            self.fsyncs += 1
+            self.fsync_ms.observe(fsync_ms)
+
+    async def close(self, key: str, fh=None):
+        """
+        Write the rest, fsync per policy and close the file. fh is closed even if the
+        session never wrote through this writer (resumed after a restart, no chunk since).
+        Raises the error of a failed write (earlier background one or the final one) after
+        the file is closed; nothing after a failed write is written. Safe to call more than once.
+        """
+        st = self._streams.pop(key, None)
+        data = b""
+        error: Optional[BaseException] = None
+        if st is not None:
+            if st.timer is not None:
+                st.timer.cancel()
+            if st.task is not None:
+                await asyncio.shield(st.task)
+            data, fh, error = b"".join(st.buf), st.fh, st.error
+        if fh is None or fh.closed:
+            if error is not None:
+                raise error
+            return
+        loop = asyncio.get_running_loop()
+        sync = self.fsync != "none"
+        try:
+            if error is None:
+                write_ms, fsync_ms = await loop.run_in_executor(self._executor(), _write, fh, data, sync)
+                self._account(len(data), write_ms, fsync_ms if sync else None)
+        except Exception as e:
+            self.errors += 1
+            print(f"[RECORD] final chunk write failed: {e}")
+            error = e
+        finally:
+            await loop.run_in_executor(self._executor(), fh.close)
+            ## a chunk that raced this close must not leave a buffer behind
+            late = self._streams.get(key)
+            if late is not None and late.fh is fh:
+                del self._streams[key]
+        if error is not None:
+            raise error
+
+    async def close_all(self):
+        """
+        Shutdown: flush and close every open session file, then stop the threads.
+        Sessions stay resumable (their manifests are untouched).
+        """
+        for key in list(self._streams):
+            try:
+                await self.close(key)
+            except Exception as e:
+                print(f"[RECORD] {key}: {e}")
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self._streams),
+            "buffered_bytes": sum(s.size + s.inflight for s in self._streams.values()),
+            "fsync_policy": self.fsync,
+            "chunks": self.chunks,
+            "writes": self.writes,
+            "bytes": self.bytes,
+            "fsyncs": self.fsyncs,
+            "errors": self.errors,
+            "write_ms": self.write_ms.snapshot(),
+            "fsync_ms": self.fsync_ms.snapshot(),
+            "chunk_lag_ms": self.chunk_lag_ms.snapshot(),
+        }
+
+
+chunk_writer = ChunkWriter(
+    threads=RECORD_WRITE_THREADS,
+    coalesce_bytes=RECORD_WRITE_COALESCE_KB * 1024,
+    max_delay_ms=RECORD_WRITE_MAX_DELAY_MS,
+    max_buffer=RECORD_WRITE_MAX_BUFFER_MB * 1024 * 1024,
+    fsync=RECORD_FSYNC,
+    fsync_every=RECORD_FSYNC_EVERY,
+)
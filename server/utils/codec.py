@@ -0,0 +1,27 @@
+## Signaling codec: orjson when installed, stdlib json otherwise
+## Frames are encoded once per broadcast and the same text is queued for every recipient.
+
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  ## optional fast path
+    orjson = None
+
+CODEC = "orjson" if orjson is not None else "json"
+
+
+def dumps(obj: Any) -> str:
+    """
+    Encode a frame to compact JSON text (WebSocket text frames, the client parses with JSON.parse).
+    """
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -0,0 +1,80 @@
+## Server-driven heartbeat for signaling sockets
+## A single task pings every local peer, tracks liveness and reaps zombie connections
+## (e.g. Telegram WebViews that vanished without a close frame) long before the proxy timeout.
+
+import asyncio
+import time
+from typing import Optional
+
+from server.utils import codec
+
+
+class Heartbeat:
+    """
+    Every interval seconds each local peer gets {"type":"ping","ts":<ms>}; the
+    client echoes ts back in a pong and the signaling handler stores the RTT.
+    Any inbound frame refreshes peer.last_seen. A peer silent for more than
+    timeout seconds is reaped: its handler task is cancelled, so the normal
+    disconnect path (call accounting, leave, peer-left) runs for it.
+    Only peers that answered a ping at least once (peer.heartbeat) are reaped:
+    older clients without pong can sit quietly in a call and are left alone.
+    interval <= 0 disables the heartbeat.
+    """
+
+    def __init__(self, rooms, interval: float = 20.0, timeout: float = 60.0):
+        self.rooms = rooms
+        self.interval = float(interval)
+        self.timeout = max(float(timeout), self.interval)
+        self.reaped = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"[HEARTBEAT] tick failed: {e}")
+
+    def tick(self, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        ## one encoded ping per tick; an unsent ping is replaced by the newer one
+        ping = codec.dumps({"type": "ping", "ts": int(now * 1000)})
+        for room_id, room in self.rooms.iter_rooms():
+            for p in room.local_snapshot:
+                if p.heartbeat and now - p.last_seen > self.timeout:
+                    self.reap(room_id, p, now)
+                else:
+                    p.send(ping, key="ping")
+
+    def reap(self, room_id: str, peer, now: float):
+        if peer.reaped:
+            return
+        peer.reaped = True
+        self.reaped += 1
+        print(f"[HEARTBEAT] reaping stale peer room={room_id} peer={peer.id} silent={now - peer.last_seen:.0f}s")
+        if peer.task is not None and not peer.task.done():
+            peer.task.cancel()
+
+
+def rtt_from_pong(ts) -> Optional[float]:
+    """
+    RTT in ms for a pong echoing a ping ts, or None if ts is not ours.
+    """
+    if not isinstance(ts, (int, float)) or isinstance(ts, bool):
+        return None
+    rtt = time.monotonic() * 1000 - ts
+    return round(rtt, 1) if rtt >= 0 else None
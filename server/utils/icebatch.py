@@ -0,0 +1,68 @@
+## Trickle ICE coalescing for the relay path
+## Candidates for the same (from, to) pair are held for a short window and sent
+## as one 'ice-batch' frame: {"type": "ice-batch", "from": <pid>, "data": [<candidate>, ...]}
+
+import asyncio
+from typing import Any, Dict, List, Tuple
+
+from server.utils import codec
+
+
+class _Pending:
+    __slots__ = ("dst", "cands", "timer")
+
+    def __init__(self, dst):
+        self.dst = dst
+        self.cands: List[Any] = []
+        self.timer = None
+
+
+class IceBatcher:
+    """
+    Holds candidates at most window_ms after the first one of a burst, or until
+    max_batch candidates are queued, whichever comes first.
+    Non-ICE frames for the same pair must call flush_pair() first to keep order.
+    """
+
+    def __init__(self, window_ms: int = 15, max_batch: int = 16):
+        self.window = max(1, int(window_ms)) / 1000.0
+        self.max_batch = max(1, int(max_batch))
+        self._pending: Dict[Tuple[str, str], _Pending] = {}
+        self.frames_in = 0
+        self.frames_out = 0
+
+    def add(self, src_id: str, dst, cand: Any):
+        key = (src_id, dst.id)
+        pend = self._pending.get(key)
+        if pend is None:
+            pend = _Pending(dst)
+            self._pending[key] = pend
+            pend.timer = asyncio.get_running_loop().call_later(self.window, self._flush, key)
+        pend.cands.append(cand)
+        self.frames_in += 1
+        if len(pend.cands) >= self.max_batch:
+            self._flush(key)
+
+    def flush_pair(self, src_id: str, dst_id: str):
+        if (src_id, dst_id) in self._pending:
+            self._flush((src_id, dst_id))
+
+    def drop_peer(self, pid: str):
+        """
+        Forget pending batches from or to a peer that left.
+        """
+        for key in [k for k in self._pending if pid in k]:
+            pend = self._pending.pop(key)
+            if pend.timer:
+                pend.timer.cancel()
+
+    def _flush(self, key: Tuple[str, str]):
+        pend = self._pending.pop(key, None)
+        if pend is None:
+            return
+        if pend.timer:
+            pend.timer.cancel()
+        if not pend.cands:
+            return
+        self.frames_out += 1
+        pend.dst.send(codec.dumps({"type": "ice-batch", "from": key[0], "data": pend.cands}))
@@ -0,0 +1,109 @@
+## Per-peer bounded outbound queue drained by its own writer task
+## Broadcasts only enqueue, so a slow or half-dead peer never stalls the sender.
+
+import asyncio
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from server.utils import codec
+
+POLICIES = ("drop", "coalesce", "disconnect")
+
+
+class Outbox:
+    """
+    Bounded FIFO of outgoing frames for one WebSocket.
+    Frames are pre-encoded JSON text (shared by all recipients of a broadcast)
+    or dicts, which are encoded by the writer.
+    The policy decides what happens under pressure:
+      - drop: when full, the new frame is discarded
+      - coalesce: a queued frame with the same key (state frames such as
+        peer-info/owner-set) is replaced in place; when full, the new frame is discarded
+      - disconnect: when full, the socket is closed and the normal disconnect path cleans up
+    """
+
+    def __init__(self, ws, maxsize: int = 256, policy: str = "coalesce", label: str = ""):
+        self.ws = ws
+        self.maxsize = max(1, int(maxsize))
+        self.policy = policy if policy in POLICIES else "coalesce"
+        self.label = label
+        self.dropped = 0
+        self.closed = False
+        self._queue: Deque[List[Any]] = deque()  ## [key, frame] pairs, mutable for coalescing
+        self._keyed: Dict[str, List[Any]] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if not self._task:
+            self._task = asyncio.create_task(self._run())
+
+    def __len__(self):
+        return len(self._queue)
+
+    def put(self, frame: Any, key: Optional[str] = None) -> bool:
+        """
+        Enqueue a frame without waiting. Returns False if the frame was not queued.
+        """
+        if self.closed:
+            return False
+        if key and self.policy == "coalesce":
+            entry = self._keyed.get(key)
+            if entry is not None:
+                entry[1] = frame
+                return True
+        if len(self._queue) >= self.maxsize:
+            return self._overflow()
+        entry = [key, frame]
+        self._queue.append(entry)
+        if key:
+            self._keyed[key] = entry
+        self._wakeup.set()
+        return True
+
+    def _overflow(self) -> bool:
+        self.dropped += 1
+        if self.policy == "disconnect":
+            print(f"[WS] outbox full, disconnecting peer={self.label} queued={len(self._queue)}")
+            self.closed = True
+            asyncio.create_task(self._abort())
+        elif self.dropped == 1 or self.dropped % 100 == 0:
+            print(f"[WS] outbox full, dropped frames peer={self.label} total={self.dropped}")
+        return False
+
+    async def _run(self):
+        try:
+            while True:
+                if not self._queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                entry = self._queue.popleft()
+                key, frame = entry
+                if key and self._keyed.get(key) is entry:
+                    del self._keyed[key]
+                await self.ws.send_text(frame if isinstance(frame, str) else codec.dumps(frame))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[WS] writer stopped peer={self.label}: {e}")
+            self.closed = True
+
+    async def _abort(self):
+        if self._task:
+            self._task.cancel()
+        try:
+            await asyncio.wait_for(self.ws.close(code=1013), timeout=5)
+        except Exception:
+            pass
+
+    def close(self):
+        """
+        Stop the writer; frames still queued are discarded (the socket is going away).
+        """
+        self.closed = True
+        self._queue.clear()
+        self._keyed.clear()
+        if self._task:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,233 @@
+## On-disk state of recordings: session manifests and pending transcode jobs
+## Recording sessions (server/routes/record.py ACTIVE) hold open files, FIFOs and ffmpeg processes
+## that do not survive a restart. Each session also gets a JSON manifest here, and every queued
+## transcode job a JSON file, so the next start can resume or finalize what was left behind.
+## Layout: <dir>/sessions/<recording_id>.json, <dir>/jobs/<job_id>.json
+## Files are written to a temp name, fsynced and renamed, so a crash leaves the old or the new one.
+## Recording state is per process (ACTIVE), so this assumes one app worker, as deployed.
+
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from server.config import RECORD_STATE_DIR
+from server.utils import codec
+
+## session keys that are runtime state, never written to the manifest
+RUNTIME_KEYS = ("file_handle", "fifo_writer", "ffmpeg_proc", "writing")
+
+
+def _safe_name(s: str) -> str:
+    return "".join(c for c in s if c.isalnum() or c in ("-", "_", "."))
+
+
+def _write_atomic(path: str, data: Dict[str, Any]):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(codec.dumps(data))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _load_dir(directory: str) -> List[Dict[str, Any]]:
+    out = []
+    try:
+        names = sorted(os.listdir(directory))
+    except FileNotFoundError:
+        return out
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                out.append(codec.loads(f.read()))
+        except (OSError, ValueError) as e:
+            print(f"[RECSTATE] unreadable {path}, removed: {e}")
+            _remove(path)
+    return out
+
+
+class RecordingStore:
+    """
+    Blocking file operations; the async helpers run them in a thread.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.sessions_dir = os.path.join(directory, "sessions")
+        self.jobs_dir = os.path.join(directory, "jobs")
+        os.makedirs(self.sessions_dir, exist_ok=True)
+        os.makedirs(self.jobs_dir, exist_ok=True)
+
+    def _session_path(self, recording_id: str) -> str:
+        return os.path.join(self.sessions_dir, _safe_name(recording_id) + ".json")
+
+    def _job_path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, _safe_name(job_id) + ".json")
+
+    ## Sessions
+
+    def save_session(self, recording_id: str, session: Dict[str, Any]):
+        manifest = {k: v for k, v in session.items() if k not in RUNTIME_KEYS}
+        manifest["recording_id"] = recording_id
+        manifest["saved_at"] = time.time()
+        _write_atomic(self._session_path(recording_id), manifest)
+
+    def remove_session(self, recording_id: str):
+        _remove(self._session_path(recording_id))
+
+    def load_sessions(self) -> List[Dict[str, Any]]:
+        return _load_dir(self.sessions_dir)
+
+    async def asave_session(self, recording_id: str, session: Dict[str, Any]):
+        try:
+            await asyncio.to_thread(self.save_session, recording_id, session)
+        except OSError as e:
+            print(f"[RECSTATE] session manifest {recording_id} not saved: {e}")
+
+    async def aremove_session(self, recording_id: str):
+        try:
+            await asyncio.to_thread(self.remove_session, recording_id)
+        except OSError as e:
+            print(f"[RECSTATE] session manifest {recording_id} not removed: {e}")
+
+    ## Transcode jobs
+
+    def save_job(self, job: Dict[str, Any]):
+        _write_atomic(self._job_path(job["id"]), job)
+
+    def remove_job(self, job_id: str):
+        _remove(self._job_path(job_id))
+
+    def load_jobs(self) -> List[Dict[str, Any]]:
+        return sorted(_load_dir(self.jobs_dir), key=lambda j: j.get("created_at") or 0)
+
+
+store = RecordingStore(RECORD_STATE_DIR)
+
+
+def last_activity(manifest: Dict[str, Any]) -> float:
+    """
+    Latest sign of life of a persisted session: its manifest, or the newest data file
+    (chunks are not written to the manifest, the part file or segments are).
+    """
+    ts = float(manifest.get("last_activity") or manifest.get("saved_at") or 0)
+    paths = []
+    if manifest.get("part_path"):
+        paths.append(manifest["part_path"])
+    session_dir = manifest.get("session_dir")
+    if session_dir and os.path.isdir(session_dir):
+        paths += [os.path.join(session_dir, f) for f in os.listdir(session_dir)]
+    for p in paths:
+        try:
+            ts = max(ts, os.path.getmtime(p))
+        except OSError:
+            pass
+    return ts
+
+
+class SessionSweeper:
+    """
+    Finalizes recording sessions nobody writes to anymore (tab closed, network gone) so
+    their files are delivered instead of growing stale in ACTIVE.
+    - active: the recording_id -> session dict of the routes; sessions carry "last_activity"
+      and "writing", the number of chunk requests currently writing to them; a session with
+      a chunk being written is never taken, its data would go to an already closed file
+    - finalize(recording_id, session) is awaited for each expired session after it was
+      removed from active; its errors are logged
+    - idle_sec: inactivity before a session counts as abandoned
+    - paused_idle_sec: the same for sessions marked "paused" (no chunks are sent while
+      paused; the client pings instead, this only bounds a paused tab that went away)
+    - adopt(): sessions not in active that must be finalized anyway (startup recovery);
+      the job's first pass takes them, so start() does not wait for ffmpeg or the bot
+    interval <= 0 or idle_sec <= 0 disables the periodic sweep (adopted sessions still run).
+    """
+
+    def __init__(self, active: Dict[str, Dict[str, Any]],
+                 finalize: Callable[[str, Dict[str, Any]], Awaitable[Any]],
+                 interval: float = 60, idle_sec: float = 900, paused_idle_sec: float = 14400):
+        self.active = active
+        self.finalize = finalize
+        self.interval = float(interval)
+        self.idle_sec = float(idle_sec)
+        self.paused_idle_sec = max(float(paused_idle_sec), self.idle_sec)
+        self.expired = 0
+        self.adopted: List[Tuple[str, Dict[str, Any]]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def _enabled(self) -> bool:
+        return self.interval > 0 and self.idle_sec > 0
+
+    def start(self):
+        if self._task is None and (self._enabled() or self.adopted):
+            self._task = asyncio.create_task(self._run())
+
+    def adopt(self, recording_id: str, session: Dict[str, Any]):
+        self.adopted.append((recording_id, session))
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"active": len(self.active), "adopted": len(self.adopted), "expired": self.expired}
+
+    async def _run(self):
+        while True:
+            if self.adopted:
+                await self.run_adopted()
+            if not self._enabled():
+                return
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"[RECSTATE] sweep failed: {e}")
+
+    def limit(self, session: Dict[str, Any]) -> float:
+        return self.paused_idle_sec if session.get("paused") else self.idle_sec
+
+    def expired_at(self, session: Dict[str, Any], now: float) -> bool:
+        if session.get("writing"):
+            return False
+        return now - float(session.get("last_activity") or 0) > self.limit(session)
+
+    def idle(self, now: Optional[float] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        now = now or time.time()
+        return [(rid, s) for rid, s in self.active.items() if self.expired_at(s, now)]
+
+    async def run_adopted(self):
+        while self.adopted:
+            recording_id, session = self.adopted.pop(0)
+            try:
+                await self.finalize(recording_id, session)
+            except Exception as e:
+                print(f"[RECSTATE] finalize of recovered session {recording_id} failed: {e}")
+
+    async def run_once(self):
+        for recording_id, session in self.idle():
+            ## earlier finalizes awaited: check again, a chunk may have arrived meanwhile
+            if self.active.get(recording_id) is not session or not self.expired_at(session, time.time()):
+                continue
+            del self.active[recording_id]
+            self.expired += 1
+            print(f"[RECSTATE] session {recording_id} idle for {self.limit(session):.0f}s, finalizing")
+            try:
+                await self.finalize(recording_id, session)
+            except Exception as e:
+                print(f"[RECSTATE] finalize of idle session {recording_id} failed: {e}")
@@ -0,0 +1,209 @@
+## Room bus: share room membership and signaling frames between workers/nodes
+## Backends:
+##   - local: in-process hub (single worker; several managers on one hub stand in for several workers)
+##   - redis: Redis-compatible pub/sub, one channel per room (requires the optional `redis` package)
+
+import asyncio
+import secrets
+from typing import Any, Callable, Dict, Optional, Set
+
+from server.utils import codec
+
+Handler = Callable[[str, Dict[str, Any]], None]
+
+
+class RoomBus:
+    """
+    Base bus. Envelopes are small dicts with a "kind" key; the bus stamps them with
+    the publishing node id and never delivers a node its own envelopes.
+    publish() never waits: backends queue and deliver in the background.
+    """
+
+    def __init__(self, node_id: Optional[str] = None):
+        self.node_id = node_id or secrets.token_hex(4)
+        self._handler: Optional[Handler] = None
+
+    def set_handler(self, handler: Handler):
+        self._handler = handler
+
+    def _deliver(self, room_id: str, env: Dict[str, Any]):
+        if env.get("node") == self.node_id or not self._handler:
+            return
+        try:
+            self._handler(room_id, env)
+        except Exception as e:
+            print(f"[BUS] handler failed room={room_id} kind={env.get('kind')}: {e}")
+
+    async def start(self):
+        pass
+
+    async def subscribe(self, room_id: str):
+        pass
+
+    async def unsubscribe(self, room_id: str):
+        pass
+
+    def publish(self, room_id: str, env: Dict[str, Any]):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class LocalHub:
+    """
+    In-process rendezvous for LocalBus instances: room_id -> subscribed buses.
+    """
+
+    def __init__(self):
+        self.rooms: Dict[str, Set["LocalBus"]] = {}
+
+
+class LocalBus(RoomBus):
+    """
+    In-process backend. With a single bus on the hub it is a no-op; several buses
+    sharing one hub behave like separate workers behind a real pub/sub server.
+    """
+
+    def __init__(self, hub: Optional[LocalHub] = None, node_id: Optional[str] = None):
+        super().__init__(node_id)
+        self.hub = hub or LocalHub()
+
+    async def subscribe(self, room_id: str):
+        self.hub.rooms.setdefault(room_id, set()).add(self)
+
+    async def unsubscribe(self, room_id: str):
+        subs = self.hub.rooms.get(room_id)
+        if subs is not None:
+            subs.discard(self)
+            if not subs:
+                self.hub.rooms.pop(room_id, None)
+
+    def publish(self, room_id: str, env: Dict[str, Any]):
+        subs = self.hub.rooms.get(room_id)
+        if not subs or (len(subs) == 1 and self in subs):
+            return
+        env = dict(env, node=self.node_id)
+        loop = asyncio.get_running_loop()
+        for bus in list(subs):
+            if bus is not self:
+                loop.call_soon(bus._deliver, room_id, env)
+
+    async def close(self):
+        for room_id in [r for r, subs in self.hub.rooms.items() if self in subs]:
+            await self.unsubscribe(room_id)
+
+
+class RedisBus(RoomBus):
+    """
+    Redis pub/sub backend (works with any server speaking the Redis protocol).
+    Each room maps to channel <prefix><room_id>; a node subscribes only while it
+    holds local peers in that room. Envelopes are JSON; relayed frames stay
+    pre-encoded text inside them.
+    """
+
+    def __init__(self, url: str, prefix: str = "tgringer:room:", node_id: Optional[str] = None):
+        super().__init__(node_id)
+        self.url = url
+        self.prefix = prefix
+        self._redis = None
+        self._pubsub = None
+        self._outq: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self._subscribed = asyncio.Event()
+
+    async def start(self):
+        if self._redis is not None:
+            return
+        try:
+            import redis.asyncio as aioredis
+        except ImportError as e:
+            raise RuntimeError("ROOM_BUS=redis requires the 'redis' package (pip install redis)") from e
+        self._redis = aioredis.from_url(self.url)
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        self._outq = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._reader()), asyncio.create_task(self._publisher())]
+        print(f"[BUS] redis bus started node={self.node_id} url={self.url}")
+
+    async def subscribe(self, room_id: str):
+        await self._pubsub.subscribe(self.prefix + room_id)
+        self._subscribed.set()
+
+    async def unsubscribe(self, room_id: str):
+        await self._pubsub.unsubscribe(self.prefix + room_id)
+
+    def publish(self, room_id: str, env: Dict[str, Any]):
+        if self._outq is None:
+            return
+        self._outq.put_nowait((self.prefix + room_id, codec.dumps(dict(env, node=self.node_id))))
+
+    async def _publisher(self):
+        while True:
+            channel, data = await self._outq.get()
+            try:
+                await self._redis.publish(channel, data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[BUS] publish failed channel={channel}: {e}")
+
+    async def _reader(self):
+        plen = len(self.prefix)
+        while True:
+            try:
+                if not self._pubsub.subscribed:
+                    self._subscribed.clear()
+                    await self._subscribed.wait()
+                msg = await self._pubsub.get_message(timeout=1.0)
+                if not msg or msg.get("type") != "message":
+                    continue
+                channel = msg["channel"]
+                if isinstance(channel, bytes):
+                    channel = channel.decode()
+                self._deliver(channel[plen:], codec.loads(msg["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[BUS] reader error: {e}")
+                await asyncio.sleep(1)
+
+    async def close(self):
+        for t in self._tasks:
+            t.cancel()
+        self._tasks = []
+        try:
+            if self._pubsub is not None:
+                await self._pubsub.close()
+            if self._redis is not None:
+                await self._redis.close()
+        except Exception:
+            pass
+        self._redis = None
+        self._pubsub = None
+
+
+class RemoteOutbox:
+    """
+    Outbox stand-in for a peer held by another node: frames go over the bus.
+    """
+
+    closed = False
+
+    def __init__(self, bus: RoomBus, room_id: str, pid: str):
+        self.bus = bus
+        self.room_id = room_id
+        self.pid = pid
+
+    def put(self, frame: Any, key: Optional[str] = None) -> bool:
+        self.bus.publish(self.room_id, {"kind": "frame", "to": self.pid, "frame": frame})
+        return True
+
+    def close(self):
+        pass
+
+
+def make_bus(kind: str, url: str = "") -> RoomBus:
+    kind = (kind or "local").lower().strip()
+    if kind == "redis":
+        return RedisBus(url or "redis://127.0.0.1:6379/0")
+    return LocalBus()
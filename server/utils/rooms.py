@@ -1,66 +1,414 @@
 import asyncio
 import secrets
-from dataclasses import dataclass
-from typing import Dict, Optional, List
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, Optional, List, Tuple
 
+from server.utils.outbox import Outbox
+from server.utils.roombus import LocalBus, RemoteOutbox, RoomBus
 
-@dataclass
+
+## Peer and Room are slotted: no per-instance __dict__, and every piece of state
+## is declared here (assigning an undeclared attribute raises AttributeError).
+## Sizing numbers: python -m bench.bench_memory
+
+@dataclass(slots=True)
 class Peer:
     id: str
-    ws: any  ## WebSocket
-    joined_at: float
+    ws: Any  ## WebSocket (None for peers held by another node)
+    joined_at: float  ## wall clock, comparable across nodes
     name: Optional[str] = None  ## display name (sent by client)
     uid: Optional[str] = None   ## stable user identity (tg_user_id or client id)
     avatar: Optional[str] = None  ## avatar url if any
+    outbox: Optional[Outbox] = None  ## outbound queue drained by the peer's writer task
+    node: Optional[str] = None  ## bus node holding the socket; None for peers connected here
+    last_seen: float = 0.0  ## time.monotonic() of the last inbound frame (local peers)
+    rtt_ms: Optional[float] = None  ## last ping round trip measured by the heartbeat
+    task: Optional[asyncio.Task] = None  ## signaling handler task (local peers)
+    heartbeat: bool = False  ## answered a ping: the client speaks the heartbeat, the reaper may evict it
+    reaped: bool = False  ## evicted by the heartbeat reaper
 
+    def send(self, frame: Any, key: Optional[str] = None) -> bool:
+        """
+        Queue a frame for this peer without waiting for the socket.
+        Frames with the same key may be coalesced (latest wins).
+        """
+        if self.outbox is None:
+            return False
+        return self.outbox.put(frame, key)
 
-@dataclass
+    def describe(self) -> Dict[str, str]:
+        return {
+            "id": self.id,
+            "name": self.name or "",
+            "avatar": self.avatar or "",
+            "uid": self.uid or ""
+        }
+
+    def joined_before(self, other: "Peer") -> bool:
+        return (self.joined_at, self.id) < (other.joined_at, other.id)
+
+
+@dataclass(slots=True)
 class Room:
-    peers: Dict[str, Peer]
-    owner_uid: Optional[str] = None  ## room owner identity (first user hello with uid)
+    """
+    Membership is changed only through add/remove/set_uid/set_owner so the
+    derived state stays in step with peers:
+      - uid index (uid -> peers with that uid, usually one)
+      - count of non-owner peers with a uid (call accounting on disconnect)
+      - immutable tuples of all / local peers, rebuilt on the first read
+        after a join or leave; broadcasts iterate them without copying
+    """
+    peers: Dict[str, Peer] = field(default_factory=dict)
+    owner_uid: Optional[str] = None  ## room owner identity (first user hello with uid); change via set_owner
+    non_owner_count: int = 0  ## peers with a uid other than owner_uid (only counted once an owner is set)
+    local_count: int = 0  ## peers connected to this node
+    created_at: float = field(default_factory=time.time)
+    call_id: Optional[int] = None  ## call_logs.id, set by call accounting once the owner joined
+    record_state: Optional[str] = None  ## "recording" | "paused" | None, from the owner's record-* frames
+    record_since: float = 0.0  ## wall clock of the last record_state change
+    _by_uid: Dict[str, Dict[str, Peer]] = field(default_factory=dict, repr=False)
+    _all: Optional[Tuple[Peer, ...]] = field(default=None, repr=False)
+    _local: Optional[Tuple[Peer, ...]] = field(default=None, repr=False)
+
+    ## Membership changes
+
+    def add(self, peer: Peer):
+        if peer.id in self.peers:
+            self.remove(peer.id)
+        self.peers[peer.id] = peer
+        if peer.uid:
+            self._by_uid.setdefault(peer.uid, {})[peer.id] = peer
+        if self._is_non_owner(peer):
+            self.non_owner_count += 1
+        if peer.node is None:
+            self.local_count += 1
+        self._all = self._local = None
+
+    def remove(self, pid: str) -> Optional[Peer]:
+        peer = self.peers.pop(pid, None)
+        if peer is None:
+            return None
+        self._unindex(peer)
+        if self._is_non_owner(peer):
+            self.non_owner_count -= 1
+        if peer.node is None:
+            self.local_count -= 1
+        self._all = self._local = None
+        return peer
+
+    def set_uid(self, peer: Peer, uid: Optional[str]):
+        if self.peers.get(peer.id) is not peer:
+            peer.uid = uid
+            return
+        if peer.uid == uid:
+            return
+        was = self._is_non_owner(peer)
+        self._unindex(peer)
+        peer.uid = uid
+        if uid:
+            self._by_uid.setdefault(uid, {})[peer.id] = peer
+        self.non_owner_count += int(self._is_non_owner(peer)) - int(was)
+
+    def set_owner(self, owner_uid: Optional[str]):
+        self.owner_uid = owner_uid
+        self.non_owner_count = sum(1 for p in self.peers.values() if self._is_non_owner(p))
+
+    def _is_non_owner(self, p: Peer) -> bool:
+        return bool(p.uid and self.owner_uid and p.uid != self.owner_uid)
+
+    def _unindex(self, peer: Peer):
+        if not peer.uid:
+            return
+        bucket = self._by_uid.get(peer.uid)
+        if bucket is not None:
+            bucket.pop(peer.id, None)
+            if not bucket:
+                self._by_uid.pop(peer.uid, None)
+
+    ## Reads
+
+    @property
+    def snapshot(self) -> Tuple[Peer, ...]:
+        if self._all is None:
+            self._all = tuple(self.peers.values())
+        return self._all
+
+    @property
+    def local_snapshot(self) -> Tuple[Peer, ...]:
+        if self._local is None:
+            self._local = tuple(p for p in self.peers.values() if p.node is None)
+        return self._local
 
     def other_peer(self, pid: str):
-        for k, p in self.peers.items():
-            if k != pid:
+        for p in self.snapshot[:2]:
+            if p.id != pid:
                 return p
         return None
 
-    def list_peers_except(self, pid: str) -> List[Peer]:
-        return [p for k, p in self.peers.items() if k != pid]
+    def list_peers_except(self, pid: str) -> Tuple[Peer, ...]:
+        peers = self.snapshot
+        if pid not in self.peers:
+            return peers
+        return tuple(p for p in peers if p.id != pid)
+
+    def local_peers_except(self, pid: str) -> Tuple[Peer, ...]:
+        peers = self.local_snapshot
+        if pid not in self.peers:
+            return peers
+        return tuple(p for p in peers if p.id != pid)
+
+    def has_local_peers(self) -> bool:
+        return self.local_count > 0
 
     def find_by_uid(self, uid: str) -> Optional[Peer]:
-        for p in self.peers.values():
-            if p.uid and p.uid == uid:
-                return p
-        return None
+        bucket = self._by_uid.get(uid) if uid else None
+        if not bucket:
+            return None
+        return next(iter(bucket.values()))
+
+    def other_non_owner_count(self, peer: Peer) -> int:
+        """
+        Non-owner peers left in the room once `peer` is gone.
+        """
+        n = self.non_owner_count
+        if self.peers.get(peer.id) is peer and self._is_non_owner(peer):
+            n -= 1
+        return n
+
+
+@dataclass
+class _Shard:
+    rooms: Dict[str, Room] = field(default_factory=dict)
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
 
 
 class RoomManager:
-    def __init__(self):
-        self.rooms: Dict[str, Room] = {}
-        self.lock = asyncio.Lock()
+    """
+    Rooms are spread over independent shards keyed by room id hash.
+    join/leave lock only the shard of their room, so unrelated rooms never wait
+    on each other; get_room is a plain lock-free dict read.
+
+    Peers connected to other workers/nodes are mirrored from the room bus as
+    Peer entries with node set; sending to them publishes on the bus. A room
+    exists here only while it has local peers.
+    Bus envelopes: join/info/leave (peer state), owner, here (roster reply to
+    a joining node), frame (signaling frame for one peer) and alive (node heartbeat).
+    on_remote(event, room_id, room, peer, extra) is called after mirrored state
+    changes so the signaling layer can notify local peers.
+
+    For every pair of peers on different nodes the older one is told about the
+    newer one ("joined") and the newer one gets the older in its roster ("here"),
+    so exactly one side makes the offer. Order is (joined_at, id), which assumes
+    roughly synchronized clocks between hosts.
+
+    A node that crashes never sends its leaves, so every node_ttl/3 seconds each
+    node publishes "alive" in the rooms it shares with other nodes, and mirrors
+    of a node not heard from (any envelope) for node_ttl seconds are evicted like
+    a leave. node_ttl <= 0 disables this.
+    """
+
+    def __init__(self, shards: int = 64, bus: Optional[RoomBus] = None, node_ttl: float = 30.0):
+        self._shards: List[_Shard] = [_Shard() for _ in range(max(1, int(shards)))]
+        self.bus = bus or LocalBus()
+        self.bus.set_handler(self._on_bus)
+        self.on_remote: Optional[Callable[[str, str, Room, Optional[Peer], Dict[str, Any]], None]] = None
+        self._bus_started = False
+        self.node_ttl = float(node_ttl)
+        self.evicted = 0
+        self._node_seen: Dict[str, float] = {}  ## node id -> time.monotonic() of its last envelope
+        self._liveness: Optional[asyncio.Task] = None
+
+    def _shard(self, room_id: str) -> _Shard:
+        return self._shards[hash(room_id) % len(self._shards)]
 
     async def join(self, room_id: str, ws):
-        async with self.lock:
-            room = self.rooms.get(room_id)
+        if not self._bus_started:
+            await self.bus.start()
+            self._bus_started = True
+            if self.node_ttl > 0 and self._liveness is None:
+                self._liveness = asyncio.create_task(self._run_liveness())
+        shard = self._shard(room_id)
+        async with shard.lock:
+            room = shard.rooms.get(room_id)
             if not room:
-                room = Room(peers={})
-                self.rooms[room_id] = room
+                room = Room()
+                shard.rooms[room_id] = room
+                await self.bus.subscribe(room_id)
             pid = secrets.token_hex(4)
-            peer = Peer(id=pid, ws=ws, joined_at=asyncio.get_event_loop().time())
-            room.peers[pid] = peer
+            peer = Peer(id=pid, ws=ws, joined_at=time.time())
+            room.add(peer)
+            self.bus.publish(room_id, {"kind": "join", "peer": self._bus_desc(peer)})
             return peer
 
     async def leave(self, room_id: str, pid: str):
-        async with self.lock:
-            room = self.rooms.get(room_id)
+        shard = self._shard(room_id)
+        async with shard.lock:
+            room = shard.rooms.get(room_id)
             if not room:
                 return
-            room.peers.pop(pid, None)
-            if not room.peers:
-                self.rooms.pop(room_id, None)
+            peer = room.remove(pid)
+            if peer is not None and peer.node is None:
+                self.bus.publish(room_id, {"kind": "leave", "id": pid})
+            if not room.has_local_peers():
+                shard.rooms.pop(room_id, None)
+                await self.bus.unsubscribe(room_id)
 
     async def get_room(self, room_id: str):
-        async with self.lock:
-            return self.rooms.get(room_id)
+        return self._shard(room_id).rooms.get(room_id)
+
+    def iter_rooms(self) -> Iterator[Tuple[str, Room]]:
+        """
+        All rooms held here, shard by shard (do not await while iterating).
+        """
+        for shard in self._shards:
+            yield from shard.rooms.items()
+
+    def room_count(self) -> int:
+        return sum(len(s.rooms) for s in self._shards)
+
+    def publish_info(self, room_id: str, peer: Peer):
+        """
+        Announce updated name/uid/avatar of a local peer to other nodes.
+        """
+        self.bus.publish(room_id, {"kind": "info", "peer": self._bus_desc(peer)})
+
+    def publish_owner(self, room_id: str, owner_uid: str):
+        self.bus.publish(room_id, {"kind": "owner", "owner_uid": owner_uid})
+
+    async def close(self):
+        if self._liveness is not None:
+            self._liveness.cancel()
+            try:
+                await self._liveness
+            except asyncio.CancelledError:
+                pass
+            self._liveness = None
+        await self.bus.close()
+        self._bus_started = False
+
+    ## Node liveness
+
+    async def _run_liveness(self):
+        while True:
+            await asyncio.sleep(self.node_ttl / 3)
+            try:
+                self.check_nodes()
+            except Exception as e:
+                print(f"[ROOMS] node liveness check failed: {e}")
+
+    def check_nodes(self, now: Optional[float] = None):
+        """
+        Publish "alive" in every room shared with another node and evict the
+        mirrors of nodes silent for longer than node_ttl.
+        """
+        now = time.monotonic() if now is None else now
+        for room_id, room in list(self.iter_rooms()):
+            remote = [p for p in room.snapshot if p.node is not None]
+            if not remote:
+                continue
+            self.bus.publish(room_id, {"kind": "alive"})
+            for peer in remote:
+                if now - self._node_seen.get(peer.node, 0.0) > self.node_ttl:
+                    room.remove(peer.id)
+                    self.evicted += 1
+                    print(f"[ROOMS] evicted peer={peer.id} of silent node={peer.node} room={room_id}")
+                    self._notify("left", room_id, room, peer, {})
+        ## every mirror of a silent node is gone now; a late envelope registers it again
+        for node in [n for n, ts in self._node_seen.items() if now - ts > self.node_ttl]:
+            del self._node_seen[node]
+
+    ## Bus side: mirror remote peers (runs on the event loop, no awaits)
+
+    @staticmethod
+    def _bus_desc(peer: Peer) -> Dict[str, Any]:
+        return dict(peer.describe(), ts=peer.joined_at)
+
+    def _mirror(self, room_id: str, room: Room, desc: Dict[str, Any], node: str) -> Optional[Peer]:
+        pid = desc.get("id")
+        if not pid:
+            return None
+        peer = room.peers.get(pid)
+        if peer is None:
+            peer = Peer(id=pid, ws=None, joined_at=float(desc.get("ts") or time.time()), node=node)
+            peer.outbox = RemoteOutbox(self.bus, room_id, pid)
+            room.add(peer)
+        elif peer.node is None:
+            return None  ## never let the bus overwrite a local peer
+        peer.name = desc.get("name") or None
+        room.set_uid(peer, desc.get("uid") or None)
+        peer.avatar = desc.get("avatar") or None
+        return peer
+
+    def _notify(self, event: str, room_id: str, room: Room, peer: Optional[Peer], extra: Dict[str, Any]):
+        if self.on_remote:
+            try:
+                self.on_remote(event, room_id, room, peer, extra)
+            except Exception as e:
+                print(f"[ROOMS] on_remote failed event={event} room={room_id}: {e}")
+
+    def _on_bus(self, room_id: str, env: Dict[str, Any]):
+        kind = env.get("kind")
+        node = env.get("node") or ""
+        self._node_seen[node] = time.monotonic()
+        if kind == "alive":
+            return
+        room = self._shard(room_id).rooms.get(room_id)
+        if room is None:
+            return
+
+        if kind == "frame":
+            dst = room.peers.get(env.get("to") or "")
+            if dst is not None and dst.node is None:
+                dst.send(env.get("frame"))
+            return
+
+        if kind == "join":
+            peer = self._mirror(room_id, room, env.get("peer") or {}, node)
+            if peer is None:
+                return
+            older = [p for p in room.local_peers_except(peer.id) if p.joined_before(peer)]
+            if older:
+                self._notify("joined", room_id, room, peer, {"to": older})
+            ## Tell the joining node who is connected here
+            self.bus.publish(room_id, {
+                "kind": "here",
+                "to_node": node,
+                "for": peer.id,
+                "owner_uid": room.owner_uid or "",
+                "peers": [self._bus_desc(p) for p in room.local_peers_except(peer.id)],
+            })
+            return
+
+        if kind == "here":
+            if env.get("to_node") != self.bus.node_id:
+                return
+            target = room.peers.get(env.get("for") or "")
+            if not room.owner_uid and env.get("owner_uid"):
+                room.set_owner(env["owner_uid"])
+            mirrors = [m for m in (self._mirror(room_id, room, d, node) for d in env.get("peers") or []) if m]
+            if target is not None and target.node is None:
+                older = [m for m in mirrors if m.joined_before(target)]
+                if older:
+                    self._notify("here", room_id, room, target, {"peers": older})
+            return
+
+        if kind == "info":
+            peer = self._mirror(room_id, room, env.get("peer") or {}, node)
+            if peer is not None:
+                self._notify("info", room_id, room, peer, {})
+            return
+
+        if kind == "owner":
+            owner_uid = env.get("owner_uid") or ""
+            if owner_uid and not room.owner_uid:
+                room.set_owner(owner_uid)
+                self._notify("owner", room_id, room, None, {})
+            return
 
+        if kind == "leave":
+            peer = room.peers.get(env.get("id") or "")
+            if peer is not None and peer.node is not None:
+                room.remove(peer.id)
+                self._notify("left", room_id, room, peer, {})
+            return
@@ -0,0 +1,63 @@
+## Telegram WebApp authentication for owner-scoped read APIs (/calls, /usage)
+## The Mini App sends its raw initData in the X-Telegram-Init-Data header; it is signed by
+## Telegram with a key derived from BOT_TOKEN, so the user id in it can be trusted:
+##   secret = HMAC_SHA256(key="WebAppData", msg=BOT_TOKEN)
+##   hash   = hex(HMAC_SHA256(key=secret, msg="\n".join(sorted("k=v" for every field but hash))))
+## Internal callers (bot, ops tools) may send X-Internal-Token = INTERNAL_API_TOKEN instead.
+
+import hashlib
+import hmac
+import time
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qsl
+
+from fastapi import HTTPException, Request
+
+from server.config import BOT_TOKEN, TG_INIT_DATA_MAX_AGE_SEC, INTERNAL_API_TOKEN
+from server.utils import codec
+
+INIT_DATA_HEADER = "X-Telegram-Init-Data"
+INTERNAL_TOKEN_HEADER = "X-Internal-Token"
+
+
+def verify_init_data(init_data: str, bot_token: str, max_age_sec: float = 86400,
+                     now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """
+    Check the signature and age of WebApp initData.
+    Returns the "user" object (with "id") or None when the data is not valid.
+    max_age_sec <= 0 skips the age check.
+    """
+    if not init_data or not bot_token:
+        return None
+    fields = dict(parse_qsl(init_data, keep_blank_values=True))
+    received = fields.pop("hash", "")
+    check = "\n".join(f"{k}={v}" for k, v in sorted(fields.items()))
+    secret = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+    expected = hmac.new(secret, check.encode(), hashlib.sha256).hexdigest()
+    if not received or not hmac.compare_digest(expected, received):
+        return None
+    try:
+        auth_date = int(fields.get("auth_date") or 0)
+        user = codec.loads(fields.get("user") or "null")
+    except ValueError:
+        return None
+    if max_age_sec > 0 and (now or time.time()) - auth_date > max_age_sec:
+        return None
+    if not isinstance(user, dict) or "id" not in user:
+        return None
+    return user
+
+
+def require_user(request: Request, uid: str):
+    """
+    Allow the request only for Telegram user `uid` itself or an internal caller.
+    401 without valid credentials, 403 for another user's data.
+    """
+    token = request.headers.get(INTERNAL_TOKEN_HEADER, "")
+    if INTERNAL_API_TOKEN and token and hmac.compare_digest(token, INTERNAL_API_TOKEN):
+        return
+    user = verify_init_data(request.headers.get(INIT_DATA_HEADER, ""), BOT_TOKEN, TG_INIT_DATA_MAX_AGE_SEC)
+    if user is None:
+        raise HTTPException(status_code=401, detail="Telegram authentication required")
+    if str(user["id"]) != str(uid):
+        raise HTTPException(status_code=403, detail="Forbidden")
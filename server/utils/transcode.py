@@ -0,0 +1,272 @@
+## Background transcode jobs for finished recordings
+## /record/finish submits a job and returns; a fixed number of workers run ffmpeg as asyncio
+## subprocesses (under `nice`), so a long re-encode never blocks the event loop.
+## ffmpeg reports through -progress on stdout; the latest block is kept on the job for
+## GET /record/jobs/{job_id}. When a job ends, the on_done handler (set by server/routes/record.py)
+## delivers the result: bot notify and DB logging.
+## Queued jobs are also written to the recording state store and removed once delivered;
+## recover() re-queues what a restart interrupted.
+
+import asyncio
+import os
+import shutil
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from server.config import TRANSCODE_WORKERS, TRANSCODE_NICE, TRANSCODE_QUEUE_MAX, TRANSCODE_KEEP_SEC
+from server.utils.recstate import RecordingStore, store as recording_store
+
+_STDERR_TAIL = 20  ## lines of ffmpeg stderr kept for the error message
+
+
+@dataclass
+class TranscodeJob:
+    id: str
+    cmd: List[str]
+    output_path: str
+    input_path: str = ""  ## a recovered job whose input is gone is dropped
+    duration_sec: float = 0.0  ## expected media duration, for percent; 0 = unknown
+    meta: Dict[str, Any] = field(default_factory=dict)  ## passed through to on_done
+    status: str = "queued"  ## queued | running | done | failed
+    progress: Dict[str, str] = field(default_factory=dict)
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def persisted(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "cmd": self.cmd,
+            "output_path": self.output_path,
+            "input_path": self.input_path,
+            "duration_sec": self.duration_sec,
+            "meta": self.meta,
+            "created_at": self.created_at,
+        }
+
+    def percent(self) -> Optional[float]:
+        if self.status == "done":
+            return 100.0
+        us = self.progress.get("out_time_us") or self.progress.get("out_time_ms")  ## both are microseconds
+        if not self.duration_sec or not us or not us.isdigit():
+            return None
+        ## the duration is wall clock (pauses included), so never claim completion early
+        return round(min(99.0, int(us) / 1e6 / self.duration_sec * 100), 1)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "percent": self.percent(),
+            "progress": {k: self.progress[k] for k in ("frame", "fps", "out_time", "speed") if k in self.progress},
+            "error": self.error,
+            "queued_sec": round((self.started_at or time.time()) - self.created_at, 1),
+            "run_sec": round((self.finished_at or time.time()) - self.started_at, 1) if self.started_at else None,
+        }
+
+
+class TranscodePool:
+    """
+    Bounded pool of ffmpeg workers.
+    - workers: jobs run concurrently (each ffmpeg is itself multi-threaded, keep this small)
+    - nice: niceness of the ffmpeg processes, so signaling keeps the CPU under load
+    - queue_max: queued jobs beyond this are refused (submit returns None)
+    - keep_sec: finished jobs stay visible to the status endpoint this long
+    - store: where queued jobs are persisted until on_done returned (None = memory only)
+    on_done(job) is awaited after every job, successful or not; it must not raise.
+    A job interrupted by a restart runs again from the start after recover().
+    """
+
+    def __init__(self, workers: int = 1, nice: int = 10, queue_max: int = 100, keep_sec: float = 3600,
+                 store: Optional[RecordingStore] = None):
+        self.store = store
+        self.workers = max(1, int(workers))
+        self.nice = int(nice)
+        self.queue_max = max(1, int(queue_max))
+        self.keep_sec = float(keep_sec)
+        self.on_done: Optional[Callable[[TranscodeJob], Awaitable[None]]] = None
+        self.jobs: Dict[str, TranscodeJob] = {}
+        self.done = 0
+        self.failed = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._procs: Dict[str, asyncio.subprocess.Process] = {}
+
+    def start(self):
+        if self._tasks:
+            return
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self):
+        for proc in list(self._procs.values()):
+            try:
+                proc.kill()
+            except ProcessLookupError:
+                pass
+        for t in self._tasks:
+            t.cancel()
+        for t in self._tasks:
+            try:
+                await t
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "running": len(self._procs),
+            "done": self.done,
+            "failed": self.failed,
+        }
+
+    def get(self, job_id: str) -> Optional[TranscodeJob]:
+        self._prune()
+        return self.jobs.get(job_id)
+
+    async def submit(self, cmd: List[str], output_path: str, input_path: str = "", duration_sec: float = 0.0,
+                     meta: Optional[Dict[str, Any]] = None) -> Optional[TranscodeJob]:
+        """
+        Persist and queue an ffmpeg command (without -progress, it is added here). Returns None
+        when the queue is full; the caller then delivers the untranscoded file.
+        """
+        self.start()
+        if self._queue.qsize() >= self.queue_max:
+            return None
+        self._prune()
+        job = TranscodeJob(id=uuid.uuid4().hex[:16], cmd=list(cmd), output_path=output_path, input_path=input_path,
+                           duration_sec=float(duration_sec or 0), meta=dict(meta or {}))
+        if self.store is not None:
+            try:
+                await asyncio.to_thread(self.store.save_job, job.persisted())
+            except OSError as e:
+                print(f"[TRANSCODE] job {job.id} not persisted (lost on restart): {e}")
+        self.jobs[job.id] = job
+        self._queue.put_nowait(job)
+        return job
+
+    async def recover(self) -> int:
+        """
+        Re-queue the persisted jobs of a previous run (queue_max does not apply).
+        Call once at startup, before new jobs are submitted.
+        """
+        if self.store is None:
+            return 0
+        self.start()
+        count = 0
+        for data in await asyncio.to_thread(self.store.load_jobs):
+            try:
+                job = TranscodeJob(**data)
+            except TypeError as e:
+                print(f"[TRANSCODE] bad persisted job {data.get('id')}, dropped: {e}")
+                self.store.remove_job(str(data.get("id")))
+                continue
+            if job.id in self.jobs:
+                continue
+            if job.input_path and not os.path.exists(job.input_path):
+                print(f"[TRANSCODE] input of job {job.id} is gone, dropped: {job.input_path}")
+                self.store.remove_job(job.id)
+                continue
+            self.jobs[job.id] = job
+            self._queue.put_nowait(job)
+            count += 1
+        if count:
+            print(f"[TRANSCODE] recovered {count} pending jobs")
+        return count
+
+    def _prune(self):
+        cutoff = time.time() - self.keep_sec
+        for job_id in [j.id for j in self.jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            del self.jobs[job_id]
+
+    def _argv(self, job: TranscodeJob) -> List[str]:
+        ## ffmpeg <input options...> -i in ... out: -progress is a global option, put it first
+        argv = [job.cmd[0], "-nostats", "-loglevel", "error", "-progress", "pipe:1"] + job.cmd[1:]
+        if self.nice and shutil.which("nice"):
+            argv = ["nice", "-n", str(self.nice)] + argv
+        return argv
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                job.status, job.error = "failed", str(e)
+            finally:
+                job.finished_at = job.finished_at or time.time()
+            if job.status == "done":
+                self.done += 1
+            else:
+                self.failed += 1
+                print(f"[TRANSCODE] job {job.id} failed: {job.error}")
+            if self.on_done is not None:
+                try:
+                    await self.on_done(job)
+                except Exception as e:
+                    print(f"[TRANSCODE] on_done for job {job.id} failed: {e}")
+            if self.store is not None:
+                try:
+                    await asyncio.to_thread(self.store.remove_job, job.id)
+                except OSError as e:
+                    print(f"[TRANSCODE] job file {job.id} not removed: {e}")
+
+    async def _run(self, job: TranscodeJob):
+        job.status, job.started_at = "running", time.time()
+        proc = await asyncio.create_subprocess_exec(
+            *self._argv(job),
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        self._procs[job.id] = proc
+        tail: Deque[str] = deque(maxlen=_STDERR_TAIL)
+        try:
+            await asyncio.gather(self._read_progress(proc.stdout, job), _drain(proc.stderr, tail))
+            rc = await proc.wait()
+        finally:
+            self._procs.pop(job.id, None)
+        job.finished_at = time.time()
+        if rc == 0 and os.path.exists(job.output_path):
+            job.status = "done"
+        else:
+            job.status = "failed"
+            job.error = f"ffmpeg exit {rc}: " + " | ".join(tail)
+
+    @staticmethod
+    async def _read_progress(stream, job: TranscodeJob):
+        ## key=value lines; a block ends with progress=continue|end
+        block: Dict[str, str] = {}
+        async for raw in stream:
+            key, sep, value = raw.decode("utf-8", "replace").strip().partition("=")
+            if not sep:
+                continue
+            block[key] = value.strip()
+            if key == "progress":
+                job.progress = block
+                block = {}
+
+
+async def _drain(stream, tail: Deque[str]):
+    async for raw in stream:
+        line = raw.decode("utf-8", "replace").strip()
+        if line:
+            tail.append(line)
+
+
+transcoder = TranscodePool(
+    workers=TRANSCODE_WORKERS,
+    nice=TRANSCODE_NICE,
+    queue_max=TRANSCODE_QUEUE_MAX,
+    keep_sec=TRANSCODE_KEEP_SEC,
+    store=recording_store,
+)
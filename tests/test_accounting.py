@@ -0,0 +1,134 @@
+import asyncio
+from types import SimpleNamespace
+
+from pymysql.err import OperationalError
+
+from server.db import accounting as acct
+
+
+def _room(call_id=7):
+    return SimpleNamespace(call_id=call_id)
+
+
+def test_backoff_of_one_room_does_not_stall_others(monkeypatch):
+    applied = []
+
+    async def add_event(call_id, user_id, event_type, payload):
+        if event_type == "record_start" and "slow" not in applied:
+            applied.append("slow")
+            raise OperationalError(1213, "Deadlock found")
+        applied.append(event_type)
+
+    monkeypatch.setattr(acct.callsdb, "add_event", add_event)
+
+    async def main():
+        accounting = acct.CallAccounting(retries=1)
+        accounting.submit(acct.RecordMark(_room(), "a", "record_start", "1"))
+        accounting.submit(acct.RecordMark(_room(), "a", "record_stop", "2"))
+        accounting.submit(acct.RecordMark(_room(), "b", "record_pause", "3"))
+        await asyncio.sleep(0.05)  ## room a is backing off (0.2 s)
+        assert applied == ["slow", "record_pause"]
+        await accounting.close()
+        assert applied == ["slow", "record_pause", "record_start", "record_stop"]
+        assert accounting.applied == 3 and accounting.retried == 1
+
+    asyncio.run(main())
+
+
+def test_ambiguous_error_is_not_retried(monkeypatch):
+    joins = []
+
+    async def participant_join(call_id, uid, name, avatar):
+        joins.append(uid)
+        raise OperationalError(2013, "Lost connection to MySQL server during query")
+
+    monkeypatch.setattr(acct.callsdb, "participant_join", participant_join)
+
+    async def main():
+        accounting = acct.CallAccounting(retries=3)
+        accounting.submit(acct.PeerJoin(_room(), "a", "1", "2", "", ""))
+        await accounting.close()
+        assert joins == ["2"] and accounting.failed == 1
+
+    asyncio.run(main())
+
+
+def test_retry_does_not_repeat_applied_join(monkeypatch):
+    joins = []
+    marks = []
+
+    async def participant_join(call_id, uid, name, avatar):
+        joins.append(uid)
+
+    async def mark_call_active(call_id):
+        marks.append(call_id)
+        if len(marks) == 1:
+            raise OperationalError(2003, "Can't connect to MySQL server")
+
+    monkeypatch.setattr(acct.callsdb, "participant_join", participant_join)
+    monkeypatch.setattr(acct.callsdb, "mark_call_active", mark_call_active)
+
+    async def main():
+        accounting = acct.CallAccounting(retries=1)
+        accounting.submit(acct.PeerJoin(_room(), "a", "1", "2", "", ""))
+        await accounting.close()
+        assert joins == ["2"] and marks == [7, 7]
+
+    asyncio.run(main())
+
+
+def test_submit_after_close_is_rejected():
+    async def main():
+        accounting = acct.CallAccounting()
+        await accounting.close()
+        assert not accounting.submit(acct.PeerLeave(_room(), "a", "2"))
+        assert accounting.rejected == 1 and accounting.pending() == 0
+
+    asyncio.run(main())
+
+
+def test_queued_events_of_a_room_go_out_in_one_transaction(monkeypatch):
+    batches = []
+
+    async def write_call_ops(ops):
+        batches.append([name for name, _ in ops])
+
+    monkeypatch.setattr(acct.callsdb, "write_call_ops", write_call_ops)
+
+    async def main():
+        accounting = acct.CallAccounting()
+        room = _room()
+        accounting.submit(acct.PeerJoin(room, "a", "1", "2", "", ""))
+        accounting.submit(acct.PeerLeave(room, "a", "2"))
+        accounting.submit(acct.CallEnd(room, "a", "no_peers_left"))
+        await accounting.close()
+        assert batches == [["participant_join", "mark_call_active", "participant_leave", "finalize_call"]]
+        assert accounting.applied == 3 and accounting.batches == 1
+
+    asyncio.run(main())
+
+
+def test_rejected_batch_is_applied_one_by_one(monkeypatch):
+    leaves = []
+
+    async def write_call_ops(ops):
+        raise OperationalError(1048, "Column 'call_id' cannot be null")
+
+    async def participant_leave(call_id, uid, hint):
+        if uid == "bad":
+            raise OperationalError(1048, "Column 'call_id' cannot be null")
+        leaves.append(uid)
+
+    monkeypatch.setattr(acct.callsdb, "write_call_ops", write_call_ops)
+    monkeypatch.setattr(acct.callsdb, "participant_leave", participant_leave)
+
+    async def main():
+        accounting = acct.CallAccounting()
+        room = _room()
+        for uid in ("2", "bad", "3"):
+            accounting.submit(acct.PeerLeave(room, "a", uid))
+        await accounting.close()
+        assert leaves == ["2", "3"]
+        assert accounting.applied == 2 and accounting.failed == 1
+
+    asyncio.run(main())
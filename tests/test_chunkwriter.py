@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from server.utils.chunkwriter import ChunkWriter
+
+
+class _FailingFile:
+    """
+    Binary file stand-in whose first write fails (e.g. ENOSPC).
+    """
+
+    closed = False
+
+    def __init__(self):
+        self.data = b""
+        self.calls = 0
+
+    def write(self, data):
+        self.calls += 1
+        if self.calls == 1:
+            raise OSError(28, "No space left on device")
+        self.data += data
+
+    def flush(self):
+        pass
+
+    def fileno(self):
+        raise OSError("no fd")
+
+    def close(self):
+        self.closed = True
+
+
+def test_failed_write_fails_every_later_write_and_close():
+    async def main():
+        writer = ChunkWriter(max_delay_ms=0, fsync="none")
+        fh = _FailingFile()
+        await writer.write("r", fh, b"first")
+        await asyncio.sleep(0.05)  ## background write fails
+        with pytest.raises(OSError):
+            await writer.write("r", fh, b"second")
+        with pytest.raises(OSError):
+            await writer.write("r", fh, b"third")
+        with pytest.raises(OSError):
+            await writer.close("r", fh)
+        assert fh.data == b"" and fh.closed
+
+    asyncio.run(main())
@@ -0,0 +1,28 @@
+import asyncio
+
+from pymysql.err import OperationalError
+
+from server.db.eventsink import EventSink
+
+
+def test_only_unapplied_batches_are_retried():
+    attempts = []
+
+    async def write(rows):
+        attempts.append([r[2] for r in rows])
+        if len(attempts) == 1:
+            raise OperationalError(2006, "MySQL server has gone away")
+        if len(attempts) == 2:
+            raise OperationalError(2013, "Lost connection to MySQL server during query")
+
+    async def main():
+        sink = EventSink(flush_ms=0, retries=3)
+        sink._write = write
+        sink.add(7, None, "a", None)
+        await asyncio.sleep(0.5)  ## first attempt, backoff (0.4 s), second attempt
+        sink.add(7, None, "b", None)
+        await sink.close()
+        assert attempts == [["a"], ["a"], ["b"]]
+        assert sink.failed == 1
+
+    asyncio.run(main())
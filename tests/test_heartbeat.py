@@ -0,0 +1,21 @@
+from types import SimpleNamespace
+
+from server.utils.heartbeat import Heartbeat
+from server.utils.rooms import Peer
+
+
+class _Rooms:
+    def __init__(self, peers):
+        self.room = SimpleNamespace(local_snapshot=tuple(peers))
+
+    def iter_rooms(self):
+        yield "r1", self.room
+
+
+def test_only_peers_that_answered_pings_are_reaped():
+    legacy = Peer(id="a", ws=None, joined_at=0.0, last_seen=0.0)
+    modern = Peer(id="b", ws=None, joined_at=0.0, last_seen=0.0, heartbeat=True)
+    hb = Heartbeat(_Rooms([legacy, modern]), interval=20, timeout=60)
+    hb.tick(now=100.0)
+    assert not legacy.reaped
+    assert modern.reaped and hb.reaped == 1
@@ -0,0 +1,22 @@
+import asyncio
+
+from server.utils.recstate import SessionSweeper
+
+
+def test_sweeper_skips_sessions_with_a_chunk_being_written():
+    active = {"a": {"last_activity": 0, "writing": 1}, "b": {"last_activity": 0}}
+    finalized = []
+
+    async def finalize(recording_id, session):
+        finalized.append(recording_id)
+        if recording_id == "b":
+            active["c"]["writing"] = 1  ## a chunk for c arrives while b is finalized
+
+    active["c"] = {"last_activity": 0}
+    sweeper = SessionSweeper(active, finalize, idle_sec=60)
+    asyncio.run(sweeper.run_once())
+    assert finalized == ["b"] and set(active) == {"a", "c"}
+
+    active["a"]["writing"] = active["c"]["writing"] = 0
+    asyncio.run(sweeper.run_once())
+    assert finalized == ["b", "a", "c"] and not active and sweeper.expired == 3
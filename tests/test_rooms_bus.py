@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+from server.utils.roombus import LocalBus, LocalHub
+from server.utils.rooms import RoomManager
+
+
+async def _settle():
+    ## LocalBus delivers with call_soon; replies ("here") need another round
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def _pair():
+    hub = LocalHub()
+    return RoomManager(shards=4, bus=LocalBus(hub, "node-a")), RoomManager(shards=4, bus=LocalBus(hub, "node-b"))
+
+
+def test_join_owner_and_leave_are_mirrored_across_managers():
+    async def main():
+        a, b = _pair()
+        pa = await a.join("r", None)
+        pb = await b.join("r", None)
+        await _settle()
+        room_a, room_b = await a.get_room("r"), await b.get_room("r")
+        assert set(room_a.peers) == set(room_b.peers) == {pa.id, pb.id}
+        assert room_a.peers[pb.id].node == "node-b"
+
+        room_a.set_uid(pa, "owner")
+        room_a.set_owner("owner")
+        a.publish_owner("r", "owner")
+        room_b.set_uid(pb, "guest")
+        b.publish_info("r", pb)
+        await _settle()
+        assert room_b.owner_uid == "owner"
+        assert room_a.other_non_owner_count(pa) == 1
+
+        await b.leave("r", pb.id)
+        await _settle()
+        assert set(room_a.peers) == {pa.id}
+        assert room_a.non_owner_count == 0
+        await a.close()
+        await b.close()
+
+    asyncio.run(main())
+
+
+def test_mirrors_of_a_silent_node_are_evicted():
+    async def main():
+        a, b = _pair()
+        a.node_ttl = b.node_ttl = 30
+        left = []
+        a.on_remote = lambda event, room_id, room, peer, extra: left.append(peer.id) if event == "left" else None
+        pa = await a.join("r", None)
+        pb = await b.join("r", None)
+        await _settle()
+        room_a = await a.get_room("r")
+
+        a.check_nodes()  ## node-b was heard from just now
+        b.check_nodes()
+        await _settle()
+        assert pb.id in room_a.peers
+
+        await b.bus.close()  ## node-b crashes: no leave, no more envelopes
+        a.check_nodes(now=time.monotonic() + 31)
+        assert set(room_a.peers) == {pa.id}
+        assert left == [pb.id] and a.evicted == 1
+        await a.close()
+
+    asyncio.run(main())
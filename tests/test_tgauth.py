@@ -0,0 +1,50 @@
+import hashlib
+import hmac
+import json
+from urllib.parse import urlencode
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from server.utils import tgauth
+
+TOKEN = "123456:TEST"
+
+
+def _init_data(user_id, auth_date=1_700_000_000, token=TOKEN):
+    fields = {"auth_date": str(auth_date), "query_id": "q1", "user": json.dumps({"id": user_id, "first_name": "A"})}
+    check = "\n".join(f"{k}={v}" for k, v in sorted(fields.items()))
+    secret = hmac.new(b"WebAppData", token.encode(), hashlib.sha256).digest()
+    fields["hash"] = hmac.new(secret, check.encode(), hashlib.sha256).hexdigest()
+    return urlencode(fields)
+
+
+def _request(headers):
+    return Request({"type": "http", "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()]})
+
+
+def test_valid_init_data_returns_user():
+    user = tgauth.verify_init_data(_init_data(42), TOKEN, max_age_sec=60, now=1_700_000_030)
+    assert user["id"] == 42
+
+
+def test_tampered_expired_or_foreign_init_data_is_rejected():
+    data = _init_data(42)
+    assert tgauth.verify_init_data(data.replace("42", "43"), TOKEN, 0) is None
+    assert tgauth.verify_init_data(data, "654321:OTHER", 0) is None
+    assert tgauth.verify_init_data(data, TOKEN, max_age_sec=60, now=1_700_000_061) is None
+
+
+def test_require_user(monkeypatch):
+    monkeypatch.setattr(tgauth, "BOT_TOKEN", TOKEN)
+    monkeypatch.setattr(tgauth, "TG_INIT_DATA_MAX_AGE_SEC", 0)
+    monkeypatch.setattr(tgauth, "INTERNAL_API_TOKEN", "s3cret")
+    tgauth.require_user(_request({tgauth.INIT_DATA_HEADER: _init_data(42)}), "42")
+    tgauth.require_user(_request({tgauth.INTERNAL_TOKEN_HEADER: "s3cret"}), "42")
+    with pytest.raises(HTTPException) as e:
+        tgauth.require_user(_request({tgauth.INIT_DATA_HEADER: _init_data(42)}), "43")
+    assert e.value.status_code == 403
+    with pytest.raises(HTTPException) as e:
+        tgauth.require_user(_request({tgauth.INTERNAL_TOKEN_HEADER: "wrong"}), "42")
+    assert e.value.status_code == 401
@@ -0,0 +1,52 @@
+from bot.utils.userindex import UserIndex
+
+
+def test_exact_username_beats_newer_prefix_matches():
+    ## an old exact match must not fall outside the max_scan window of a large posting
+    index = UserIndex(max_scan=10000)
+    index.put(1, "alex", "Alex", "")
+    for i in range(30000):
+        index.put(20000 + i, f"alex{i}", "A", "")
+    assert index.search("alex", limit=20)[0] == 1
+
+
+def test_old_prefix_match_ranks_before_new_substring_matches():
+    index = UserIndex(max_scan=100)
+    index.put(1, "petrov_1", "Ivan", "")
+    for i in range(5000):
+        index.put(10 + i, f"u{i}", "Olga", "Kopetrova")
+    assert index.search("petr", limit=5)[0] == 1
+    assert len(index.search("petr", limit=5)) == 5
+
+
+def test_renamed_username_is_not_found_by_old_name():
+    index = UserIndex()
+    index.put(1, "zed", "Anna", "")
+    index.put(1, "zoe", "Anna", "")
+    assert index.search("zed") == []
+    assert index.search("zoe") == [1]
+
+
+def test_partial_tg_user_id_matches():
+    index = UserIndex()
+    index.put(123456789, "anna", "Anna", "")
+    index.put(987654321, "bob", "Bob", "")
+    assert index.search("1234") == [123456789]
+    assert index.search("5678") == [123456789]
+    assert index.search("98") == [987654321]
+
+
+def test_updates_after_sort_keep_prefix_lookup_sorted():
+    import asyncio
+
+    index = UserIndex()
+    for i in range(1000):
+        index.put(i, f"user{i}", "Name", f"Last{i}")
+    asyncio.run(index.sort())
+    index.put(5, "zorro", "Diego", "Vega")
+    index.put(5000, "aaron", "Aaron", "")
+    assert index.search("zor") == [5]
+    assert index.search("user5", limit=200).count(5) == 0
+    assert index.search("vega") == [5]
+    assert index.search("aar") == [5000]
+    assert index.search("last99") == [99] + list(range(990, 1000))